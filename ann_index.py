@@ -0,0 +1,213 @@
+# -*- coding: utf-8 -*-
+# @Time    : 2024/5/27 16:20
+# @Author  : KuangRen777
+# @File    : ann_index.py
+# @Tags    : 近似最近邻
+"""
+随机投影 LSH 近似最近邻索引（余弦相似度），只依赖 NumPy/SciPy。
+
+每张哈希表取 n_bits 个随机超平面，向量落在超平面哪一侧记一位，拼成桶编号；共 n_tables 张表。
+查询时取各表中同一个桶以及只差一位的桶（multi-probe）里的向量作为候选，再用原始向量精确计算相似度排序。
+内存为 向量本身 + n×n_tables 个桶编号，与商品数线性相关；查询只扫描候选集合，不需要 N×N 的相似度矩阵。
+位数越少桶越大，召回率越高、候选集合也越大。默认 16 表×6 位是针对 TF-IDF（相似商品的余弦相似度
+通常只有 0.2~0.3）调的，在 6000 个文档的测试语料上（tests/test_ann_index.py 的 sparse_corpus）：
+
+    8 表×12 位   recall@10 0.09，候选占全部数据 3%
+    16 表×8 位   recall@10 0.70，候选 45%
+    16 表×6 位   recall@10 0.96，候选 85%
+
+相似度这么低时 LSH 很难同时做到高召回和亚线性的查询，默认参数优先保证召回率；
+主要收益是不需要 N×N 的相似度矩阵、单个商品更新时不必与全部商品比较矩阵块。
+
+向量可以是稠密的 ndarray 或 scipy.sparse 行矩阵，需事先做 L2 归一化（TF-IDF 默认已归一化），点积即余弦相似度。
+"""
+from collections import defaultdict
+
+import numpy as np
+from scipy import sparse
+
+
+class LSHIndex:
+    def __init__(self, dim, n_tables=16, n_bits=6, multi_probe=True, seed=0):
+        self.dim = dim
+        self.n_tables = n_tables
+        self.n_bits = n_bits
+        self.multi_probe = multi_probe
+        rng = np.random.default_rng(seed)
+        self._planes = rng.standard_normal((dim, n_tables * n_bits)).astype(np.float32)
+        self._powers = (1 << np.arange(n_bits, dtype=np.int64))
+        self._vectors = None
+        self._ids = np.empty(0, dtype=np.int64)
+        self._codes = np.empty((0, n_tables), dtype=np.int64)
+        self._alive = np.empty(0, dtype=bool)
+        self._rows = {}  # ID -> 行号（同一 ID 重复添加时只保留最新的一行）
+        self._buckets = [defaultdict(list) for _ in range(n_tables)]
+
+    def __len__(self):
+        return len(self._rows)
+
+    def _hash(self, vectors):
+        projected = np.asarray(vectors @ self._planes)
+        bits = (projected > 0).reshape(projected.shape[0], self.n_tables, self.n_bits)
+        return bits.astype(np.int64) @ self._powers
+
+    def _stack(self, vectors):
+        if self._vectors is None:
+            return vectors
+        if sparse.issparse(vectors):
+            return sparse.vstack([self._vectors, vectors], format='csr')
+        return np.vstack([self._vectors, vectors])
+
+    def _index_rows(self, start, codes):
+        for offset, row_codes in enumerate(codes):
+            for table, code in enumerate(row_codes):
+                self._buckets[table][int(code)].append(start + offset)
+
+    def build(self, vectors, ids):
+        """
+        vectors 为 n×dim 矩阵，ids 为对应的 n 个 ID。
+        """
+        vectors = sparse.csr_matrix(vectors, dtype=np.float32) if sparse.issparse(vectors) else \
+            np.asarray(vectors, dtype=np.float32)
+        self._ids = np.asarray(ids, dtype=np.int64)
+        self._codes = self._hash(vectors)
+        self._alive = np.ones(len(self._ids), dtype=bool)
+        self._rows = {int(item_id): row for row, item_id in enumerate(self._ids)}
+        self._buckets = [defaultdict(list) for _ in range(self.n_tables)]
+        self._vectors = vectors
+        self._index_rows(0, self._codes)
+
+    def add(self, item_id, vector):
+        # 新增或替换一个向量；被替换的旧行只标记删除，查询时跳过
+        vector = self._as_row(vector)
+        self.remove(item_id)
+        row = len(self._ids)
+        codes = self._hash(vector)
+        self._vectors = self._stack(vector)
+        self._ids = np.append(self._ids, item_id)
+        self._codes = np.vstack([self._codes, codes])
+        self._alive = np.append(self._alive, True)
+        self._rows[int(item_id)] = row
+        self._index_rows(row, codes)
+
+    def remove(self, item_id):
+        row = self._rows.pop(int(item_id), None)
+        if row is not None:
+            self._alive[row] = False
+
+    def vector(self, item_id):
+        row = self._rows.get(int(item_id))
+        return None if row is None else self._vectors[row:row + 1]
+
+    def _candidates(self, codes):
+        candidates = set()
+        for table, code in enumerate(codes):
+            code = int(code)
+            buckets = self._buckets[table]
+            candidates.update(buckets.get(code, ()))
+            if self.multi_probe:
+                for bit in range(self.n_bits):
+                    candidates.update(buckets.get(code ^ (1 << bit), ()))
+        return candidates
+
+    @staticmethod
+    def _as_row(vector):
+        return sparse.csr_matrix(vector, dtype=np.float32) if sparse.issparse(vector) else \
+            np.asarray(vector, dtype=np.float32).reshape(1, -1)
+
+    def query(self, vector, k=10, exclude=()):
+        """
+        返回与 vector 最相似的至多 k 个 [(ID, 相似度), ...]，按相似度从高到低；k 为 None 时返回全部候选。
+        只返回相似度大于 0 的结果。
+        """
+        if self._vectors is None:
+            return []
+        vector = self._as_row(vector)
+        exclude = {int(item_id) for item_id in exclude}
+        rows = [row for row in self._candidates(self._hash(vector)[0])
+                if self._alive[row] and int(self._ids[row]) not in exclude]
+        if not rows:
+            return []
+        return self._rank(np.fromiter(rows, dtype=np.int64, count=len(rows)), vector, k)
+
+    def query_exact(self, vector, k=10, exclude=()):
+        # 与全部向量精确比较（不使用哈希桶），用于数据量较小时或评估召回率
+        if self._vectors is None:
+            return []
+        exclude = np.fromiter((int(item_id) for item_id in exclude), dtype=np.int64)
+        rows = np.nonzero(self._alive & ~np.isin(self._ids, exclude))[0]
+        if len(rows) == 0:
+            return []
+        return self._rank(rows, self._as_row(vector), k)
+
+    def _rank(self, rows, vector, k):
+        candidates = self._vectors[rows]
+        similarity = candidates @ vector.T
+        similarity = np.asarray(similarity.toarray() if sparse.issparse(similarity) else similarity).ravel()
+
+        keep = similarity > 0
+        rows, similarity = rows[keep], similarity[keep]
+        if k is not None and len(rows) > k:
+            top = np.argpartition(-similarity, k - 1)[:k]
+            rows, similarity = rows[top], similarity[top]
+        order = np.argsort(-similarity, kind='stable')
+        return [(int(self._ids[row]), float(s)) for row, s in zip(rows[order], similarity[order])]
+
+    def compact(self):
+        # 丢弃已删除的行并重建桶
+        if self._vectors is not None and not self._alive.all():
+            alive = np.nonzero(self._alive)[0]
+            self.build(self._vectors[alive], self._ids[alive])
+
+    def save(self, file):
+        # 只保存未删除的行
+        alive = np.nonzero(self._alive)[0]
+        arrays = {
+            "params": np.array([self.dim, self.n_tables, self.n_bits, int(self.multi_probe)], dtype=np.int64),
+            "planes": self._planes,
+            "ids": self._ids[alive],
+            "codes": self._codes[alive],
+        }
+        if sparse.issparse(self._vectors):
+            vectors = self._vectors[alive].tocsr()
+            arrays.update(vectors_data=vectors.data, vectors_indices=vectors.indices, vectors_indptr=vectors.indptr,
+                          vectors_shape=np.array(vectors.shape, dtype=np.int64))
+        elif self._vectors is not None:
+            arrays["vectors"] = self._vectors[alive]
+        np.savez(file, **arrays)
+
+    @classmethod
+    def load(cls, file):
+        with np.load(file) as data:
+            dim, n_tables, n_bits, multi_probe = (int(x) for x in data["params"])
+            index = cls(dim, n_tables=n_tables, n_bits=n_bits, multi_probe=bool(multi_probe))
+            index._planes = data["planes"]
+            if "vectors_data" in data:
+                vectors = sparse.csr_matrix(
+                    (data["vectors_data"], data["vectors_indices"], data["vectors_indptr"]),
+                    shape=tuple(data["vectors_shape"]),
+                )
+            elif "vectors" in data:
+                vectors = data["vectors"]
+            else:
+                return index
+            ids, codes = data["ids"], data["codes"]
+
+        # 桶由保存的编号直接恢复，不需要重新投影
+        index._vectors = vectors
+        index._ids = ids
+        index._codes = codes
+        index._alive = np.ones(len(ids), dtype=bool)
+        index._rows = {int(item_id): row for row, item_id in enumerate(ids)}
+        index._index_rows(0, codes)
+        return index
+
+    def stats(self):
+        sizes = [len(rows) for buckets in self._buckets for rows in buckets.values()]
+        return {
+            "items": len(self._rows),
+            "rows": len(self._ids),
+            "tables": self.n_tables,
+            "bits": self.n_bits,
+            "max_bucket": max(sizes) if sizes else 0,
+        }
@@ -136,6 +136,7 @@ async def toggle_category_status(
     # Toggle the status
     category.status = 1 if category.status == 0 else 0
     await category.save()
+    await category_tree.bump()
 
     # No content to return, only status code 204
     return
@@ -177,6 +178,7 @@ async def create_category(
         group=category_data.group
     )
     await new_category.save()
+    await category_tree.bump()
 
     return {"message": "Category created successfully", "id": new_category.id}
 
@@ -216,6 +218,7 @@ async def update_category(
     category.name = category_data.name
     category.pid = category_data.pid if category_data.pid is not None else 0  # Ensure top-level if pid is None
     await category.save()
+    await category_tree.bump()
 
     # No content to return, only status code 204
     return
@@ -247,6 +250,7 @@ async def update_category_sequence(
     # Update the sequence number
     category.seq = seq_data.seq
     await category.save()
+    await category_tree.bump()
 
     # No content to return, only status code 204
     return
@@ -12,6 +12,7 @@ from tortoise.contrib.fastapi import HTTPNotFoundError
 from tortoise.contrib.pydantic import pydantic_model_creator
 from tortoise.transactions import in_transaction
 from tortoise.query_utils import Prefetch
+from goods_counters import delete_goods_comment
 
 from utils import *
 
@@ -279,8 +280,9 @@ async def delete_comment(
     if not comment:
         raise HTTPException(status_code=404, detail="Comment not found")
 
-    # Delete the comment
-    await comment.delete()
+    # Delete the comment（同时更新商品的评论数和平均星级）
+    await delete_goods_comment(comment)
+    await recommend_store.bump_data_version(comment.user_id)
 
     # No content to return, only status code 204
     return {}
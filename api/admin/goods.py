@@ -12,6 +12,7 @@ from tortoise.contrib.fastapi import HTTPNotFoundError
 from tortoise.contrib.pydantic import pydantic_model_creator
 from tortoise.transactions import in_transaction
 from tortoise.query_utils import Prefetch
+from listing import AdminGoodsRecord
 
 from utils import *
 
@@ -90,41 +91,14 @@ async def get_goods_list(
     if is_recommend is not None:
         query = query.filter(is_recommend=is_recommend)
 
-    # Including additional related data if specified
-    if include:
-        if "category" in include.split(','):
-            query = query.prefetch_related("category")
-        if "user" in include.split(','):
-            query = query.prefetch_related("user")
-        if "comments" in include.split(','):
-            query = query.prefetch_related("reviews")
+    # include 中的 category、user、comments 不在 GoodsBase 中返回，不再预加载
 
     total_count = await query.count()
     total_pages = (total_count + 10 - 1) // 10  # Assuming per_page is 10
-    results = await query.offset((current - 1) * 10).limit(10)
+    results = await AdminGoodsRecord.fetch(query.offset((current - 1) * 10).limit(10))
 
     # Serialize results manually
-    goods_data = []
-    for goods in results:
-        goods_data.append(GoodsBase(
-            id=goods.id,
-            user_id=goods.user_id,
-            category_id=goods.category_id,
-            title=goods.title,
-            description=goods.description,
-            price=goods.price,
-            stock=goods.stock,
-            sales=goods.sales,
-            cover=goods.cover,
-            cover_url=f'http://127.0.0.1:8888/upimg/{goods.cover}',
-            pics=goods.pics,
-            pics_url=[f'http://127.0.0.1:8888/upimg/{pic}' for pic in goods.pics],
-            is_on=goods.is_on,
-            is_recommend=goods.is_recommend,
-            details=goods.details,
-            created_at=goods.created_at.strftime('%Y-%m-%d %H:%M:%S'),
-            updated_at=goods.updated_at.strftime('%Y-%m-%d %H:%M:%S'),
-        ))
+    goods_data = [GoodsBase(**goods.dict()) for goods in results]
 
     return GoodsResponse(
         data=goods_data,
@@ -194,6 +168,8 @@ async def create_goods(
         pics=goods_data.pics if goods_data.pics else [],
         details=goods_data.details if goods_data.details else '暂无'
     )
+    await goods_search.index_goods(new_goods.id, new_goods.title, new_goods.description)
+    await goods_similarity.update_goods(new_goods.id)
 
     return {"message": "Goods created successfully", "id": new_goods.id}
 
@@ -336,7 +312,11 @@ async def update_goods(
         good.cover = goods_data.cover[28:]
     good.pics = goods_data.pics
     good.details = goods_data.details
-    await good.save()
+    # 只写本接口修改的字段，不覆盖 comments_count/star_avg 等计数
+    await good.save(update_fields=['category_id', 'title', 'description', 'price', 'stock', 'cover', 'pics',
+                                   'details', 'updated_at'])
+    await goods_search.index_goods(good.id, good.title, good.description)
+    await goods_similarity.update_goods(good.id)
 
     # No content to return, only status code 204
     return {}
@@ -367,7 +347,7 @@ async def toggle_goods_on_off(
 
     # Toggle the is_on status
     good.is_on = 0 if good.is_on else 1
-    await good.save()
+    await good.save(update_fields=['is_on', 'updated_at'])
 
     # No content to return, only status code 204
     return {}
@@ -398,7 +378,7 @@ async def toggle_goods_recommendation(
 
     # Toggle the is_recommend status
     good.is_recommend = 0 if good.is_recommend else 1
-    await good.save()
+    await good.save(update_fields=['is_recommend', 'updated_at'])
 
     # No content to return, only status code 204
     return {}
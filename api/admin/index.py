@@ -9,6 +9,10 @@ from models import Users, Goods, Orders
 from tortoise.functions import Count, Sum
 from datetime import datetime, timedelta
 
+from utils import password_hasher, token_blacklist, category_tree, copurchase_engine, goods_similarity, \
+    global_weights, popularity, graph_engine
+from recommend_test_by_strategy import strategy_stats, result_cache_stats
+
 admin_index = APIRouter()
 
 
@@ -81,6 +85,22 @@ async def index_stats():
         raise HTTPException(status_code=500, detail=str(e))
 
 
+@admin_index.get("/metrics", tags=["运行指标"])
+async def runtime_metrics():
+    return {
+        "password_hasher": password_hasher.stats(),
+        "token_blacklist": token_blacklist.stats(),
+        "category_tree": category_tree.stats(),
+        "recommend_strategies": strategy_stats(),
+        "recommend_result_cache": result_cache_stats(),
+        "copurchase": copurchase_engine.stats(),
+        "goods_similarity": goods_similarity.stats(),
+        "global_weights": global_weights.stats(),
+        "popularity": popularity.stats(),
+        "recommend_graph": graph_engine.stats(),
+    }
+
+
 async def get_total_price(query):
     result = await query.annotate(total=Sum('amount')).values_list('total', flat=True)
     return result[0] if result else 0
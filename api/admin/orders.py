@@ -12,6 +12,7 @@ from tortoise.contrib.fastapi import HTTPNotFoundError
 from tortoise.contrib.pydantic import pydantic_model_creator
 from tortoise.transactions import in_transaction
 from tortoise.query_utils import Prefetch
+from listing import AdminOrderRecord, AdminOrderDetailRecord
 
 from utils import *
 
@@ -110,50 +111,34 @@ async def get_orders_list(
     if status is not None:
         query = query.filter(status=status)
 
-    # 包含额外数据的预加载
-    prefetch_relations = []
-    if "user" in include.split(','):
-        prefetch_relations.append("user")
-
-    if prefetch_relations:
-        query = query.prefetch_related(*prefetch_relations)
-
+    includes = include.split(',') if include else []
     query = query.order_by("-updated_at")
 
     # 分页设置
     per_page = 10
     total_count = await query.count()
     total_pages = (total_count + per_page - 1) // per_page
-    orders = await query.offset((current - 1) * per_page).limit(per_page)
+    # 订单只取列表需要的列，用户名和邮箱随订单 JOIN 取回
+    orders = await AdminOrderRecord.fetch(query.offset((current - 1) * per_page).limit(per_page))
+
+    # 一页订单的详情（含商品字段）一次查询取回，再按订单分组
+    details_by_order = {}
+    if "orderDetails" in includes and orders:
+        details = await AdminOrderDetailRecord.fetch(
+            OrderDetails.filter(order_id__in=[order.id for order in orders]).order_by('id'))
+        for detail in details:
+            details_by_order.setdefault(detail.order_id, []).append(detail)
 
     orders_data = []
     for order in orders:
-        order_address = await order.address.first()
-        order_details = []
-        if "orderDetails" in include.split(','):
-            # 获取订单详情信息，包括相关的商品信息（如果需要）
-            order_details = await OrderDetails.filter(order_id=order.id).prefetch_related('goods')
+        order_details = details_by_order.get(order.id, [])
 
         # 构建订单基本信息
         order_data = OrderBase(
-            id=order.id,
-            order_no=order.order_no,
-            user_id=order.user.id if order.user else None,
-            amount=order.amount,
-            status=order.status,
-            address_id=order_address.id if order.address else None,
-            express_type=order.express_type,
-            express_no=order.express_no,
-            pay_time=order.pay_time.strftime('%Y-%m-%d %H:%M:%S') if order.pay_time else None,
-            pay_type=order.pay_type,
-            trade_no=order.trade_no,
-            created_at=order.created_at.strftime('%Y-%m-%d %H:%M:%S'),
-            updated_at=order.updated_at.strftime('%Y-%m-%d %H:%M:%S'),
-            user=UserBase(**order.user.__dict__) if "user" in include.split(',') and order.user else None,
-            goods=[GoodsBase(**detail.goods.__dict__) for detail in order_details] if "orderDetails" in include.split(
-                ',') else [],
-            orderDetails=[OrderDetailsBase(**detail.__dict__) for detail in
-                          order_details] if "orderDetails" in include.split(',') else []
+            **order.dict(),
+            user=UserBase(**order.user_dict()) if "user" in includes else None,
+            goods=[GoodsBase(**detail.goods_dict()) for detail in order_details],
+            orderDetails=[OrderDetailsBase(**detail.dict()) for detail in order_details]
         )
         orders_data.append(order_data)
 
@@ -228,6 +228,7 @@ async def toggle_user_lock(user_id: int = Path(..., title="The ID of the user to
     # Toggle the is_locked status
     user.is_locked = 1 if user.is_locked == 0 else 0
     await user.save()
+    user_cache.invalidate_user(user.id)
 
     return {}
 
@@ -288,7 +289,7 @@ async def create_user(
         raise HTTPException(status_code=422, detail="Email is already in use")
 
     # 创建新用户
-    hashed_password = pwd_context.hash(user_data.password)  # 假设hash_password是有效的密码哈希函数
+    hashed_password = await password_hasher.hash(user_data.password)  # 假设hash_password是有效的密码哈希函数
     new_user = await Users.create(
         name=user_data.name,
         email=user_data.email,
@@ -327,5 +328,6 @@ async def update_user(
     user.name = user_data.name
     user.email = user_data.email
     await user.save()
+    user_cache.invalidate_user(user.id)
 
     return {"message": "User updated successfully", "user_id": user.id}
@@ -21,7 +21,8 @@ from PASSWORD import *
 
 from fastapi import APIRouter, Depends, HTTPException, status, Response
 from fastapi.security import OAuth2PasswordBearer
-from email_sender import send_verification_email
+from email_sender import verification_email_payload
+from settings import EMAIL_OUTBOX_KEY
 
 
 # 定义数据模型
@@ -74,7 +75,7 @@ async def register_user(user: UserRegistrationModel):
                                                       "errors": {"email": ["电子邮件已被注册"]}, "status_code": 422})
 
     # 密码加密处理
-    hashed_password = pwd_context.hash(user.password)
+    hashed_password = await password_hasher.hash(user.password)
 
     # 创建新用户
     user_obj = await Users.create(
@@ -99,7 +100,7 @@ async def login(user_credentials: LoginModel):
         return HTTPException(status_code=404, detail="邮箱未注册")
 
     # 验证密码
-    if not pwd_context.verify(user_credentials.password, user.password):
+    if not await password_hasher.verify(user_credentials.password, user.password):
         return HTTPException(status_code=401, detail="密码错误")
 
     # 更新用户的 update_at 字段为当前日期
@@ -133,7 +134,7 @@ async def login_option():
 async def logout(request: Request, token: str = Depends(oauth2_scheme)):
     print(f"Authorization header: {request.headers.get('Authorization')}")
     # 假设有一个函数add_token_to_blacklist处理令牌黑名单
-    success = add_token_to_blacklist(token)
+    success = await add_token_to_blacklist(token)
     if not success:
         raise HTTPException(status_code=400, detail="无法退出登录")
 
@@ -142,7 +143,7 @@ async def logout(request: Request, token: str = Depends(oauth2_scheme)):
 
 @api_auth.post("/refresh")
 async def refresh_token(token: str = Depends(oauth2_scheme)):
-    if redis_client.get(token):
+    if await token_blacklist.contains(token):
         raise HTTPException(status_code=401, detail="Token is blacklisted")
 
     # 验证并解析旧的token
@@ -156,7 +157,7 @@ async def refresh_token(token: str = Depends(oauth2_scheme)):
     except jwt.PyJWTError:
         raise HTTPException(status_code=401, detail="Could not validate token")
 
-    success = add_token_to_blacklist(token)
+    success = await add_token_to_blacklist(token)
     if not success:
         raise HTTPException(status_code=400, detail="无法刷新令牌")
 
@@ -175,7 +176,7 @@ async def refresh_token(token: str = Depends(oauth2_scheme)):
 
 @api_auth.post("/password/update", status_code=status.HTTP_204_NO_CONTENT)
 async def update_password(password_update: PasswordUpdateModel, token: str = Depends(oauth2_scheme)):
-    if redis_client.get(token):
+    if await token_blacklist.contains(token):
         raise HTTPException(status_code=401, detail="Token is blacklisted")
 
     # 解码JWT token并获取用户信息
@@ -188,7 +189,7 @@ async def update_password(password_update: PasswordUpdateModel, token: str = Dep
         raise credentials_exception
 
     # 验证旧密码
-    if not pwd_context.verify(password_update.old_password, user.password):
+    if not await password_hasher.verify(password_update.old_password, user.password):
         raise HTTPException(status_code=422, detail={
             "message": "The given data was invalid.",
             "errors": {"old_password": ["旧密码不正确"]},
@@ -204,8 +205,9 @@ async def update_password(password_update: PasswordUpdateModel, token: str = Dep
         })
 
     # 更新密码
-    user.password = pwd_context.hash(password_update.password)
+    user.password = await password_hasher.hash(password_update.password)
     await user.save()
+    user_cache.invalidate(user_email)
 
     return Response(status_code=status.HTTP_204_NO_CONTENT)
 
@@ -231,10 +233,11 @@ async def get_email_code(email_data: EmailRequestModel, token: str = Depends(oau
     # 生成验证码
     verification_code = generate_verification_code()
 
-    # 保存验证码
-    save_verification_code(user_email, verification_code)
-
-    send_verification_email(email_data.email, verification_code)
+    # 保存验证码并写入发件箱（由后台的 EmailOutbox 发送），一次往返完成
+    async with redis_client.pipeline(transaction=False) as pipe:
+        pipe.setex(verification_code_key(user_email), VERIFICATION_CODE_TTL, verification_code)
+        pipe.rpush(EMAIL_OUTBOX_KEY, verification_email_payload(email_data.email, verification_code))
+        await pipe.execute()
 
     return {}
 
@@ -255,8 +258,8 @@ async def update_email(request: EmailUpdateRequest, token: str = Depends(oauth2_
     user = await Users.get(email=user_email)
 
     # Validate the code from Redis
-    redis_key = f"email_code:{user.email}"
-    stored_code = redis_client.get(redis_key)
+    redis_key = verification_code_key(user.email)
+    stored_code = await redis_client.get(redis_key)
     if not stored_code or stored_code != request.code:
         raise HTTPException(status_code=422, detail={
             "message": "The given data was invalid.",
@@ -275,9 +278,10 @@ async def update_email(request: EmailUpdateRequest, token: str = Depends(oauth2_
     # Update the user's email
     user.email = request.email
     await user.save()
+    user_cache.invalidate(user_email)
 
     # Clean up the code from Redis after successful update
-    redis_client.delete(redis_key)
+    await redis_client.delete(redis_key)
 
     return {}
 
@@ -5,21 +5,13 @@
 # @Tags    :
 from fastapi import APIRouter, Request, HTTPException, Depends, status
 from models import Goods, Category, Comments, Users, OrderDetails, Orders
-from tortoise.functions import Count
 from tortoise.query_utils import Prefetch
 import json
 from pydantic import BaseModel
-from recommend_test_by_strategy import recommend_for_user, adjust_weights_for_product
-from redis_weight import RedisWeightsManager
-
-import jieba
-from sklearn.feature_extraction.text import TfidfVectorizer
-from sklearn.metrics.pairwise import cosine_similarity
-from sklearn.preprocessing import StandardScaler
-from sklearn.pipeline import Pipeline
-from sklearn.compose import ColumnTransformer
-import pandas as pd
-import numpy as np
+from pagination import paginate, paginate_list, InvalidCursor
+from goods_counters import create_goods_comment
+from listing import GoodsListRecord
+
 from typing import List, Optional
 import models
 import asyncio
@@ -28,71 +20,6 @@ import asyncio
 from utils import *
 
 api_goods = APIRouter()
-redis_weights_manager = RedisWeightsManager()
-
-
-# 自定义 jieba 分词器
-def jieba_tokenizer(text):
-    return jieba.lcut(text)
-
-
-# 初始化 TF-IDF 和 StandardScaler
-text_features = 'description'
-text_transformer = Pipeline(steps=[
-    ('tfidf', TfidfVectorizer(tokenizer=jieba_tokenizer))
-])
-
-numeric_features = ['price']
-numeric_transformer = StandardScaler()
-
-preprocessor = ColumnTransformer(
-    transformers=[
-        ('text', text_transformer, text_features),
-        ('num', numeric_transformer, numeric_features)
-    ]
-)
-
-
-class GoodsTemp:
-    def __init__(self, id, title, price, cover, category_id, sales, updated_at, comments_count, collects_count, cover_url):
-        self.id = id
-        self.title = title
-        self.price = price
-        self.cover = cover
-        self.category_id = category_id
-        self.sales = sales
-        self.updated_at = updated_at
-        self.comments_count = comments_count
-        self.collects_count = collects_count
-        self.cover_url = cover_url
-
-    def dict(self):
-        return {
-            'id': self.id,
-            'title': self.title,
-            'price': self.price,
-            'cover': self.cover,
-            'category_id': self.category_id,
-            'sales': self.sales,
-            'updated_at': self.updated_at,
-            'comments_count': self.comments_count,
-            'collects_count': self.collects_count,
-            'cover_url': self.cover_url,
-        }
-
-
-class CategoryTemp:
-    def __init__(self, id, name, pid, level, status_, seq):
-        self.id = id
-        self.name = name
-        self.pid = pid
-        self.level = level
-        self.status = status_
-        self.seq = seq
-        self.children = []
-
-    def add_child(self, child):
-        self.children.append(child)
 
 
 class CommentRequest(BaseModel):
@@ -103,22 +30,12 @@ class CommentRequest(BaseModel):
 
 
 @api_goods.get('')
-async def goods(request: Request, token: str = Depends(oauth2_scheme)):
-    try:
-        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
-        user_email = payload.get("sub")
-    except jwt.PyJWTError:
-        raise HTTPException(status_code=401, detail="Invalid token")
-
-    # Ensure the user exists
-    user = await Users.get_or_none(email=user_email)
-    if not user:
-        raise HTTPException(status_code=404, detail="User not found")
-    else:
-        user_id = user.id
+async def goods(request: Request, user: Users = Depends(get_current_user)):
+    user_id = user.id
 
     # Extract query parameters
     page = int(request.query_params.get('page', 1)) - 1
+    cursor = request.query_params.get('cursor', None)  # 传入游标时忽略 page
     title = request.query_params.get('title', None)
     category_id = request.query_params.get('category_id', None)
     # print(category_id)
@@ -127,25 +44,29 @@ async def goods(request: Request, token: str = Depends(oauth2_scheme)):
     price = int(request.query_params.get('price', 0))
     comments_count = int(request.query_params.get('comments_count', 0))
 
-    categories_query = await Category.filter(group='menu').all()
-    categories = [CategoryTemp(c.id, c.name, c.pid, c.level, c.status, 1) for c in categories_query]
-    categories_tree = build_tree(categories)
+    categories_tree = await category_tree.get()
 
     # Initial query setup
     query = Goods.filter(is_on=1)
+    ranked = None
     if title:
-        query = query.filter(title__icontains=title)
+        # 通过倒排索引搜索，得到按相关度排序的商品ID；按相关度排序时只取前 SEARCH_MAX_RESULTS 条，
+        # 指定了其它排序时取全部匹配的商品，否则排序后会漏掉相关度靠后的商品
+        sorted_search = bool(sales or price or comments_count)
+        ranked = await goods_search.search(title, limit=0 if sorted_search else None)
+        if ranked:
+            query = query.filter(id__in=list(ranked))
+        else:
+            # 索引中没有命中（如分词切不出的片段、索引还在构建）时退回到标题模糊匹配
+            ranked = None
+            query = query.filter(title__icontains=title)
 
     if category_id != 0:
         query = query.filter(category_id=category_id)
 
     if recommend == 1:
         if user_id:
-            user_weights = redis_weights_manager.get_user_weights_else_global(user_id)
-
-            recommendations = recommend_for_user(user_id, user_weights)
-
-            recommended_ids = [g[0] for g in recommendations]
+            recommended_ids = await recommended_goods_ids(user_id)
             query = query.filter(id__in=recommended_ids)
 
     # Apply sort
@@ -155,19 +76,23 @@ async def goods(request: Request, token: str = Depends(oauth2_scheme)):
     if price:
         sort_expr.append('-price' if price == 1 else 'price')
 
-    query = query.annotate(comments_count=Count("reviews__id"))
-    # Calculate comments count and include it in initial query if needed
+    # comments_count 是 Goods 上的冗余字段（有索引），不再 JOIN 评论表聚合
     if comments_count:
         sort_expr.append('-comments_count' if comments_count == 1 else 'comments_count')
 
-    if sort_expr:
-        query = query.order_by(*sort_expr)
-
-    # Pagination
-    goods_list = await query.offset(page * 10).limit(10).all()
-    goods_list = [GoodsTemp(g.id, g.title, g.price, g.cover, g.category_id, g.sales, transfer_time(str(g.updated_at)),
-                            g.comments_count, 0,
-                            f'http://127.0.0.1:8888/upimg/{g.cover}') for g in goods_list]
+    # Pagination（排序字段 + id 的游标分页，也兼容 page 参数）
+    try:
+        if ranked is not None and not sort_expr:
+            # 搜索且未指定排序时按相关度排序，结果集最多 SEARCH_MAX_RESULTS 条，在内存中分页
+            candidates = await GoodsListRecord.fetch(query)
+            for g in candidates:
+                g.relevance = ranked[g.id]
+            goods_list, next_cursor = paginate_list(candidates, ['-relevance'], cursor=cursor, page=page, per_page=10)
+        else:
+            goods_list, next_cursor = await paginate(query, sort_expr, cursor=cursor, page=page, per_page=10,
+                                                     record=GoodsListRecord)
+    except InvalidCursor as e:
+        raise HTTPException(status_code=400, detail=str(e))
 
     # Prepare the response
     # total_items = await query.count()
@@ -177,8 +102,9 @@ async def goods(request: Request, token: str = Depends(oauth2_scheme)):
 
     return {
         "goods": {
-            "current_page": page + 1,
-            "data": [g for g in goods_list],
+            "current_page": None if cursor else page + 1,
+            "data": [g.dict() for g in goods_list],
+            "next_cursor": next_cursor,
         },
         "recommend_goods": recommend_goods,
         "categories": categories_tree,
@@ -187,7 +113,7 @@ async def goods(request: Request, token: str = Depends(oauth2_scheme)):
 
 
 @api_goods.get("/{good_id}")
-async def get_good_details(good_id: int, token: Optional[str] = Depends(oauth2_scheme)):
+async def get_good_details(good_id: int, user: Users = Depends(get_current_user)):
     """
     异步获取指定ID商品及其关联数据。
 
@@ -197,241 +123,215 @@ async def get_good_details(good_id: int, token: Optional[str] = Depends(oauth2_s
     返回值:
     - goods: 包含指定商品及其预加载的相关数据的对象。例如，商品评论、用户信息和商品类别。
     """
-    try:
-        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
-        user_email = payload.get("sub")
-
-        # Ensure the user exists
-        user = await Users.get_or_none(email=user_email)
-        if not user:
-            raise HTTPException(status_code=404, detail="User not found")
-        else:
-            user_id = user.id
-
-        goods = await Goods.filter(id=good_id).prefetch_related(
-            Prefetch("reviews",
-                     queryset=Comments.all().prefetch_related(Prefetch("user", queryset=Users.all()), "order")),
-            # 预加载商品的所有评论及其用户和订单信息
-            Prefetch("user", queryset=Users.all()),  # 预加载商品的发布用户信息
-            Prefetch("category", queryset=Category.all())  # 预加载商品所属的类别信息
-        ).first()  # 获取查询结果中的第一个商品
-
-        # 获取用户购买历史中的商品ID
-        user_orders = await Orders.filter(user_id=user_id).prefetch_related('order_details__goods')
-        user_goods_ids = {detail.goods.id for order in user_orders for detail in order.order_details}
-
-        if not goods:
-            raise HTTPException(status_code=404, detail="Goods not found")
-
-        # # 所有商品数据，用于生成推荐
-        # all_goods = await Goods.all()
-        # goods_data = [{
-        #     'id': g.id,
-        #     'title': g.title,
-        #     'description': g.description,
-        #     'price': g.price
-        # } for g in all_goods]
-        #
-        # print(goods_data)
-        #
-        # df = pd.DataFrame(goods_data)
-        # X_transformed = preprocessor.fit_transform(df)
-        # cosine_sim = cosine_similarity(X_transformed, X_transformed)
-        #
-        # # 从订单中找到用户购买过的商品
-        # orders = await models.Orders.filter(user_id=user_id).all()
-        # order_ids = [order.id for order in orders]
-        # order_details = await models.OrderDetails.filter(order_id__in=order_ids).all()
-        # purchased_goods_ids = [detail.goods_id for detail in order_details]
-        #
-        # # 获取这些商品
-        # purchased_goods = await models.Goods.filter(id__in=purchased_goods_ids).all()
-        #
-        # user_goods_ids = [g.id for g in purchased_goods]
-        #
-        # # 获取商品ID到索引的映射
-        # goods_id_to_index = {g['id']: idx for idx, g in enumerate(goods_data)}
-        # # print(goods_id_to_index)
-        # valid_indices = [goods_id_to_index[ugid] for ugid in user_goods_ids if ugid in goods_id_to_index]
-        #
-        # # 获取用户购买过的商品
-        # if not valid_indices:
-        #     return {
-        #         "goods": {
-        #             "id": goods.id,
-        #             "user_id": goods.user.id,
-        #             # "user_name": goods.user.name,
-        #             "category_id": goods.category.id,
-        #             # "category_name": goods.category.name,
-        #             "title": goods.title,
-        #             "description": goods.description,
-        #             "price": goods.price,
-        #             "stock": goods.stock,
-        #             "sales": goods.sales,
-        #             "cover": goods.cover,
-        #             "pics": goods.pics,
-        #             "is_on": 1 if bool(goods.is_on) else 0,
-        #             "is_recommend": 1 if bool(goods.is_recommend) else 0,
-        #             "details": goods.details,
-        #             "created_at": transfer_time(str(goods.created_at.strftime('%Y-%m-%d %H:%M:%S'))) if goods.created_at else None,
-        #             "updated_at": transfer_time(str(goods.updated_at.strftime('%Y-%m-%d %H:%M:%S'))) if goods.updated_at else None,
-        #             "collects_count": 0,
-        #             "cover_url": f'http://127.0.0.1:8888/upimg/goods_cover/{goods.cover}',
-        #             "pics_url": goods_pics,
-        #             "is_collected": 0,
-        #             "comments": [
-        #                 {
-        #                     "id": comment.id,
-        #                     "user_id": comment.user.id,
-        #                     # "user_name": comment.user.name,
-        #                     "order_id": comment.order.id,
-        #                     "goods_id": goods.id,
-        #                     "rate": comment.rate,
-        #                     "star": comment.star,
-        #                     "content": comment.content,
-        #                     "reply": comment.reply,
-        #                     "pics": json.loads(comment.pics) if comment.pics else [],
-        #                     "created_at": transfer_time(
-        #                         str(comment.created_at.strftime('%Y-%m-%d %H:%M:%S'))) if comment.created_at else None,
-        #                     "updated_at": transfer_time(
-        #                         str(comment.updated_at.strftime('%Y-%m-%d %H:%M:%S'))) if comment.updated_at else None,
-        #                     "user": {
-        #                         "id": comment.user.id,
-        #                         "name": comment.user.name,
-        #                         "avatar": comment.user.avatar,
-        #                         "avatar_url": f'http://127.0.0.1:8888/upimg/avatars/{comment.user.avatar}'
-        #                         if comment.user.avatar else None,
-        #                     }
-        #                 } for comment in goods.reviews
-        #             ]
-        #         },
-        #         "like_goods": [
-        #             {
-        #                 "id": lg.id,
-        #                 "title": lg.title,
-        #                 "price": lg.price,
-        #                 "cover_url": f'http://127.0.0.1:8888/upimg/goods_cover/{lg.cover}',
-        #                 "sales": lg.sales
-        #             } for lg in like_goods
-        #         ],
-        #         "recommend_goods": []
-        #     }
-
-        # 获取用户购买过的商品
+    user_id = user.id
+
+    goods = await Goods.filter(id=good_id).prefetch_related(
+        Prefetch("reviews",
+                 queryset=Comments.all().prefetch_related(Prefetch("user", queryset=Users.all()), "order")),
+        # 预加载商品的所有评论及其用户和订单信息
+        Prefetch("user", queryset=Users.all()),  # 预加载商品的发布用户信息
+        Prefetch("category", queryset=Category.all())  # 预加载商品所属的类别信息
+    ).first()  # 获取查询结果中的第一个商品
+
+    if not goods:
+        raise HTTPException(status_code=404, detail="Goods not found")
+
+    # # 所有商品数据，用于生成推荐
+    # all_goods = await Goods.all()
+    # goods_data = [{
+    #     'id': g.id,
+    #     'title': g.title,
+    #     'description': g.description,
+    #     'price': g.price
+    # } for g in all_goods]
+    #
+    # print(goods_data)
+    #
+    # df = pd.DataFrame(goods_data)
+    # X_transformed = preprocessor.fit_transform(df)
+    # cosine_sim = cosine_similarity(X_transformed, X_transformed)
+    #
+    # # 从订单中找到用户购买过的商品
+    # orders = await models.Orders.filter(user_id=user_id).all()
+    # order_ids = [order.id for order in orders]
+    # order_details = await models.OrderDetails.filter(order_id__in=order_ids).all()
+    # purchased_goods_ids = [detail.goods_id for detail in order_details]
+    #
+    # # 获取这些商品
+    # purchased_goods = await models.Goods.filter(id__in=purchased_goods_ids).all()
+    #
+    # user_goods_ids = [g.id for g in purchased_goods]
+    #
+    # # 获取商品ID到索引的映射
+    # goods_id_to_index = {g['id']: idx for idx, g in enumerate(goods_data)}
+    # # print(goods_id_to_index)
+    # valid_indices = [goods_id_to_index[ugid] for ugid in user_goods_ids if ugid in goods_id_to_index]
+    #
+    # # 获取用户购买过的商品
+    # if not valid_indices:
+    #     return {
+    #         "goods": {
+    #             "id": goods.id,
+    #             "user_id": goods.user.id,
+    #             # "user_name": goods.user.name,
+    #             "category_id": goods.category.id,
+    #             # "category_name": goods.category.name,
+    #             "title": goods.title,
+    #             "description": goods.description,
+    #             "price": goods.price,
+    #             "stock": goods.stock,
+    #             "sales": goods.sales,
+    #             "cover": goods.cover,
+    #             "pics": goods.pics,
+    #             "is_on": 1 if bool(goods.is_on) else 0,
+    #             "is_recommend": 1 if bool(goods.is_recommend) else 0,
+    #             "details": goods.details,
+    #             "created_at": transfer_time(str(goods.created_at.strftime('%Y-%m-%d %H:%M:%S'))) if goods.created_at else None,
+    #             "updated_at": transfer_time(str(goods.updated_at.strftime('%Y-%m-%d %H:%M:%S'))) if goods.updated_at else None,
+    #             "collects_count": 0,
+    #             "cover_url": f'http://127.0.0.1:8888/upimg/goods_cover/{goods.cover}',
+    #             "pics_url": goods_pics,
+    #             "is_collected": 0,
+    #             "comments": [
+    #                 {
+    #                     "id": comment.id,
+    #                     "user_id": comment.user.id,
+    #                     # "user_name": comment.user.name,
+    #                     "order_id": comment.order.id,
+    #                     "goods_id": goods.id,
+    #                     "rate": comment.rate,
+    #                     "star": comment.star,
+    #                     "content": comment.content,
+    #                     "reply": comment.reply,
+    #                     "pics": json.loads(comment.pics) if comment.pics else [],
+    #                     "created_at": transfer_time(
+    #                         str(comment.created_at.strftime('%Y-%m-%d %H:%M:%S'))) if comment.created_at else None,
+    #                     "updated_at": transfer_time(
+    #                         str(comment.updated_at.strftime('%Y-%m-%d %H:%M:%S'))) if comment.updated_at else None,
+    #                     "user": {
+    #                         "id": comment.user.id,
+    #                         "name": comment.user.name,
+    #                         "avatar": comment.user.avatar,
+    #                         "avatar_url": f'http://127.0.0.1:8888/upimg/avatars/{comment.user.avatar}'
+    #                         if comment.user.avatar else None,
+    #                     }
+    #                 } for comment in goods.reviews
+    #             ]
+    #         },
+    #         "like_goods": [
+    #             {
+    #                 "id": lg.id,
+    #                 "title": lg.title,
+    #                 "price": lg.price,
+    #                 "cover_url": f'http://127.0.0.1:8888/upimg/goods_cover/{lg.cover}',
+    #                 "sales": lg.sales
+    #             } for lg in like_goods
+    #         ],
+    #         "recommend_goods": []
+    #     }
+
+    # 猜你喜欢：离线计算的相似商品，新商品还没有相似度数据时退回同分类商品
+    like_goods_id = [goods_id for goods_id, _ in goods_similarity.neighbors(good_id, 5)]
+    like_goods = await Goods.filter(id__in=like_goods_id, is_on=1) if like_goods_id else []
+    like_goods.sort(key=lambda g: like_goods_id.index(g.id))
+    if not like_goods:
         like_goods = await Goods.filter(category=goods.category).exclude(id=good_id).limit(5).all()
-        #
-        # # 获取商品图片
-        goods_pics = goods.pics if isinstance(goods.pics, (dict, list)) else json.loads(
-            goods.pics) if goods.pics else []
-        #
-        # top_n = 4
-        #
-        # # 计算相似度
-        # sim_scores = cosine_sim[valid_indices].mean(axis=0)
-        # top_indices = np.argsort(sim_scores)[::-1][:top_n]
-        #
-        # # 获取推荐商品（排除已购买的）
-        # recommended_ids = [df.iloc[i]['id'] for i in top_indices if df.iloc[i]['id'] not in purchased_goods_ids][:top_n]
-        # recommended_goods = await Goods.filter(id__in=recommended_ids).all()
-        # print(recommended_goods)
-
-        global_weights = redis_weights_manager.get_global_weights()
-        user_weights = redis_weights_manager.get_user_weights_else_global(user_id)
-
-        recommendations = recommend_for_user(user_id, user_weights)
-        recommended_goods_id = [g[0] for g in recommendations]
-        recommended_goods = Goods.filter(id__in=recommended_goods_id)
-        recommended_goods = await recommended_goods.filter(is_on=1)
-        print(recommended_goods)
-
-        user_weights = adjust_weights_for_product(user_id, good_id, user_weights, "view")
-        global_weights = adjust_weights_for_product(user_id, good_id, global_weights, "view")
-        redis_weights_manager.set_weights(user_id, user_weights)
-        redis_weights_manager.set_global_weights(global_weights)
-
-        return {
-            "goods": {
-                "id": goods.id,
-                "user_id": goods.user.id,
-                # "user_name": goods.user.name,
-                "category_id": goods.category.id,
-                # "category_name": goods.category.name,
-                "title": goods.title,
-                "description": goods.description,
-                "price": goods.price,
-                "stock": goods.stock,
-                "sales": goods.sales,
-                "cover": goods.cover,
-                "pics": goods.pics,
-                "is_on": 1 if bool(goods.is_on) else 0,
-                "is_recommend": 1 if bool(goods.is_recommend) else 0,
-                "details": goods.details,
-                "created_at": transfer_time(str(goods.created_at.strftime('%Y-%m-%d %H:%M:%S'))) if goods.created_at else None,
-                "updated_at": transfer_time(str(goods.updated_at.strftime('%Y-%m-%d %H:%M:%S'))) if goods.updated_at else None,
-                "collects_count": 0,
-                "cover_url": f'http://127.0.0.1:8888/upimg/{goods.cover}',
-                "pics_url": goods_pics,
-                "is_collected": 0,
-                "comments": [
-                    {
-                        "id": comment.id,
-                        "user_id": comment.user.id,
-                        # "user_name": comment.user.name,
-                        "order_id": comment.order.id,
-                        "goods_id": goods.id,
-                        "rate": comment.rate,
-                        "star": comment.star,
-                        "content": comment.content,
-                        "reply": comment.reply,
-                        "pics": json.loads(comment.pics) if comment.pics else [],
-                        "created_at": transfer_time(
-                            str(comment.created_at.strftime('%Y-%m-%d %H:%M:%S'))) if comment.created_at else None,
-                        "updated_at": transfer_time(
-                            str(comment.updated_at.strftime('%Y-%m-%d %H:%M:%S'))) if comment.updated_at else None,
-                        "user": {
-                            "id": comment.user.id,
-                            "name": comment.user.name,
-                            "avatar": comment.user.avatar,
-                            "avatar_url": f'http://127.0.0.1:8888/upimg/avatars/{comment.user.avatar}'
-                            if comment.user.avatar else None,
-                        }
-                    } for comment in goods.reviews
-                ]
-            },
-            "like_goods": [
-                {
-                    "id": lg.id,
-                    "title": lg.title,
-                    "price": lg.price,
-                    "cover_url": f'http://127.0.0.1:8888/upimg/{lg.cover}' if lg.cover else 'http://127.0.0.1:8888/upimg/goods_cover/default.png',
-                    "sales": lg.sales
-                } for lg in like_goods
-            ],
-            "recommend_goods": [
+    #
+    # # 获取商品图片
+    goods_pics = goods.pics if isinstance(goods.pics, (dict, list)) else json.loads(
+        goods.pics) if goods.pics else []
+    #
+    # top_n = 4
+    #
+    # # 计算相似度
+    # sim_scores = cosine_sim[valid_indices].mean(axis=0)
+    # top_indices = np.argsort(sim_scores)[::-1][:top_n]
+    #
+    # # 获取推荐商品（排除已购买的）
+    # recommended_ids = [df.iloc[i]['id'] for i in top_indices if df.iloc[i]['id'] not in purchased_goods_ids][:top_n]
+    # recommended_goods = await Goods.filter(id__in=recommended_ids).all()
+    # print(recommended_goods)
+
+    # 推荐结果由后台预先计算，还没有结果时（新用户）先展示后台推荐的商品
+    recommended_goods_id = await recommended_goods_ids(user_id)
+    recommended_goods = await Goods.filter(id__in=recommended_goods_id, is_on=1)
+    recommended_goods.sort(key=lambda g: recommended_goods_id.index(g.id))
+
+    # 浏览事件交给后台调整权重、更新推荐结果
+    await recommend_events.emit(user_id, good_id, "view")
+
+    return {
+        "goods": {
+            "id": goods.id,
+            "user_id": goods.user.id,
+            # "user_name": goods.user.name,
+            "category_id": goods.category.id,
+            # "category_name": goods.category.name,
+            "title": goods.title,
+            "description": goods.description,
+            "price": goods.price,
+            "stock": goods.stock,
+            "sales": goods.sales,
+            "cover": goods.cover,
+            "pics": goods.pics,
+            "is_on": 1 if bool(goods.is_on) else 0,
+            "is_recommend": 1 if bool(goods.is_recommend) else 0,
+            "details": goods.details,
+            "created_at": transfer_time(str(goods.created_at.strftime('%Y-%m-%d %H:%M:%S'))) if goods.created_at else None,
+            "updated_at": transfer_time(str(goods.updated_at.strftime('%Y-%m-%d %H:%M:%S'))) if goods.updated_at else None,
+            "collects_count": 0,
+            "cover_url": f'http://127.0.0.1:8888/upimg/{goods.cover}',
+            "pics_url": goods_pics,
+            "is_collected": 0,
+            "comments": [
                 {
-                    "id": rg.id,
-                    "title": rg.title,
-                    "price": rg.price,
-                    "cover_url": f'http://127.0.0.1:8888/upimg/{rg.cover}' if rg.cover else 'http://127.0.0.1:8888/upimg/goods_cover/default.png',
-                    "sales": rg.sales
-                } for rg in recommended_goods
+                    "id": comment.id,
+                    "user_id": comment.user.id,
+                    # "user_name": comment.user.name,
+                    "order_id": comment.order.id,
+                    "goods_id": goods.id,
+                    "rate": comment.rate,
+                    "star": comment.star,
+                    "content": comment.content,
+                    "reply": comment.reply,
+                    "pics": json.loads(comment.pics) if comment.pics else [],
+                    "created_at": transfer_time(
+                        str(comment.created_at.strftime('%Y-%m-%d %H:%M:%S'))) if comment.created_at else None,
+                    "updated_at": transfer_time(
+                        str(comment.updated_at.strftime('%Y-%m-%d %H:%M:%S'))) if comment.updated_at else None,
+                    "user": {
+                        "id": comment.user.id,
+                        "name": comment.user.name,
+                        "avatar": comment.user.avatar,
+                        "avatar_url": f'http://127.0.0.1:8888/upimg/avatars/{comment.user.avatar}'
+                        if comment.user.avatar else None,
+                    }
+                } for comment in goods.reviews
             ]
-        }
-
-    except jwt.PyJWTError:
-        raise HTTPException(status_code=401, detail="Invalid token")
+        },
+        "like_goods": [
+            {
+                "id": lg.id,
+                "title": lg.title,
+                "price": lg.price,
+                "cover_url": f'http://127.0.0.1:8888/upimg/{lg.cover}' if lg.cover else 'http://127.0.0.1:8888/upimg/goods_cover/default.png',
+                "sales": lg.sales
+            } for lg in like_goods
+        ],
+        "recommend_goods": [
+            {
+                "id": rg.id,
+                "title": rg.title,
+                "price": rg.price,
+                "cover_url": f'http://127.0.0.1:8888/upimg/{rg.cover}' if rg.cover else 'http://127.0.0.1:8888/upimg/goods_cover/default.png',
+                "sales": rg.sales
+            } for rg in recommended_goods
+        ]
+    }
 
 
 @api_goods.post("/comment", status_code=status.HTTP_201_CREATED)
-async def post_comment(request: CommentRequest, token: str = Depends(oauth2_scheme)):
-    # Decode the JWT token to authenticate the user
-    try:
-        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
-        user_email = payload.get("sub")
-        user = await Users.get(email=user_email)
-    except jwt.PyJWTError:
-        raise HTTPException(status_code=401, detail="Invalid token")
-
+async def post_comment(request: CommentRequest, user: Users = Depends(get_current_user)):
     # Ensure the user has purchased the goods and confirmed receipt
     order = await Orders.filter(user_id=user.id, order_details__goods__id=request.goods_id, status=4).first()
     if not order:
@@ -442,8 +342,8 @@ async def post_comment(request: CommentRequest, token: str = Depends(oauth2_sche
     if existing_comment:
         raise HTTPException(status_code=400, detail={"message": "此商品已经评论过了", "status_code": 400})
 
-    # Create the comment
-    new_comment = await Comments.create(
+    # Create the comment（同时更新商品的评论数和平均星级）
+    new_comment = await create_goods_comment(
         user_id=user.id,
         goods_id=request.goods_id,
         content=request.content,
@@ -451,6 +351,7 @@ async def post_comment(request: CommentRequest, token: str = Depends(oauth2_sche
         star=request.star,
         order_id=order.id,
     )
+    await recommend_store.bump_data_version(user.id)
 
     return {"message": "评论创建成功", "status_code": 201}
 
@@ -7,53 +7,14 @@ from fastapi import APIRouter, Request, Depends, HTTPException
 from models import Slides, Goods, Category
 from datetime import datetime
 
-from recommend_test_by_strategy import recommend_for_user, adjust_weights_for_product
+from pagination import paginate, InvalidCursor
+from listing import IndexGoodsRecord
 
 from utils import *
 
 api_index = APIRouter()
 
 
-class CategoryTemp:
-    def __init__(self, id, name, pid, level, status, seq):
-        self.id = id
-        self.name = name
-        self.pid = pid
-        self.level = level
-        self.status = status
-        self.seq = seq
-        self.children = []
-
-    def add_child(self, child):
-        self.children.append(child)
-
-
-class GoodsTemp:
-    def __init__(self, id, title, price, stock, sales, cover, description, collects_count, cover_url):
-        self.id = id
-        self.title = title
-        self.price = price
-        self.stock = stock
-        self.sales = sales
-        self.cover = cover
-        self.description = description
-        self.collects_count = collects_count
-        self.cover_url = cover_url
-
-    def dict(self):
-        return {
-            "id": self.id,
-            "title": self.title,
-            "price": self.price,
-            "stock": self.stock,
-            "sales": self.sales,
-            "cover": self.cover,
-            "description": self.description,
-            "collects_count": self.collects_count,
-            "cover_url": self.cover_url
-        }
-
-
 class SlidesTemp:
     def __init__(self, id, title, url, img, status, seq, created_at, updated_at, img_url):
         self.id = id
@@ -81,77 +42,76 @@ class SlidesTemp:
 
 
 @api_index.get('')
-async def index(request: Request, token: str = Depends(oauth2_scheme)):
-    try:
-        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
-        user_email = payload.get("sub")
-    except jwt.PyJWTError:
-        raise HTTPException(status_code=401, detail="Invalid token")
-
-    # Ensure the user exists
-    user = await Users.get_or_none(email=user_email)
-    if not user:
-        raise HTTPException(status_code=404, detail="User not found")
-    else:
-        user_id = user.id
+async def index(request: Request, user: Users = Depends(get_current_user)):
+    user_id = user.id
 
     json_data = request.query_params
     page = int(json_data.get('page', 1)) - 1  # API 通常从第1页开始计数，而程序内部从第0页开始
+    cursor = json_data.get('cursor', None)  # 游标分页，传入时忽略 page
     sales = json_data.get('sales', '0') == '1'
     recommend = json_data.get('recommend', '0') == '1'
     new = json_data.get('new', '0') == '1'
 
-    categories_query = await Category.filter(group='menu').all()
-    categories = [CategoryTemp(c.id, c.name, c.pid, c.level, c.status, 1) for c in categories_query]
-    categories_tree = build_tree(categories)
+    categories_tree = await category_tree.get()
 
     goods_query = Goods.filter(is_on=1)
+    ordering = []
     if sales:
-        goods_query = goods_query.filter(sales__gt=50).order_by('-sales')
+        goods_query = goods_query.filter(sales__gt=50)
+        ordering = ['-sales']
     if recommend:
         if user_id:
-            recommendations = recommend_for_user(user_id)
-
-            recommended_ids = [g[0] for g in recommendations]
+            recommended_ids = await recommended_goods_ids(user_id)
             goods_query = goods_query.filter(id__in=recommended_ids)
     if new:
-        goods_query = goods_query.order_by('-created_at')
+        ordering = ['-created_at']
 
-    total_items = await goods_query.count()
+    # 多取一条判断是否还有下一页，不再 count()
+    try:
+        goods_list, next_cursor = await paginate(goods_query, ordering, cursor=cursor, page=page, per_page=10,
+                                                 record=IndexGoodsRecord)
+    except InvalidCursor as e:
+        raise HTTPException(status_code=400, detail=str(e))
 
-    if total_items == 0 or page * 10 >= total_items:
+    if not goods_list:
         # 如果没有商品或请求的页码超过了可用商品数
         goods_resp = {
             "categories": categories_tree,
             "goods": {
-                "current_page": page + 1,
+                "current_page": None if cursor else page + 1,
                 "data": [],
                 "first_page_url": f"https://127.0.0.1/api/index?page=1",
                 "from": None,
                 "next_page_url": None,
+                "next_cursor": None,
                 "path": "https://127.0.0.1/api/index",
                 "per_page": 10,
-                "prev_page_url": None if page <= 0 else f"https://127.0.0.1/api/index?page={page}",
+                "prev_page_url": None if cursor or page <= 0 else f"https://127.0.0.1/api/index?page={page}",
                 "to": None
             }
         }
     else:
-        goods_query = goods_query.offset(page * 10).limit(10)
-        goods_list = await goods_query
-
-        goods = [GoodsTemp(g.id, g.title, g.price, g.stock, g.sales, f'{g.cover}',
-                           g.description, 0, f'http://127.0.0.1:8888/upimg/{g.cover}') for g in goods_list]
+        if cursor:
+            # 游标模式下没有页码，下一页链接同样使用游标
+            current_page, from_, to = None, None, None
+            next_page_url = f"https://127.0.0.1/api/index?cursor={next_cursor}" if next_cursor else None
+            prev_page_url = None
+        else:
+            current_page, from_, to = page + 1, page * 10 + 1, page * 10 + len(goods_list)
+            next_page_url = f"https://127.0.0.1/api/index?page={page + 2}" if next_cursor else None
+            prev_page_url = f"https://127.0.0.1/api/index?page={page}" if page > 0 else None
 
         goods_resp = {
-            "current_page": page + 1,
-            "data": [g.dict() for g in goods],
+            "current_page": current_page,
+            "data": [g.dict() for g in goods_list],
             "first_page_url": f"https://127.0.0.1/api/index?page=1",
-            "from": page * 10 + 1,
-            "next_page_url": f"https://127.0.0.1/api/index?page={page + 2}",
+            "from": from_,
+            "next_page_url": next_page_url,
+            "next_cursor": next_cursor,
             "path": "https://127.0.0.1/api/index",
             "per_page": 10,
-            "prev_page_url": f"https://127.0.0.1/api/index?page={page}" if page > 0 else None,
-            "to": (page + 1) * 10
+            "prev_page_url": prev_page_url,
+            "to": to
         }
 
     slides_query = await Slides.filter(status=1).order_by('seq').all()
@@ -7,6 +7,7 @@ from fastapi import APIRouter, Request, HTTPException, Depends, status, UploadFi
 from models import Goods, Category, Comments, Users, OrderDetails, Orders, Cart, Address
 from tortoise.functions import Count, Sum
 from tortoise.query_utils import Prefetch
+import asyncio
 import json
 from pydantic import BaseModel, Field, HttpUrl, conint
 import shutil
@@ -14,13 +15,11 @@ import os
 from typing import List, Optional
 from tortoise.transactions import in_transaction
 import re
-from redis_weight import RedisWeightsManager
-from recommend_test_by_strategy import *
+from goods_counters import create_goods_comment
 
 from utils import *
 
 api_orders = APIRouter()
-redis_weights_manager = RedisWeightsManager()
 
 
 class GoodsTemp:
@@ -233,20 +232,8 @@ class OrderCreateRequest(BaseModel):
 
 
 @api_orders.get("/preview")
-async def order_preview(token: str = Depends(oauth2_scheme)):
-    # Decode JWT token to authenticate and get user ID
-    try:
-        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
-        user_email = payload.get("sub")
-    except jwt.PyJWTError:
-        raise HTTPException(status_code=401, detail="Invalid token")
-
-    # Ensure the user exists
-    user = await Users.get_or_none(email=user_email)
-    if not user:
-        raise HTTPException(status_code=404, detail="User not found")
-    else:
-        user_id = user.id
+async def order_preview(user: Users = Depends(get_current_user)):
+    user_id = user.id
 
     # Fetch default address or fallback to any address
     address = await Address.filter(user_id=user_id, is_default=1).first()
@@ -298,20 +285,8 @@ async def remove_cart_items(cart_items):
 
 
 @api_orders.post("", status_code=status.HTTP_201_CREATED)
-async def submit_order(address_id: int, token: str = Depends(oauth2_scheme)):
-    # Decode JWT token to authenticate and get user ID
-    try:
-        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
-        user_email = payload.get("sub")
-    except jwt.PyJWTError:
-        raise HTTPException(status_code=401, detail="Invalid token")
-
-    # Ensure the user exists
-    user = await Users.get_or_none(email=user_email)
-    if not user:
-        raise HTTPException(status_code=404, detail="User not found")
-    else:
-        user_id = user.id
+async def submit_order(address_id: int, user: Users = Depends(get_current_user)):
+    user_id = user.id
 
     async with in_transaction():
         # Check if the address exists and belongs to the user
@@ -329,16 +304,10 @@ async def submit_order(address_id: int, token: str = Depends(oauth2_scheme)):
             if item.goods.stock < item.num:
                 raise HTTPException(status_code=400, detail=f"{item.goods.title} stock is insufficient.")
 
-            user_weights = adjust_weights_for_product(user_id, item, redis_weights_manager.get_weights(user_id),
-                                                      "purchase")
-            global_weights = adjust_weights_for_product(user_id, item, redis_weights_manager.get_global_weights(),
-                                                        "purchase")
-            redis_weights_manager.set_weights(user_id, user_weights)
-            redis_weights_manager.set_global_weights(global_weights)
-
             # Update stock
             item.goods.stock -= item.num
-            await item.goods.save()
+            # 只写库存，comments_count/star_avg 等计数由 goods_counters 在各自的事务中维护，不能用旧值覆盖
+            await item.goods.save(update_fields=['stock', 'updated_at'])
             total_amount += item.goods.price * item.num
 
             # Prepare order detail
@@ -367,41 +336,43 @@ async def submit_order(address_id: int, token: str = Depends(oauth2_scheme)):
         # Remove cart items after order is successfully created
         await remove_cart_items(cart_items)
 
-        return OrdersTemp(
-            order.id,
-            order.order_no,
-            user_id,
-            order.amount,
-            order.status,
-            address.id,
-            order.express_type,
-            order.express_no,
-            order.pay_time,
-            order.pay_type,
-            order.trade_no,
-            order.created_at,
-            order.updated_at
-        ).dict()
+    # 事务提交后再更新推荐相关数据：整个订单作为一个购买事件，由后台合并调整一次权重。
+    # 订单已经创建成功，这里出错只记录日志，不能让客户端以为下单失败而重复提交
+    goods_ids = [detail.goods_id for detail in order_details]
+    if goods_ids:
+        try:
+            version = await recommend_store.data_version(user_id)
+            await recommend_store.bump_data_version(user_id)
+            # 增量更新涉及稀疏矩阵运算，放到线程中执行，不阻塞事件循环
+            await asyncio.to_thread(copurchase_engine.add_order, user_id, goods_ids)
+            await recommend_events.emit_many(user_id, goods_ids, "purchase", version=version)
+        except Exception as e:
+            print(f"Error updating recommendations after order {order.id}: {e}")
+
+    return OrdersTemp(
+        order.id,
+        order.order_no,
+        user_id,
+        order.amount,
+        order.status,
+        address.id,
+        order.express_type,
+        order.express_no,
+        order.pay_time,
+        order.pay_type,
+        order.trade_no,
+        order.created_at,
+        order.updated_at
+    ).dict()
 
 
 @api_orders.get("/{order_id}")
 async def get_order_details(
         order_id: int,
         include: Optional[str] = Query(None),
-        token: str = Depends(oauth2_scheme)
+        user: Users = Depends(get_current_user)
 ):
-    try:
-        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
-        user_email = payload.get("sub")
-    except jwt.PyJWTError:
-        raise HTTPException(status_code=401, detail="Invalid token")
-
-    # Ensure the user exists
-    user = await Users.get_or_none(email=user_email)
-    if not user:
-        raise HTTPException(status_code=404, detail="User not found")
-    else:
-        user_id = user.id
+    user_id = user.id
 
     order = await Orders.get_or_none(id=order_id).prefetch_related('order_details')
     if not order:
@@ -490,22 +461,11 @@ async def list_orders(
         title: Optional[str] = Query(None),
         include: Optional[str] = Query(None),
         status: Optional[int] = Query(None),
-        token: str = Depends(oauth2_scheme),
+        user: Users = Depends(get_current_user),
         page: int = Query(1, gt=0),
         per_page: int = Query(10, gt=0)
 ):
-    try:
-        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
-        user_email = payload.get("sub")
-    except jwt.PyJWTError:
-        raise HTTPException(status_code=401, detail="Invalid token")
-
-    # Ensure the user exists
-    user = await Users.get_or_none(email=user_email)
-    if not user:
-        raise HTTPException(status_code=404, detail="User not found")
-    else:
-        user_id = user.id
+    user_id = user.id
 
     # Base query with optional filters
     query = Orders.filter(user_id=user.id).prefetch_related('order_details')
@@ -620,20 +580,9 @@ async def list_orders(
 @api_orders.get("/{order_id}/express")
 async def get_order_express(
         order_id: int = Path(..., description="The ID of the order"),
-        token: str = Depends(oauth2_scheme)
+        user: Users = Depends(get_current_user)
 ):
-    try:
-        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
-        user_email = payload.get("sub")
-    except jwt.PyJWTError:
-        raise HTTPException(status_code=401, detail="Invalid token")
-
-    # Ensure the user exists
-    user = await Users.get_or_none(email=user_email)
-    if not user:
-        raise HTTPException(status_code=404, detail="User not found")
-    else:
-        user_id = user.id
+    user_id = user.id
 
     # Retrieve the order from the database
     order = await Orders.get_or_none(id=order_id)
@@ -685,20 +634,9 @@ async def get_order_express(
 @api_orders.patch("/{order_id}/confirm")
 async def confirm_order_receipt(
         order_id: int = Path(..., description="The ID of the order to confirm receipt for"),
-        token: str = Depends(oauth2_scheme)
+        user: Users = Depends(get_current_user)
 ):
-    try:
-        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
-        user_email = payload.get("sub")
-    except jwt.PyJWTError:
-        raise HTTPException(status_code=401, detail="Invalid token")
-
-    # Ensure the user exists
-    user = await Users.get_or_none(email=user_email)
-    if not user:
-        raise HTTPException(status_code=404, detail="User not found")
-    else:
-        user_id = user.id
+    user_id = user.id
 
     # Retrieve the order from the database
     order = await Orders.get_or_none(id=order_id)
@@ -717,6 +655,7 @@ async def confirm_order_receipt(
     # Update the order status to 'received' (assuming status=4 for received)
     order.status = 4
     await order.save()
+    await recommend_store.bump_data_version(user.id)
 
     # Respond with no content on successful update
     return {"message": "Order confirmed successfully", "status": 204}
@@ -729,20 +668,9 @@ async def comment_on_product(
         content: str = Body(..., embed=True),
         rate: int = Body(1, embed=True),
         star: int = Body(5, embed=True),
-        token: str = Depends(oauth2_scheme)
+        user: Users = Depends(get_current_user)
 ):
-    try:
-        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
-        user_email = payload.get("sub")
-    except jwt.PyJWTError:
-        raise HTTPException(status_code=401, detail="Invalid token")
-
-    # Ensure the user exists
-    user = await Users.get_or_none(email=user_email)
-    if not user:
-        raise HTTPException(status_code=404, detail="User not found")
-    else:
-        user_id = user.id
+    user_id = user.id
 
     # Retrieve the order
     order = await Orders.get_or_none(id=order_id)
@@ -768,8 +696,8 @@ async def comment_on_product(
     if existing_comment:
         raise HTTPException(status_code=400, detail="此商品已经评论过了")
 
-    # Create the comment
-    comment = await Comments.create(
+    # Create the comment（同时更新商品的评论数和平均星级）
+    comment = await create_goods_comment(
         user_id=user.id,
         order_id=order_id,
         goods_id=goods_id,
@@ -777,6 +705,7 @@ async def comment_on_product(
         rate=rate,
         star=star
     )
+    await recommend_store.bump_data_version(user_id)
 
     return {"message": "Comment added successfully", "comment_id": comment.id}, 201
 
@@ -786,21 +715,10 @@ async def comment_on_product(
 async def simulate_payment(
         type: str,
         order_id: int = Path(..., description="The ID of the order to simulate payment for"),
-        token: str = Depends(oauth2_scheme)
+        user: Users = Depends(get_current_user)
 ):
     payment_type = type
-    try:
-        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
-        user_email = payload.get("sub")
-    except jwt.PyJWTError:
-        raise HTTPException(status_code=401, detail="Invalid token")
-
-    # Ensure the user exists
-    user = await Users.get_or_none(email=user_email)
-    if not user:
-        raise HTTPException(status_code=404, detail="User not found")
-    else:
-        user_id = user.id
+    user_id = user.id
 
     # Retrieve the order
     order = await Orders.get_or_none(id=order_id)
@@ -851,6 +769,7 @@ async def simulate_payment(
     # Update the order status to 'paid'
     order.status = 2
     await order.save()
+    await recommend_store.bump_data_version(user_id)
 
     return payment_details
 
@@ -863,20 +782,9 @@ async def get_payment_qr_code(
         type: str,
         order_id: int = Path(..., description="The ID of the order to generate QR code for"),
         # payment_type: str = Query(..., regex="^(aliyun|wechat)$", description="The payment platform to use"),
-        token: str = Depends(oauth2_scheme)
+        user: Users = Depends(get_current_user)
 ):
-    try:
-        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
-        user_email = payload.get("sub")
-    except jwt.PyJWTError:
-        raise HTTPException(status_code=401, detail="Invalid token")
-
-    # Ensure the user exists
-    user = await Users.get_or_none(email=user_email)
-    if not user:
-        raise HTTPException(status_code=404, detail="User not found")
-    else:
-        user_id = user.id
+    user_id = user.id
 
     # Fetch the order to validate status
     order = await Orders.get_or_none(id=order_id)
@@ -936,20 +844,9 @@ async def get_payment_qr_code(
 @api_orders.get("/{order_id}/status")
 async def get_order_status(
         order_id: int = Path(..., description="The ID of the order to check status for"),
-        token: str = Depends(oauth2_scheme)
+        user: Users = Depends(get_current_user)
 ):
-    try:
-        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
-        user_email = payload.get("sub")
-    except jwt.PyJWTError:
-        raise HTTPException(status_code=401, detail="Invalid token")
-
-    # Ensure the user exists
-    user = await Users.get_or_none(email=user_email)
-    if not user:
-        raise HTTPException(status_code=404, detail="User not found")
-    else:
-        user_id = user.id
+    user_id = user.id
 
     time.sleep(1)
 
@@ -40,41 +40,17 @@ class UpdateUserModel(BaseModel):
 
 
 @api_user.get("", response_model=UserResponseModel)
-async def get_user_details(token: str = Depends(oauth2_scheme)):
-    try:
-        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
-        user_email = payload.get("sub")
-        if not user_email:
-            raise HTTPException(status_code=401, detail="Invalid token")
-        user = await Users.get(email=user_email)
-        if user is None:
-            raise HTTPException(status_code=404, detail="User not found")
-
-    except jwt.PyJWTError:
-        raise HTTPException(status_code=401, detail="Invalid token")
-
+async def get_user_details(user: Users = Depends(get_current_user)):
     return user
 
 
 @api_user.put("", status_code=status.HTTP_204_NO_CONTENT)
-async def update_user_details(user_data: UpdateUserModel, token: str = Depends(oauth2_scheme)):
-    # Decode the JWT token to authenticate and get the user id
-    try:
-        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
-        user_email = payload.get("sub")
-        if not user_email:
-            raise HTTPException(status_code=401, detail="Invalid token")
-    except jwt.PyJWTError:
-        raise HTTPException(status_code=401, detail="Invalid token")
-
-    # Fetch the user from the database
-    user = await Users.get_or_none(email=user_email)
-    if not user:
-        raise HTTPException(status_code=404, detail="User not found")
-
+async def update_user_details(user_data: UpdateUserModel, user: Users = Depends(get_current_user)):
     # Update the user's information
+    # user 可能是本进程缓存中的旧对象，只写 name，避免覆盖其它 worker 修改过的密码、邮箱、锁定状态
     user.name = user_data.name
-    await user.save()
+    await user.save(update_fields=['name', 'updated_at'])
+    user_cache.invalidate(user.email)
 
     return {}
 
@@ -112,7 +88,8 @@ async def update_avatar(avatar: UploadFile = File(...), token: str = Depends(oau
     # Update user's avatar URL
     avatar_url = f'https://{BUCKET_NAME}.{ENDPOINT}/{object_name}'
     user.avatar = avatar_url
-    await user.save()
+    await user.save(update_fields=['avatar', 'updated_at'])
+    user_cache.invalidate(user.email)
 
     return {}
 
@@ -156,6 +133,7 @@ async def update_avatar(avatar: UploadFile = File(...), token: str = Depends(oau
 
     # Update user's avatar URL
     user.avatar = f"{user_id}/{unique_filename}"
-    await user.save()
+    await user.save(update_fields=['avatar', 'updated_at'])
+    user_cache.invalidate(user.email)
 
     return {}
@@ -0,0 +1,90 @@
+# -*- coding: utf-8 -*-
+# @Time    : 2024/5/21 16:20
+# @Author  : KuangRen777
+# @File    : category_tree.py
+# @Tags    : 分类树缓存
+import asyncio
+import time
+
+from models import Category
+
+CATEGORY_TREE_VERSION_KEY = "category:tree:version"
+
+
+def build_tree(elements, parent_id=0):
+    # 先按 pid 分组再自顶向下组装，每个元素只访问一次，O(n)
+    children_of = {}
+    for element in elements:
+        children_of.setdefault(element.pid, []).append(element)
+
+    def build(pid):
+        branch = []
+        # pop 保证每组只展开一次，数据中出现环也不会死循环
+        for element in children_of.pop(pid, []):
+            node = {
+                'id': element.id,
+                'pid': element.pid,
+                'name': element.name,
+                'level': element.level,
+                'status': element.status,
+                'seq': 1
+            }
+            children = build(element.id)
+            if children:  # 只有当有子分类时才添加 `children` 字段
+                node['children'] = children
+            branch.append(node)
+        return branch
+
+    return build(parent_id)
+
+
+class CategoryTreeCache:
+    """
+    进程内的菜单分类树快照。
+
+    版本号保存在 Redis 中，后台分类的新增、修改、状态和排序接口调用 bump() 使其加一。
+    每个 worker 最多每 check_interval 秒读一次版本号，版本变化时才重新查询分类表，
+    平时列表接口不会访问分类表。
+    """
+
+    def __init__(self, redis_client, group='menu', check_interval=1.0):
+        self.redis = redis_client
+        self.group = group
+        self.check_interval = check_interval
+        self.version = None
+        self.tree = None
+        self.rebuilds = 0
+        self._checked_at = 0.0
+        self._lock = asyncio.Lock()
+
+    async def _remote_version(self):
+        return int(await self.redis.get(CATEGORY_TREE_VERSION_KEY) or 0)
+
+    async def get(self):
+        if self.tree is not None and time.monotonic() - self._checked_at < self.check_interval:
+            return self.tree
+
+        async with self._lock:
+            if self.tree is not None and time.monotonic() - self._checked_at < self.check_interval:
+                return self.tree
+
+            # 先读版本再查表：查表期间版本若有变化，下次检查时会再重建
+            version = await self._remote_version()
+            if self.tree is None or version != self.version:
+                categories = await Category.filter(group=self.group).all()
+                self.tree = build_tree(categories)
+                self.version = version
+                self.rebuilds += 1
+            self._checked_at = time.monotonic()
+            return self.tree
+
+    async def bump(self):
+        # 分类数据变更后调用，本 worker 立即失效，其它 worker 在下次检查时重建
+        self.version = await self.redis.incr(CATEGORY_TREE_VERSION_KEY)
+        self.tree = None
+
+    def stats(self):
+        return {
+            "version": self.version,
+            "rebuilds": self.rebuilds,
+        }
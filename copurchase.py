@@ -0,0 +1,220 @@
+# -*- coding: utf-8 -*-
+# @Time    : 2024/5/26 10:15
+# @Author  : KuangRen777
+# @File    : copurchase.py
+# @Tags    : 共同购买
+"""
+进程内的商品共同购买（item-to-item）引擎，不依赖 Neo4j。
+
+用 Orders/OrderDetails 构建 用户×商品 的 0/1 稀疏矩阵 X（scipy.sparse），
+共同购买次数 C = Xᵀ·X（对角线清零），C[i, j] 即同时买过商品 i 和 j 的用户数。
+每个商品的前 top_k 个邻居保存在两个紧凑数组中（商品下标 int32、得分 float32），查询时直接按行读取。
+新订单通过 add_order 增量并入：只把新增的商品对累加到 C 上，并重新计算受影响的行。
+所有数据保存在一个状态字典中，构建和增量更新都生成新的状态后整体替换（增量更新先复制各个容器再修改），
+读者一次取出状态字典，不加锁，也不会看到修改到一半的数据。
+"""
+import asyncio
+import threading
+
+import numpy as np
+from scipy import sparse
+
+from models import OrderDetails
+
+
+class CoPurchaseEngine:
+    def __init__(self, top_k=20, rebuild_interval=3600):
+        self.top_k = top_k
+        self.rebuild_interval = rebuild_interval
+        self._task = None
+        # 只在写入（增量更新、替换状态）时加锁；读者一次取出 _state，得到一份前后一致的数据
+        self._lock = threading.Lock()
+        self._state = self._make_state([], {}, {}, sparse.csr_matrix((0, 0), dtype=np.float32),
+                                       np.empty((0, top_k), dtype=np.int32), np.empty((0, top_k), dtype=np.float32))
+        self._replay = None  # 全量构建期间到达的订单，替换状态后重新并入
+
+    @staticmethod
+    def _make_state(item_ids, item_index, user_items, cooccurrence, neighbors, scores):
+        # item_ids: 下标 -> 商品ID；item_index: 商品ID -> 下标；user_items: 用户ID -> 买过的商品下标（frozenset）
+        return {
+            "item_ids": item_ids,
+            "item_index": item_index,
+            "user_items": user_items,
+            "cooccurrence": cooccurrence,
+            "neighbors": neighbors,
+            "scores": scores,
+        }
+
+    @staticmethod
+    def _index_of(item_ids, item_index, goods_id):
+        index = item_index.get(goods_id)
+        if index is None:
+            index = len(item_ids)
+            item_index[goods_id] = index
+            item_ids.append(goods_id)
+        return index
+
+    def _top_k_rows(self, cooccurrence, rows, neighbors, scores):
+        # 只在每行的非零元素中取前 top_k，不展开稠密矩阵
+        for row in rows:
+            start, end = cooccurrence.indptr[row], cooccurrence.indptr[row + 1]
+            indices, data = cooccurrence.indices[start:end], cooccurrence.data[start:end]
+            neighbors[row] = -1
+            scores[row] = 0
+            if len(data) == 0:
+                continue
+            k = min(self.top_k, len(data))
+            top = np.argpartition(-data, k - 1)[:k]
+            top = top[np.argsort(-data[top], kind='stable')]
+            neighbors[row, :k] = indices[top]
+            scores[row, :k] = data[top]
+
+    def build(self, purchases):
+        """
+        purchases 为 (用户ID, 商品ID) 序列，同一用户多次购买同一商品只算一次。
+        全部在局部变量中计算，最后一次性替换状态，计算期间不持有锁。
+        """
+        with self._lock:
+            self._replay = []
+
+        item_ids, item_index, owned_sets = [], {}, {}
+        for user_id, goods_id in purchases:
+            owned_sets.setdefault(user_id, set()).add(self._index_of(item_ids, item_index, goods_id))
+        user_items = {user_id: frozenset(items) for user_id, items in owned_sets.items()}
+
+        rows, cols = [], []
+        for user_row, items in enumerate(user_items.values()):
+            rows.extend([user_row] * len(items))
+            cols.extend(items)
+        n_items = len(item_ids)
+        matrix = sparse.csr_matrix(
+            (np.ones(len(rows), dtype=np.float32), (rows, cols)),
+            shape=(len(user_items), n_items),
+        )
+
+        cooccurrence = (matrix.T @ matrix).tocsr()
+        cooccurrence.setdiag(0)
+        cooccurrence.eliminate_zeros()
+
+        neighbors = np.full((n_items, self.top_k), -1, dtype=np.int32)
+        scores = np.zeros((n_items, self.top_k), dtype=np.float32)
+        self._top_k_rows(cooccurrence, range(n_items), neighbors, scores)
+
+        with self._lock:
+            self._state = self._make_state(item_ids, item_index, user_items, cooccurrence, neighbors, scores)
+            replay, self._replay = self._replay, None
+            # 构建期间到达的订单可能不在读出的数据中，重新并入（同一用户重复购买的商品会被忽略）
+            for user_id, goods_ids in replay:
+                self._add_order(user_id, goods_ids)
+
+    async def load(self):
+        # 从数据库全量构建（只取两列），矩阵计算放到线程中执行
+        purchases = await OrderDetails.all().values_list('order__user_id', 'goods_id')
+        await asyncio.to_thread(self.build, purchases)
+        return len(self._state["item_ids"])
+
+    async def _rebuild_loop(self):
+        # 增量只包含本进程处理的订单，定期全量重建以并入其它 worker 的订单
+        while True:
+            await asyncio.sleep(self.rebuild_interval)
+            try:
+                await self.load()
+            except Exception as e:
+                print(f"Error rebuilding co-purchase engine: {e}")
+
+    async def start(self):
+        await self.load()
+        self._task = asyncio.create_task(self._rebuild_loop())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    def add_order(self, user_id, goods_ids):
+        # 增量并入一个订单，涉及稀疏矩阵相加，调用方应放到线程中执行（asyncio.to_thread）
+        with self._lock:
+            if self._replay is not None:
+                self._replay.append((user_id, list(goods_ids)))
+            self._add_order(user_id, goods_ids)
+
+    def _add_order(self, user_id, goods_ids):
+        # 在 self._lock 内调用：新商品与该用户已买过的商品、以及新商品之间两两加一，生成新的状态
+        state = self._state
+        owned = state["user_items"].get(user_id, frozenset())
+        if all(state["item_index"].get(goods_id) in owned for goods_id in goods_ids):
+            return
+        # 复制容器后再修改，读者手里的旧状态保持不变（与下面复制的矩阵相比，复制这几个容器的开销可以忽略）
+        item_ids, item_index, user_items = list(state["item_ids"]), dict(state["item_index"]), dict(state["user_items"])
+        new_items = {self._index_of(item_ids, item_index, goods_id) for goods_id in goods_ids} - owned
+
+        rows, cols = [], []
+        new_list = sorted(new_items)
+        for i, item in enumerate(new_list):
+            for other in owned:
+                rows.extend((item, other))
+                cols.extend((other, item))
+            for other in new_list[i + 1:]:
+                rows.extend((item, other))
+                cols.extend((other, item))
+
+        n_items = len(item_ids)
+        cooccurrence = state["cooccurrence"]
+        if cooccurrence.shape[0] < n_items:
+            cooccurrence = cooccurrence.copy()
+            cooccurrence.resize((n_items, n_items))
+        if rows:
+            delta = sparse.csr_matrix((np.ones(len(rows), dtype=np.float32), (rows, cols)),
+                                      shape=(n_items, n_items))
+            cooccurrence = (cooccurrence + delta).tocsr()
+
+        neighbors, scores = state["neighbors"], state["scores"]
+        if neighbors.shape[0] < n_items:
+            extra = n_items - neighbors.shape[0]
+            neighbors = np.vstack([neighbors, np.full((extra, self.top_k), -1, dtype=np.int32)])
+            scores = np.vstack([scores, np.zeros((extra, self.top_k), dtype=np.float32)])
+        else:
+            neighbors, scores = neighbors.copy(), scores.copy()
+
+        # 只有出现在新增商品对中的行需要重新计算前 top_k
+        self._top_k_rows(cooccurrence, set(rows), neighbors, scores)
+        user_items[user_id] = owned | new_items
+        self._state = self._make_state(item_ids, item_index, user_items, cooccurrence, neighbors, scores)
+
+    def neighbors(self, goods_id, k=10):
+        # 返回 [(商品ID, 共同购买次数), ...]
+        state = self._state
+        neighbors, scores, item_ids = state["neighbors"], state["scores"], state["item_ids"]
+        index = state["item_index"].get(goods_id)
+        if index is None or index >= len(neighbors):
+            return []
+        return [(item_ids[n], float(s)) for n, s in zip(neighbors[index, :k], scores[index, :k]) if n >= 0]
+
+    def recommend_for_user(self, user_id, k=10):
+        # 汇总用户买过的每个商品的邻居得分，排除已买过的商品
+        state = self._state
+        owned = state["user_items"].get(user_id, frozenset())
+        if not owned:
+            return []
+        neighbors, scores, item_ids = state["neighbors"], state["scores"], state["item_ids"]
+        totals = {}
+        for item in owned:
+            if item >= len(neighbors):
+                continue
+            for n, s in zip(neighbors[item], scores[item]):
+                if n >= 0 and n not in owned:
+                    totals[n] = totals.get(n, 0.0) + float(s)
+        ranked = sorted(totals.items(), key=lambda x: x[1], reverse=True)[:k]
+        return [(item_ids[n], score) for n, score in ranked]
+
+    def stats(self):
+        state = self._state
+        return {
+            "items": len(state["item_ids"]),
+            "users": len(state["user_items"]),
+            "nnz": int(state["cooccurrence"].nnz),
+        }
@@ -3,28 +3,203 @@
 # @Author  : KuangRen777
 # @File    : email_sender.py
 # @Tags    :
+"""
+邮件发送。
+
+接口中只把邮件写入 Redis 发件箱（列表），由 EmailOutbox 后台线程批量取出，
+复用同一个 SMTP 连接发送，接口不再等待 SMTP 握手和发送。
+
+本地调试可以用 aiosmtpd 代替真实的 SMTP 服务器：
+    python -m aiosmtpd -n -l 127.0.0.1:8025
+并在 settings.py 中设置 EMAIL_SMTP_HOST='127.0.0.1'、EMAIL_SMTP_PORT=8025、
+EMAIL_SMTP_STARTTLS=False、EMAIL_SMTP_LOGIN=False。
+"""
+import json
 import smtplib
+import threading
+import time
 from email.mime.text import MIMEText
 from email.mime.multipart import MIMEMultipart
 
+import redis
+
 from PASSWORD import *
+from settings import (EMAIL_SMTP_HOST, EMAIL_SMTP_PORT, EMAIL_SMTP_STARTTLS, EMAIL_SMTP_LOGIN, EMAIL_OUTBOX_KEY,
+                      EMAIL_OUTBOX_BATCH_SIZE, EMAIL_SMTP_IDLE_TIMEOUT, EMAIL_MAX_ATTEMPTS, REDIS_HOST, REDIS_PORT,
+                      REDIS_DB)
 
 
-def send_verification_email(email: str, code: str):
+def build_message(email: str, subject: str, body: str):
     # 创建邮件对象
     message = MIMEMultipart()
     message["From"] = sender_email
     message["To"] = email
-    message["Subject"] = "Your Verification Code From 子午商城"
-
-    # 邮件正文内容
-    body = f"Here is your verification code: {code}. It will expire in 10 minutes."
+    message["Subject"] = subject
     message.attach(MIMEText(body, "plain"))
+    return message
+
+
+def verification_email_payload(email: str, code: str) -> str:
+    # 发件箱中的一条记录，由接口写入 EMAIL_OUTBOX_KEY
+    return json.dumps({
+        "to": email,
+        "subject": "Your Verification Code From 子午商城",
+        "body": f"Here is your verification code: {code}. It will expire in 10 minutes.",
+        "attempts": 0,
+    })
+
 
-    # 使用SMTP服务发送邮件
-    server = smtplib.SMTP('smtp.163.com', 25)  # 服务器地址和端口
-    server.starttls()  # 启用安全传输模式
-    server.login(sender_email, sender_password)
-    text = message.as_string()
-    server.sendmail(sender_email, email, text)
+def connect_smtp():
+    server = smtplib.SMTP(EMAIL_SMTP_HOST, EMAIL_SMTP_PORT, timeout=30)  # 服务器地址和端口
+    if EMAIL_SMTP_STARTTLS:
+        server.starttls()  # 启用安全传输模式
+    if EMAIL_SMTP_LOGIN:
+        server.login(sender_email, sender_password)
+    return server
+
+
+def send_verification_email(email: str, code: str):
+    # 同步发送单封邮件（脚本中使用），接口请写入发件箱
+    payload = json.loads(verification_email_payload(email, code))
+    message = build_message(email, payload["subject"], payload["body"])
+
+    server = connect_smtp()
+    server.sendmail(sender_email, email, message.as_string())
     server.quit()
+
+
+class EmailOutbox:
+    """
+    发件箱消费者，在后台线程中运行。
+
+    每次阻塞等待一封邮件，再非阻塞地多取 batch_size - 1 封，同一批邮件通过同一个 SMTP 连接发送；
+    连接在空闲 idle_timeout 秒后才关闭，下一批邮件可以直接复用。发送失败的邮件重新放回发件箱，
+    最多尝试 max_attempts 次。
+    """
+
+    def __init__(self, redis_client=None, key=EMAIL_OUTBOX_KEY, batch_size=EMAIL_OUTBOX_BATCH_SIZE,
+                 idle_timeout=EMAIL_SMTP_IDLE_TIMEOUT, max_attempts=EMAIL_MAX_ATTEMPTS):
+        # 消费者在独立线程中阻塞读取，使用自己的同步连接
+        self.redis = redis_client or redis.Redis(host=REDIS_HOST, port=REDIS_PORT, db=REDIS_DB, decode_responses=True)
+        self.key = key
+        self.batch_size = batch_size
+        self.idle_timeout = idle_timeout
+        self.max_attempts = max_attempts
+        self.sent = 0
+        self.failed = 0
+        self._server = None
+        self._last_used = 0
+        self._stop = threading.Event()
+        self._thread = None
+
+    def _get_server(self):
+        if self._server is None:
+            self._server = connect_smtp()
+        return self._server
+
+    def _close_server(self):
+        if self._server is not None:
+            try:
+                self._server.quit()
+            except (smtplib.SMTPException, OSError):
+                pass
+            self._server = None
+
+    def _send(self, payload):
+        message = build_message(payload["to"], payload["subject"], payload["body"])
+        try:
+            self._get_server().sendmail(sender_email, payload["to"], message.as_string())
+        except (smtplib.SMTPServerDisconnected, OSError):
+            # 连接已被服务器关闭，重连后再试一次
+            self._close_server()
+            self._get_server().sendmail(sender_email, payload["to"], message.as_string())
+
+    def _requeue(self, payload):
+        payload["attempts"] = payload.get("attempts", 0) + 1
+        if payload["attempts"] < self.max_attempts:
+            self.redis.rpush(self.key, json.dumps(payload))
+        else:
+            self.failed += 1
+            print(f"Error sending email to {payload['to']}: giving up after {payload['attempts']} attempts")
+
+    def drain_once(self, timeout=1):
+        # 处理一批邮件，返回本批成功发送的数量
+        item = self.redis.blpop(self.key, timeout=timeout)
+        if item is None:
+            if self._server is not None and time.monotonic() - self._last_used > self.idle_timeout:
+                self._close_server()
+            return 0
+
+        raw_items = [item[1]]
+        while len(raw_items) < self.batch_size:
+            raw = self.redis.lpop(self.key)
+            if raw is None:
+                break
+            raw_items.append(raw)
+
+        sent = 0
+        for raw in raw_items:
+            try:
+                payload = json.loads(raw)
+                to, _, _ = payload["to"], payload["subject"], payload["body"]
+            except (ValueError, KeyError, TypeError) as e:
+                # 格式错误的邮件丢弃，不影响同一批中的其它邮件
+                self.failed += 1
+                print(f"Invalid email payload {raw!r}: {e}")
+                continue
+            try:
+                self._send(payload)
+                sent += 1
+            except (smtplib.SMTPException, OSError) as e:
+                print(f"Error sending email to {to}: {e}")
+                self._close_server()
+                try:
+                    self._requeue(payload)
+                except redis.RedisError as e:
+                    # 放不回队列时只能放弃这一封，本批其它邮件继续发送
+                    self.failed += 1
+                    print(f"Error requeueing email to {to}: {e}")
+            except Exception as e:
+                self.failed += 1
+                print(f"Error sending email to {to}: {e}")
+
+        self.sent += sent
+        self._last_used = time.monotonic()
+        return sent
+
+    def run(self):
+        while not self._stop.is_set():
+            try:
+                self.drain_once()
+            except Exception as e:
+                # 任何错误都不能让发件线程退出，否则之后的验证邮件都不会再发送
+                print(f"Error processing email outbox: {e}")
+                time.sleep(1)
+        self._close_server()
+
+    def start(self):
+        self._stop.clear()
+        self._thread = threading.Thread(target=self.run, name='email-outbox', daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=5)
+            self._thread = None
+
+    def stats(self):
+        return {
+            "sent": self.sent,
+            "failed": self.failed,
+            "connected": self._server is not None,
+        }
+
+
+# 单独运行发件箱消费者
+if __name__ == "__main__":
+    outbox = EmailOutbox()
+    try:
+        outbox.run()
+    except KeyboardInterrupt:
+        outbox.stop()
@@ -0,0 +1,87 @@
+# -*- coding: utf-8 -*-
+# @Time    : 2024/5/23 9:40
+# @Author  : KuangRen777
+# @File    : goods_counters.py
+# @Tags    : 商品评论计数
+"""
+Goods 上冗余保存的评论数（comments_count）和平均星级（star_avg）。
+
+新增、删除评论都通过这里完成：在同一个事务中锁住商品行、写评论，再用该商品的评论
+（comments.goods_id 有索引）重新计算两个字段，列表接口直接读取/排序，不再 JOIN + GROUP BY。
+
+数据不一致时（例如直接改过数据库）运行：
+    python goods_counters.py
+"""
+import asyncio
+
+from tortoise.functions import Avg, Count
+from tortoise.transactions import in_transaction
+
+from models import Goods, Comments
+
+
+async def _refresh_goods(goods_id, connection):
+    stats = await Comments.filter(goods_id=goods_id).using_db(connection).annotate(
+        count=Count('id'), avg=Avg('star')).values('count', 'avg')
+    count = stats[0]['count'] if stats else 0
+    avg = stats[0]['avg'] if stats else None
+    await Goods.filter(id=goods_id).using_db(connection).update(
+        comments_count=count or 0,
+        star_avg=round(float(avg), 2) if avg is not None else 0,
+    )
+
+
+async def _lock_goods(goods_id, connection):
+    # 锁住商品行，同一商品的评论计数串行更新
+    await Goods.select_for_update().using_db(connection).filter(id=goods_id).first()
+
+
+async def create_goods_comment(**kwargs):
+    goods_id = kwargs['goods_id']
+    async with in_transaction() as connection:
+        await _lock_goods(goods_id, connection)
+        comment = await Comments.create(using_db=connection, **kwargs)
+        await _refresh_goods(goods_id, connection)
+    return comment
+
+
+async def delete_goods_comment(comment):
+    goods_id = comment.goods_id
+    async with in_transaction() as connection:
+        await _lock_goods(goods_id, connection)
+        await comment.delete(using_db=connection)
+        await _refresh_goods(goods_id, connection)
+
+
+async def reconcile():
+    # 全量重建：一次分组查询得到所有商品的统计，再逐个写回有差异的商品
+    stats = await Comments.annotate(count=Count('id'), avg=Avg('star')).group_by('goods_id').values(
+        'goods_id', 'count', 'avg')
+    expected = {
+        row['goods_id']: (row['count'], round(float(row['avg']), 2) if row['avg'] is not None else 0)
+        for row in stats
+    }
+
+    fixed = 0
+    for goods in await Goods.all().values('id', 'comments_count', 'star_avg'):
+        count, avg = expected.get(goods['id'], (0, 0))
+        if goods['comments_count'] != count or abs((goods['star_avg'] or 0) - avg) > 1e-6:
+            await Goods.filter(id=goods['id']).update(comments_count=count, star_avg=avg)
+            fixed += 1
+    return fixed
+
+
+async def main():
+    from tortoise import Tortoise
+    from settings import TORTOISE_ORM
+
+    await Tortoise.init(config=TORTOISE_ORM)
+    try:
+        fixed = await reconcile()
+        print(f"Goods comment counters reconciled: {fixed} goods updated")
+    finally:
+        await Tortoise.close_connections()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
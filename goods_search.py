@@ -0,0 +1,172 @@
+# -*- coding: utf-8 -*-
+# @Time    : 2024/5/22 14:30
+# @Author  : KuangRen777
+# @File    : goods_search.py
+# @Tags    : 商品搜索
+"""
+商品全文搜索（jieba 分词 + Redis 倒排索引）。
+
+    search:term:{词}   有序集合，商品ID -> 该词在商品中的权重（标题中出现记 2，描述中出现记 1）
+    search:doc:{商品ID} 集合，该商品被索引的词，更新商品时用来删除旧的倒排项
+    search:docs        集合，已索引的商品ID，用于计算 idf
+    search:version     索引格式版本，与 INDEX_VERSION 不同时启动时重建
+
+标题中的每个汉字也单独索引（权重 1）：jieba 会把“养生茶”切成 养生/生茶/养生茶，
+不单独索引时搜“茶”找不到它。
+
+查询时把查询词对应的倒排表按 idf 加权合并（ZUNIONSTORE），按得分从高到低返回商品ID，
+耗时只与查询词的倒排表长度有关，不再对 Goods 表做 LIKE '%x%' 全表扫描。
+
+首次部署或需要重建时单独运行：
+    python goods_search.py
+"""
+import asyncio
+import math
+import uuid
+from collections import Counter
+
+import jieba
+
+from models import Goods
+
+TERM_KEY_PREFIX = "search:term:"
+DOC_KEY_PREFIX = "search:doc:"
+DOCS_KEY = "search:docs"
+VERSION_KEY = "search:version"
+INDEX_VERSION = 2
+# 不放在 search: 前缀下，全量重建清空索引时不会删掉它
+REBUILD_LOCK_KEY = "goods_search:rebuild_lock"
+REBUILD_LOCK_TTL = 600
+
+TITLE_WEIGHT = 2
+TITLE_CHAR_WEIGHT = 1
+DESCRIPTION_WEIGHT = 1
+
+
+def tokenize(text):
+    # 搜索引擎模式分词，长词会再切出短词；丢掉纯空白和标点
+    if not text:
+        return []
+    return [token for token in jieba.lcut_for_search(text.lower()) if any(ch.isalnum() for ch in token)]
+
+
+def is_cjk(ch):
+    return '\u4e00' <= ch <= '\u9fff'
+
+
+def term_weights(title, description):
+    weights = Counter()
+    for token in tokenize(title):
+        weights[token] += TITLE_WEIGHT
+    # 单字再索引一次，单字查询（如“茶”）也能命中
+    for ch in set((title or '').lower()):
+        if is_cjk(ch):
+            weights[ch] += TITLE_CHAR_WEIGHT
+    for token in tokenize(description):
+        weights[token] += DESCRIPTION_WEIGHT
+    return weights
+
+
+class GoodsSearch:
+    def __init__(self, redis_client, max_results=200):
+        self.redis = redis_client
+        self.max_results = max_results
+
+    async def index_goods(self, goods_id, title, description):
+        # 新增或修改商品后调用，先删除旧的倒排项再写入新的
+        doc_key = f"{DOC_KEY_PREFIX}{goods_id}"
+        old_tokens = await self.redis.smembers(doc_key)
+        weights = term_weights(title, description)
+
+        async with self.redis.pipeline(transaction=True) as pipe:
+            for token in old_tokens:
+                pipe.zrem(f"{TERM_KEY_PREFIX}{token}", goods_id)
+            pipe.delete(doc_key)
+            for token, weight in weights.items():
+                pipe.zadd(f"{TERM_KEY_PREFIX}{token}", {goods_id: weight})
+            if weights:
+                pipe.sadd(doc_key, *weights.keys())
+            pipe.sadd(DOCS_KEY, goods_id)
+            await pipe.execute()
+
+    async def remove_goods(self, goods_id):
+        doc_key = f"{DOC_KEY_PREFIX}{goods_id}"
+        old_tokens = await self.redis.smembers(doc_key)
+        async with self.redis.pipeline(transaction=True) as pipe:
+            for token in old_tokens:
+                pipe.zrem(f"{TERM_KEY_PREFIX}{token}", goods_id)
+            pipe.delete(doc_key)
+            pipe.srem(DOCS_KEY, goods_id)
+            await pipe.execute()
+
+    async def search(self, text, limit=None):
+        """
+        返回按相关度排序的 {商品ID: 得分}（字典保持从高到低的顺序）。
+        limit 默认为 max_results，为 0 时返回全部匹配的商品。
+        """
+        tokens = list(dict.fromkeys(tokenize(text)))
+        if not tokens:
+            return {}
+        if limit is None:
+            limit = self.max_results
+
+        term_keys = [f"{TERM_KEY_PREFIX}{token}" for token in tokens]
+        async with self.redis.pipeline(transaction=False) as pipe:
+            pipe.scard(DOCS_KEY)
+            for key in term_keys:
+                pipe.zcard(key)
+            total, *doc_freqs = await pipe.execute()
+
+        # idf 加权，不出现在任何商品中的词直接跳过
+        weights = {key: math.log(1 + total / df) for key, df in zip(term_keys, doc_freqs) if df}
+        if not weights:
+            return {}
+
+        tmp_key = f"search:tmp:{uuid.uuid4().hex}"
+        async with self.redis.pipeline(transaction=True) as pipe:
+            pipe.zunionstore(tmp_key, weights, aggregate='SUM')
+            pipe.zrevrange(tmp_key, 0, limit - 1, withscores=True)
+            pipe.delete(tmp_key)
+            _, ranked, _ = await pipe.execute()
+
+        return {int(goods_id): score for goods_id, score in ranked}
+
+    async def rebuild(self):
+        # 全量重建：清空旧索引后逐个写入
+        async for key in self.redis.scan_iter(match="search:*"):
+            await self.redis.delete(key)
+        goods_list = await Goods.all().values('id', 'title', 'description')
+        for goods in goods_list:
+            await self.index_goods(goods['id'], goods['title'], goods['description'])
+        await self.redis.set(VERSION_KEY, INDEX_VERSION)
+        return len(goods_list)
+
+    async def ensure_index(self):
+        # 启动时调用，索引不存在或格式已过期时全量构建一次；多个 worker 同时启动时只由拿到锁的一个构建
+        version = await self.redis.get(VERSION_KEY)
+        if version is not None and int(version) == INDEX_VERSION:
+            return
+        if not await self.redis.set(REBUILD_LOCK_KEY, 1, nx=True, ex=REBUILD_LOCK_TTL):
+            return
+        try:
+            count = await self.rebuild()
+            print(f"Goods search index built: {count} goods")
+        finally:
+            await self.redis.delete(REBUILD_LOCK_KEY)
+
+
+async def main():
+    from tortoise import Tortoise
+    from settings import TORTOISE_ORM
+    from utils import redis_client
+
+    await Tortoise.init(config=TORTOISE_ORM)
+    try:
+        count = await GoodsSearch(redis_client).rebuild()
+        print(f"Goods search index rebuilt: {count} goods")
+    finally:
+        await Tortoise.close_connections()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
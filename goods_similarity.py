@@ -0,0 +1,331 @@
+# -*- coding: utf-8 -*-
+# @Time    : 2024/5/27 09:40
+# @Author  : KuangRen777
+# @File    : goods_similarity.py
+# @Tags    : 商品间相似度
+"""
+基于 TF-IDF 的商品间相似度（“猜你喜欢”）。
+
+每个商品的文本为 标题 + 描述 + 该商品的评价内容，用 jieba 分词后做 TF-IDF（向量已 L2 归一化，
+点积即余弦相似度）。商品数不超过 exact_limit 时分块精确计算，超过后改用 LSH 近似最近邻（ann_index），
+不需要 N×N 的相似度矩阵。只保存每个商品最相似的 top_k 个商品，以版本化快照（snapshot.py）落盘到
+RECOMMEND_DATA_DIR/goods_similarity：
+
+    item_ids.npy / neighbors.npy / scores.npy  商品ID(int32)、邻居下标(int32, 不足补 -1)、相似度(float32)
+    ann_index.npz                              TF-IDF 向量的 LSH 索引，单个商品更新时用来查找与它相似的商品
+    vectorizer.joblib                          拟合好的 TfidfVectorizer（词表和 idf）
+
+各 worker 启动时只内存映射三个邻居数组；TF-IDF 模型和 LSH 索引只在更新商品时才从同一版本中加载。
+管理员新增或修改商品后调用 update_goods 只更新这一个商品（词表不变，新词在下次全量构建时才生效），
+保存为新版本；其它 worker 的后台任务每 check_interval 秒检查一次版本，发现变化后切换。首次部署或需要全量重建时单独运行：
+    python goods_similarity.py
+"""
+import asyncio
+import os
+import threading
+
+import joblib
+import numpy as np
+from sklearn.feature_extraction.text import TfidfVectorizer
+
+from ann_index import LSHIndex
+from goods_search import tokenize
+from models import Goods, Comments
+from snapshot import save_snapshot, load_snapshot, current_mtime, version_path, rebuild_lock
+
+SNAPSHOT_DIR = "goods_similarity"
+INDEX_FILE = "ann_index.npz"
+VECTORIZER_FILE = "vectorizer.joblib"
+
+
+async def goods_texts(goods_ids=None):
+    # 返回 {商品ID: 文本}；goods_ids 为空时取全部商品
+    goods_query = Goods.all() if goods_ids is None else Goods.filter(id__in=goods_ids)
+    comments_query = Comments.all() if goods_ids is None else Comments.filter(goods_id__in=goods_ids)
+    goods_list = await goods_query.values('id', 'title', 'description')
+    comments = await comments_query.values_list('goods_id', 'content')
+
+    texts = {goods['id']: [goods['title'] or '', goods['description'] or ''] for goods in goods_list}
+    for goods_id, content in comments:
+        if goods_id in texts and content:
+            texts[goods_id].append(content)
+    return {goods_id: ' '.join(parts) for goods_id, parts in texts.items()}
+
+
+class GoodsSimilarity:
+    def __init__(self, data_dir, top_k=20, chunk_size=1024, exact_limit=5000, lsh_tables=16, lsh_bits=6,
+                 check_interval=30):
+        self.data_dir = data_dir
+        self.root = os.path.join(data_dir, SNAPSHOT_DIR)
+        self.check_interval = check_interval
+        self._task = None
+        self.top_k = top_k
+        self.chunk_size = chunk_size
+        self.exact_limit = exact_limit
+        self.lsh_tables = lsh_tables
+        self.lsh_bits = lsh_bits
+        self._lock = threading.Lock()
+        self._vectorizer = None
+        self._ann = None
+        self._item_ids = np.empty(0, dtype=np.int32)
+        self._item_index = {}
+        # 查询用的只读视图，整体替换，事件循环中读取时不需要等 self._lock
+        self._view = (self._item_ids, self._item_index, np.empty((0, top_k), dtype=np.int32),
+                      np.empty((0, top_k), dtype=np.float32))
+        self._neighbors = np.empty((0, top_k), dtype=np.int32)
+        self._scores = np.empty((0, top_k), dtype=np.float32)
+        self._loaded_mtime = None
+        self.version = None
+
+    def _top_k(self, similarity, exclude):
+        # similarity 为若干行稠密相似度，exclude 为每行需要排除的列（商品自身）
+        k = min(self.top_k, similarity.shape[1] - 1)
+        neighbors = np.full((similarity.shape[0], self.top_k), -1, dtype=np.int32)
+        scores = np.zeros((similarity.shape[0], self.top_k), dtype=np.float32)
+        if k <= 0:
+            return neighbors, scores
+        similarity[np.arange(similarity.shape[0]), exclude] = -1
+        top = np.argpartition(-similarity, k - 1, axis=1)[:, :k]
+        top_scores = np.take_along_axis(similarity, top, axis=1)
+        order = np.argsort(-top_scores, axis=1, kind='stable')
+        top, top_scores = np.take_along_axis(top, order, axis=1), np.take_along_axis(top_scores, order, axis=1)
+        # 相似度为 0 的不算邻居
+        top[top_scores <= 0] = -1
+        neighbors[:, :k], scores[:, :k] = top, np.maximum(top_scores, 0)
+        return neighbors, scores
+
+    def build(self, texts):
+        """
+        texts 为 {商品ID: 文本}，全量拟合 TF-IDF 并计算每个商品的 top_k 邻居。
+        """
+        item_ids = np.fromiter(texts.keys(), dtype=np.int32, count=len(texts))
+        vectorizer = TfidfVectorizer(tokenizer=tokenize, lowercase=False, token_pattern=None, dtype=np.float32)
+        vectors = vectorizer.fit_transform(texts.values()).tocsr()
+        ann = LSHIndex(vectors.shape[1], n_tables=self.lsh_tables, n_bits=self.lsh_bits)
+        ann.build(vectors, item_ids)
+
+        neighbors = np.full((len(item_ids), self.top_k), -1, dtype=np.int32)
+        scores = np.zeros((len(item_ids), self.top_k), dtype=np.float32)
+        if len(item_ids) <= self.exact_limit:
+            # 分块精确计算，避免一次展开 n×n 的稠密矩阵
+            vectors_t = vectors.T.tocsc()
+            for start in range(0, len(item_ids), self.chunk_size):
+                end = min(start + self.chunk_size, len(item_ids))
+                similarity = (vectors[start:end] @ vectors_t).toarray()
+                neighbors[start:end], scores[start:end] = self._top_k(similarity, np.arange(start, end))
+        else:
+            item_index = {int(goods_id): index for index, goods_id in enumerate(item_ids)}
+            for index, goods_id in enumerate(item_ids):
+                similar = ann.query(vectors[index], self.top_k, exclude=[goods_id])
+                neighbors[index, :len(similar)] = [item_index[other] for other, _ in similar]
+                scores[index, :len(similar)] = [score for _, score in similar]
+
+        with self._lock:
+            self._vectorizer, self._ann = vectorizer, ann
+            self._set_neighbors(item_ids, neighbors, scores)
+
+    def _set_neighbors(self, item_ids, neighbors, scores):
+        item_index = {int(goods_id): index for index, goods_id in enumerate(item_ids)}
+        self._item_ids, self._item_index, self._neighbors, self._scores = item_ids, item_index, neighbors, scores
+        self._view = (item_ids, item_index, neighbors, scores)
+
+    def _ensure_model(self):
+        # 在 self._lock 内调用：从当前版本加载 TF-IDF 模型和 LSH 索引（与已映射的邻居数组属于同一版本）
+        if self._vectorizer is not None:
+            return True
+        if self.version is None:
+            return False
+        try:
+            vectorizer = joblib.load(version_path(self.root, self.version, VECTORIZER_FILE))
+            ann = LSHIndex.load(version_path(self.root, self.version, INDEX_FILE))
+        except FileNotFoundError:
+            return False
+        self._vectorizer, self._ann = vectorizer, ann
+        return True
+
+    def update(self, goods_id, text):
+        """
+        新增或修改单个商品：重新计算它的邻居，并把它插入到与它更相似的其它商品的邻居列表中。
+        """
+        with self._lock:
+            if not self._ensure_model():
+                return False
+            vector = self._vectorizer.transform([text]).tocsr().astype(np.float32)
+            item_ids, item_index = self._item_ids, dict(self._item_index)
+            neighbors, scores = self._neighbors.copy(), self._scores.copy()
+
+            index = item_index.get(goods_id)
+            if index is None:
+                index = item_index[goods_id] = len(item_ids)
+                item_ids = np.append(item_ids, np.int32(goods_id))
+                neighbors = np.vstack([neighbors, np.full((1, self.top_k), -1, dtype=np.int32)])
+                scores = np.vstack([scores, np.zeros((1, self.top_k), dtype=np.float32)])
+
+            # 与全量构建一致：商品数不超过 exact_limit 时与全部商品精确比较，否则只比较 LSH 候选
+            self._ann.add(goods_id, vector)
+            if len(item_ids) <= self.exact_limit:
+                similar = self._ann.query_exact(vector, None, exclude=[goods_id])
+            else:
+                similar = self._ann.query(vector, None, exclude=[goods_id])
+            neighbors[index], scores[index] = -1, 0
+            own = similar[:self.top_k]
+            neighbors[index, :len(own)] = [item_index[other] for other, _ in own]
+            scores[index, :len(own)] = [score for _, score in own]
+
+            # 其它商品：列表中已有它的行和与它相似的行，按新的相似度更新它的位置
+            new_scores = {item_index[other]: score for other, score in similar}
+            rows = set(new_scores) | set(np.nonzero((neighbors == index).any(axis=1))[0].tolist())
+            rows.discard(index)
+            for row in rows:
+                self._place(neighbors, scores, row, index, new_scores.get(row, 0.0))
+
+            self._set_neighbors(item_ids, neighbors, scores)
+            return True
+
+    def _place(self, neighbors, scores, row, index, similarity):
+        # 在第 row 行的邻居列表中放置商品 index（相似度 similarity）
+        valid = neighbors[row] >= 0
+        members, member_scores = neighbors[row][valid], scores[row][valid]
+        present = members == index
+        others, other_scores = members[~present], member_scores[~present]
+        full = len(members) >= self.top_k
+        if present.any():
+            # 已在列表中：列表未满（没有别的候选），或新的相似度不低于原来的第 top_k 名（列表外的商品都不超过它）
+            # 时保留并更新；否则真正的第 top_k 名可能在列表外，只能移除，下次全量构建时补上
+            keep = similarity > 0 and (not full or similarity >= member_scores.min())
+        else:
+            # 不在列表中：列表未满或超过当前第 top_k 个邻居时插入
+            keep = similarity > 0 and (not full or similarity > member_scores.min())
+        if keep:
+            others, other_scores = np.append(others, index), np.append(other_scores, similarity)
+        elif not present.any():
+            return
+        order = np.argsort(-other_scores, kind='stable')[:self.top_k]
+        neighbors[row], scores[row] = -1, 0
+        neighbors[row, :len(order)], scores[row, :len(order)] = others[order], other_scores[order]
+
+    def save(self):
+        # 保存为新版本，模型文件和邻居数组在同一个版本目录中
+        with self._lock:
+            vectorizer, ann = self._vectorizer, self._ann
+            item_ids, neighbors, scores = self._item_ids, self._neighbors, self._scores
+
+        self.version = save_snapshot(
+            self.root,
+            {"item_ids": item_ids, "neighbors": neighbors, "scores": scores},
+            files={VECTORIZER_FILE: lambda f: joblib.dump(vectorizer, f), INDEX_FILE: ann.save},
+        )
+        self._loaded_mtime = current_mtime(self.root)
+
+    def load(self):
+        # 内存映射当前版本的邻居数组，没有快照时返回 False；模型在需要时再加载
+        mtime = current_mtime(self.root)
+        snapshot = load_snapshot(self.root)
+        if snapshot is None:
+            return False
+        version, arrays, _ = snapshot
+
+        with self._lock:
+            self._vectorizer, self._ann = None, None
+            self._set_neighbors(arrays['item_ids'], arrays['neighbors'], arrays['scores'])
+            self.version, self._loaded_mtime = version, mtime
+        return True
+
+    def reload_if_changed(self):
+        if current_mtime(self.root) == self._loaded_mtime:
+            return False
+        return self.load()
+
+    def neighbors(self, goods_id, k=5):
+        # 返回 [(商品ID, 相似度), ...]，按相似度从高到低；只读内存，新版本由后台任务切换
+        item_ids, item_index, neighbors, scores = self._view
+        index = item_index.get(goods_id)
+        if index is None:
+            return []
+        return [(int(item_ids[n]), float(s)) for n, s in zip(neighbors[index, :k], scores[index, :k]) if n >= 0]
+
+    async def rebuild(self):
+        texts = await goods_texts()
+        if not texts:
+            return 0
+        await asyncio.to_thread(self.build, texts)
+        await asyncio.to_thread(self.save)
+        return len(texts)
+
+    def _update_and_save(self, goods_id, text):
+        # 多个 worker 都可能处理商品修改：加锁后先切换到最新版本再更新并保存，避免互相覆盖
+        with rebuild_lock(self.root):
+            self.reload_if_changed()
+            if not self.update(goods_id, text):
+                return False
+            self.save()
+            return True
+
+    async def update_goods(self, goods_id):
+        # 管理员新增或修改商品后调用；还没有全量构建过时跳过。
+        # 商品已经写入数据库，这里出错只记录日志，下次全量构建时会补上
+        try:
+            texts = await goods_texts([goods_id])
+            if goods_id not in texts:
+                return False
+            return await asyncio.to_thread(self._update_and_save, goods_id, texts[goods_id])
+        except Exception as e:
+            print(f"Error updating goods similarity for goods {goods_id}: {e}")
+            return False
+
+    async def ensure_built(self):
+        # 启动时调用，已有快照时直接映射；否则由拿到锁的一个 worker 全量构建一次，其它 worker 等待后映射
+        if self.load():
+            return
+        with rebuild_lock(self.root):
+            if not self.load():
+                count = await self.rebuild()
+                print(f"Goods similarity built: {count} goods")
+
+    async def _reload_loop(self):
+        # 其它 worker 保存了新版本时切换过去，文件操作放到线程中执行
+        while True:
+            await asyncio.sleep(self.check_interval)
+            try:
+                await asyncio.to_thread(self.reload_if_changed)
+            except Exception as e:
+                print(f"Error reloading goods similarity: {e}")
+
+    def start(self):
+        self._task = asyncio.create_task(self._reload_loop())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    def stats(self):
+        return {
+            "items": len(self._item_ids),
+            "version": self.version,
+            "top_k": self.top_k,
+            "vocabulary": len(self._vectorizer.vocabulary_) if self._vectorizer is not None else 0,
+            "ann": self._ann.stats() if self._ann is not None else None,
+        }
+
+
+async def main():
+    from tortoise import Tortoise
+    from settings import TORTOISE_ORM
+    from utils import goods_similarity
+
+    await Tortoise.init(config=TORTOISE_ORM)
+    try:
+        with rebuild_lock(goods_similarity.root):
+            count = await goods_similarity.rebuild()
+        print(f"Goods similarity rebuilt: {count} goods")
+    finally:
+        await Tortoise.close_connections()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
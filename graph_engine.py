@@ -0,0 +1,396 @@
+# -*- coding: utf-8 -*-
+# @Time    : 2024/5/30 10:30
+# @Author  : KuangRen777
+# @File    : graph_engine.py
+# @Tags    : 进程内推荐图
+"""
+进程内的推荐图，代替 Neo4j 执行 ProductRecommender 中的九个策略。
+
+从 MySQL 读出 用户→订单→商品→分类、商品→收货地址 等关系，保存为扁平的 NumPy 数组（CSR 形式的邻接表），
+策略查询用 bincount / 稀疏矩阵乘法完成计数，不需要网络往返。各策略与 recommend_test_by_strategy.py 中的
+Cypher 查询一一对应，图的含义与 transfer_mysql_to_neo4j.py 导入的关系一致：
+
+    history / similar_categories  用户买过的商品所在分类中的其它商品，按该分类的购买次数计分，排除已买过的
+    price_sensitivity             价格与用户平均购买价格相差不到 100 的商品（按差值从小到大）
+    purchase_time                 用户在当前月份下的订单中的商品
+    similar_interest              兴趣相似的用户（用户ID除以 3 的余数相同）购买的商品
+    wishlist                      与心愿单商品（商品ID与用户ID除以 4 的余数相同）同分类的其它商品
+    often_bought_together         与用户买过的商品在同一订单中出现过的商品（共同购买次数）
+    high_ratings                  四星及以上评价最多的商品
+    regional_trends               在用户收货地址下单过的商品
+
+所有数组保存在一个字典中，重建时整体替换，查询线程拿到的总是同一份完整的数据。
+settings.RECOMMEND_BACKEND = 'native' 时由应用启动时加载并通过 set_graph_engine 注册。
+
+指定 data_dir 时数组保存为版本化快照（snapshot.py）：启动时直接内存映射当前快照，不再查询 MySQL；
+只有没有快照时由拿到锁的一个 worker 构建，其它 worker 等它写完后映射同一份文件。
+快照超过 rebuild_interval 后由其中一个 worker 重建，其它 worker 每 check_interval 秒检查一次并切换到新版本。
+也可以单独运行重建：
+    python graph_engine.py
+"""
+import asyncio
+import threading
+from datetime import datetime
+
+import numpy as np
+from scipy import sparse
+
+from models import Goods, Comments, OrderDetails, Address, Users
+from snapshot import save_snapshot, load_snapshot, current_mtime, rebuild_lock
+
+TOP_N = 10
+PRICE_RANGE = 100
+INTEREST_GROUPS = 3
+WISH_GROUPS = 4
+
+
+def _csr(rows, cols, shape, data=None):
+    data = np.ones(len(rows), dtype=np.int32) if data is None else data
+    matrix = sparse.csr_matrix((data, (rows, cols)), shape=shape)
+    matrix.sum_duplicates()
+    return matrix
+
+
+def _flat_csr(matrix, prefix, with_data=True):
+    # 拆成扁平数组；indptr 与 indices 使用相同的整数类型，内存映射后构造 csr_matrix 时不会被复制
+    index_dtype = np.int32 if matrix.nnz < np.iinfo(np.int32).max else np.int64
+    arrays = {
+        f"{prefix}_indptr": matrix.indptr.astype(index_dtype),
+        f"{prefix}_indices": matrix.indices.astype(index_dtype),
+    }
+    if with_data:
+        arrays[f"{prefix}_data"] = matrix.data.astype(np.int32)
+    return arrays
+
+
+def _lookup(sorted_ids, ids):
+    # 把ID映射为下标，找不到的记为 -1
+    ids = np.asarray(ids, dtype=np.int64)
+    if len(sorted_ids) == 0:
+        return np.full(len(ids), -1, dtype=np.int64)
+    index = np.minimum(np.searchsorted(sorted_ids, ids), len(sorted_ids) - 1)
+    return np.where(sorted_ids[index] == ids, index, -1)
+
+
+def build_graph(goods, high_rated, purchases, addresses, user_ids):
+    """
+    goods:      [(商品ID, 分类ID, 价格), ...]
+    high_rated: [商品ID, ...]，每条四星及以上的评价一项
+    purchases:  [(订单ID, 用户ID, 收货地址ID, 下单时间, 商品ID), ...]，每条订单明细一项
+    addresses:  [(地址ID, 用户ID), ...]
+    user_ids:   [用户ID, ...]
+    返回由扁平数组组成的字典。
+    """
+    goods = sorted(goods)
+    goods_ids = np.array([g[0] for g in goods], dtype=np.int64)
+    category_ids, goods_category = np.unique(np.array([g[1] for g in goods], dtype=np.int64), return_inverse=True)
+    goods_price = np.array([g[2] for g in goods], dtype=np.float64)
+    n_goods, n_categories = len(goods_ids), len(category_ids)
+
+    user_ids = np.unique(np.asarray(list(user_ids), dtype=np.int64))
+    n_users = len(user_ids)
+
+    rated = _lookup(goods_ids, list(high_rated))
+    high_ratings = np.bincount(rated[rated >= 0], minlength=n_goods).astype(np.int32)
+
+    # 订单明细：只保留商品和用户都存在的
+    order_ids = np.array([p[0] for p in purchases], dtype=np.int64)
+    users = _lookup(user_ids, [p[1] for p in purchases])
+    goods_index = _lookup(goods_ids, [p[4] for p in purchases])
+    months = np.array([p[3].month if p[3] else 0 for p in purchases], dtype=np.int8)
+    address_of_order = np.array([p[2] or 0 for p in purchases], dtype=np.int64)
+    keep = (users >= 0) & (goods_index >= 0)
+    order_ids, users, goods_index, months, address_of_order = (
+        order_ids[keep], users[keep], goods_index[keep], months[keep], address_of_order[keep])
+
+    # 用户 -> 订单明细（CSR）
+    order = np.argsort(users, kind='stable')
+    purchase_indptr = np.concatenate([[0], np.cumsum(np.bincount(users, minlength=n_users))]).astype(np.int64)
+    purchase_goods = goods_index[order].astype(np.int32)
+    purchase_month = months[order]
+
+    # 兴趣相似的用户组、心愿单组的计数，按组预先算好
+    user_group = (user_ids[users] % INTEREST_GROUPS).astype(np.int64)
+    group_counts = np.zeros((INTEREST_GROUPS, n_goods), dtype=np.int32)
+    np.add.at(group_counts, (user_group, goods_index), 1)
+
+    wish_scores = np.zeros((WISH_GROUPS, n_goods), dtype=np.int32)
+    for group in range(WISH_GROUPS):
+        wished = (goods_ids % WISH_GROUPS) == group
+        category_counts = np.bincount(goods_category[wished], minlength=n_categories)
+        wish_scores[group] = np.where(wished, 0, category_counts[goods_category])
+
+    # 共同购买：订单×商品 的 0/1 矩阵，C = XᵀX（对角线清零）
+    order_index = np.unique(order_ids, return_inverse=True)[1] if len(order_ids) else np.empty(0, dtype=np.int64)
+    n_orders = int(order_index.max()) + 1 if len(order_index) else 0
+    basket = _csr(order_index, goods_index, (n_orders, n_goods))
+    basket.data[:] = 1
+    cooccurrence = (basket.T @ basket).tocsr()
+    cooccurrence.setdiag(0)
+    cooccurrence.eliminate_zeros()
+
+    # 收货地址：用户 -> 地址，地址 -> 在该地址下单的商品（按订单明细计数）
+    address_ids = np.unique(np.array([a[0] for a in addresses], dtype=np.int64))
+    address_users = _lookup(user_ids, [a[1] for a in sorted(addresses)])
+    address_rows = np.arange(len(address_ids))
+    has_user = address_users >= 0
+    user_address = _csr(address_users[has_user], address_rows[has_user], (n_users, len(address_ids)))
+    addresses_of_rows = _lookup(address_ids, address_of_order)
+    has_address = addresses_of_rows >= 0
+    address_goods = _csr(addresses_of_rows[has_address], goods_index[has_address], (len(address_ids), n_goods))
+
+    graph = {
+        "goods_ids": goods_ids,
+        "goods_category": goods_category.astype(np.int32),
+        "goods_price": goods_price,
+        "category_ids": category_ids,
+        "high_ratings": high_ratings,
+        "user_ids": user_ids,
+        "purchase_indptr": purchase_indptr,
+        "purchase_goods": purchase_goods,
+        "purchase_month": purchase_month,
+        "group_counts": group_counts,
+        "wish_scores": wish_scores,
+    }
+    graph.update(_flat_csr(cooccurrence, "cooccurrence"))
+    graph.update(_flat_csr(user_address, "user_address", with_data=False))
+    graph.update(_flat_csr(address_goods, "address_goods"))
+    return graph
+
+
+class GraphEngine:
+    def __init__(self, data_dir=None, rebuild_interval=3600, check_interval=30):
+        self.data_dir = data_dir
+        self.rebuild_interval = rebuild_interval
+        self.check_interval = check_interval
+        self._graph = None
+        self._cooccurrence = None
+        self._address_goods = None
+        self._lock = threading.Lock()
+        self._task = None
+        self._loaded_mtime = None
+        self.version = None
+        self.built_at = None
+        self.rebuilds = 0
+
+    def set_graph(self, graph, version=None, built_at=None):
+        # 稀疏矩阵直接引用数组（可以是只读的内存映射），不复制；查询只读不写
+        n_goods = len(graph["goods_ids"])
+        cooccurrence = sparse.csr_matrix(
+            (graph["cooccurrence_data"], graph["cooccurrence_indices"], graph["cooccurrence_indptr"]),
+            shape=(n_goods, n_goods))
+        address_goods = sparse.csr_matrix(
+            (graph["address_goods_data"], graph["address_goods_indices"], graph["address_goods_indptr"]),
+            shape=(len(graph["address_goods_indptr"]) - 1, n_goods))
+        with self._lock:
+            self._graph, self._cooccurrence, self._address_goods = graph, cooccurrence, address_goods
+            self.version, self.built_at = version, built_at or datetime.now()
+
+    def _snapshot(self):
+        with self._lock:
+            return self._graph, self._cooccurrence, self._address_goods
+
+    @staticmethod
+    def _top(graph, scores, k=TOP_N, order_by=None):
+        # 取得分大于 0 的前 k 个，返回 [(商品ID, 相关度), ...]；order_by 为排序键（越小越靠前），默认按得分
+        candidates = np.nonzero(scores > 0)[0]
+        if len(candidates) == 0:
+            return []
+        keys = -scores[candidates] if order_by is None else order_by[candidates]
+        if len(candidates) > k:
+            top = np.argpartition(keys, k - 1)[:k]
+            candidates, keys = candidates[top], keys[top]
+        candidates = candidates[np.argsort(keys, kind='stable')]
+        return [(int(graph["goods_ids"][g]), int(scores[g])) for g in candidates]
+
+    def _user(self, graph, user_id):
+        index = int(_lookup(graph["user_ids"], [user_id])[0])
+        if index < 0:
+            return -1, np.empty(0, dtype=np.int32), np.empty(0, dtype=np.int8)
+        start, end = graph["purchase_indptr"][index], graph["purchase_indptr"][index + 1]
+        return index, graph["purchase_goods"][start:end], graph["purchase_month"][start:end]
+
+    def has_orders(self, user_id):
+        graph, _, _ = self._snapshot()
+        return len(self._user(graph, user_id)[1]) > 0
+
+    def recommend_based_on_history(self, user_id):
+        graph, _, _ = self._snapshot()
+        _, purchased, _ = self._user(graph, user_id)
+        if len(purchased) == 0:
+            return []
+        category_counts = np.bincount(graph["goods_category"][purchased], minlength=len(graph["category_ids"]))
+        scores = category_counts[graph["goods_category"]]
+        scores[purchased] = 0
+        return self._top(graph, scores)
+
+    def recommend_based_on_similar_categories(self, user_id):
+        # 与 history 的 Cypher 查询相同
+        return self.recommend_based_on_history(user_id)
+
+    def recommend_based_on_price_sensitivity(self, user_id):
+        graph, _, _ = self._snapshot()
+        _, purchased, _ = self._user(graph, user_id)
+        if len(purchased) == 0:
+            return []
+        distance = np.abs(graph["goods_price"] - graph["goods_price"][purchased].mean())
+        scores = (distance < PRICE_RANGE).astype(np.int32)
+        return self._top(graph, scores, order_by=distance)
+
+    def recommend_based_on_purchase_time(self, user_id):
+        graph, _, _ = self._snapshot()
+        _, purchased, months = self._user(graph, user_id)
+        this_month = purchased[months == datetime.now().month]
+        scores = np.bincount(this_month, minlength=len(graph["goods_ids"]))
+        return self._top(graph, scores)
+
+    def recommend_based_on_similar_interest(self, user_id):
+        graph, _, _ = self._snapshot()
+        _, purchased, _ = self._user(graph, user_id)
+        scores = graph["group_counts"][user_id % INTEREST_GROUPS].astype(np.int64)
+        # 同组中去掉用户自己的购买
+        scores = scores - np.bincount(purchased, minlength=len(scores))
+        return self._top(graph, scores)
+
+    def recommend_based_on_wishlist(self, user_id):
+        graph, _, _ = self._snapshot()
+        return self._top(graph, graph["wish_scores"][user_id % WISH_GROUPS])
+
+    def recommend_based_on_often_bought_together(self, user_id):
+        graph, cooccurrence, _ = self._snapshot()
+        _, purchased, _ = self._user(graph, user_id)
+        if len(purchased) == 0:
+            return []
+        counts = np.bincount(purchased, minlength=len(graph["goods_ids"]))
+        scores = np.asarray(cooccurrence.T @ counts).ravel()
+        return self._top(graph, scores)
+
+    def recommend_based_on_high_ratings(self, user_id):
+        graph, _, _ = self._snapshot()
+        return self._top(graph, graph["high_ratings"])
+
+    def recommend_based_on_regional_trends(self, user_id):
+        graph, _, address_goods = self._snapshot()
+        index = int(_lookup(graph["user_ids"], [user_id])[0])
+        if index < 0:
+            return []
+        start, end = graph["user_address_indptr"][index], graph["user_address_indptr"][index + 1]
+        address_rows = graph["user_address_indices"][start:end]
+        if len(address_rows) == 0:
+            return []
+        scores = np.asarray(address_goods[address_rows].sum(axis=0)).ravel()
+        return self._top(graph, scores)
+
+    async def load(self):
+        # 从数据库全量构建（不读写快照），数组计算放到线程中执行
+        goods = await Goods.all().values_list('id', 'category_id', 'price')
+        high_rated = await Comments.filter(star__gte=4).values_list('goods_id', flat=True)
+        purchases = await OrderDetails.all().values_list('order_id', 'order__user_id', 'order__address_id',
+                                                         'order__created_at', 'goods_id')
+        addresses = await Address.all().values_list('id', 'user_id')
+        user_ids = await Users.all().values_list('id', flat=True)
+        graph = await asyncio.to_thread(build_graph, goods, high_rated, purchases, addresses, user_ids)
+        self.set_graph(graph)
+        return graph
+
+    def save(self):
+        graph, _, _ = self._snapshot()
+        built_at = self.built_at
+        self.version = save_snapshot(self.data_dir, graph, meta={"built_at": built_at.isoformat()})
+        self._loaded_mtime = current_mtime(self.data_dir)
+
+    def load_snapshot(self):
+        # 内存映射当前快照，没有快照时返回 False
+        mtime = current_mtime(self.data_dir)
+        snapshot = load_snapshot(self.data_dir)
+        if snapshot is None:
+            return False
+        version, graph, meta = snapshot
+        self.set_graph(graph, version, datetime.fromisoformat(meta["built_at"]))
+        self._loaded_mtime = mtime
+        return True
+
+    def reload_if_changed(self):
+        if current_mtime(self.data_dir) == self._loaded_mtime:
+            return False
+        return self.load_snapshot()
+
+    async def rebuild(self):
+        await self.load()
+        await asyncio.to_thread(self.save)
+        self.rebuilds += 1
+
+    async def ensure_loaded(self):
+        # 有快照时直接映射；没有时只让一个 worker 构建（启动阶段，阻塞等锁即可），其它 worker 等它写完后映射
+        if self.data_dir is None:
+            await self.load()
+            return
+        if self.load_snapshot():
+            return
+        with rebuild_lock(self.data_dir):
+            if not self.load_snapshot():
+                await self.rebuild()
+                print(f"Recommend graph built: version {self.version}")
+
+    async def _rebuild_loop(self):
+        while True:
+            await asyncio.sleep(self.rebuild_interval if self.data_dir is None else self.check_interval)
+            try:
+                if self.data_dir is None:
+                    await self.load()
+                    continue
+                self.reload_if_changed()
+                if (datetime.now() - self.built_at).total_seconds() < self.rebuild_interval:
+                    continue
+                with rebuild_lock(self.data_dir, blocking=False) as locked:
+                    # 拿到锁后再检查一次，别的 worker 可能刚刚重建完
+                    if locked and not self.reload_if_changed():
+                        await self.rebuild()
+            except Exception as e:
+                print(f"Error rebuilding recommend graph: {e}")
+
+    async def start(self):
+        await self.ensure_loaded()
+        self._task = asyncio.create_task(self._rebuild_loop())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    def stats(self):
+        graph, cooccurrence, _ = self._snapshot()
+        if graph is None:
+            return {"loaded": False}
+        return {
+            "loaded": True,
+            "version": self.version,
+            "built_at": self.built_at.strftime('%Y-%m-%d %H:%M:%S'),
+            "rebuilds": self.rebuilds,
+            "goods": len(graph["goods_ids"]),
+            "users": len(graph["user_ids"]),
+            "purchases": len(graph["purchase_goods"]),
+            "cooccurrence_nnz": int(cooccurrence.nnz),
+        }
+
+
+async def main():
+    from tortoise import Tortoise
+    from settings import TORTOISE_ORM
+    from utils import graph_engine
+
+    await Tortoise.init(config=TORTOISE_ORM)
+    try:
+        with rebuild_lock(graph_engine.data_dir):
+            await graph_engine.rebuild()
+        print(f"Recommend graph rebuilt: version {graph_engine.version}")
+    finally:
+        await Tortoise.close_connections()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
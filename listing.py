@@ -0,0 +1,193 @@
+# -*- coding: utf-8 -*-
+# @Time    : 2024/5/23 15:10
+# @Author  : KuangRen777
+# @File    : listing.py
+# @Tags    : 列表接口精简记录
+"""
+列表接口共用的精简记录。
+
+每种记录声明 columns（字段名 -> .values() 中的列，可以是 goods__title 这样的关联列），
+查询时只取这些列，结果放进带 __slots__ 的小对象，再由 dict() 直接生成接口返回的结构，
+不再构造完整的 Tortoise 模型实例（也不会取 details、pics 这类大字段，除非接口需要返回）。
+"""
+
+IMAGE_URL_PREFIX = 'http://127.0.0.1:8888/upimg/'
+
+
+def format_time(value):
+    return value.strftime('%Y-%m-%d %H:%M:%S') if value else None
+
+
+class Record:
+    __slots__ = ()
+    columns = {}
+
+    def __init__(self, **values):
+        for name in self.__slots__:
+            setattr(self, name, values.get(name))
+
+    @classmethod
+    async def fetch(cls, query):
+        return [cls(**row) for row in await query.values(**cls.columns)]
+
+    def dict(self):
+        raise NotImplementedError
+
+
+class GoodsListRecord(Record):
+    # /api/goods 列表；relevance 不来自数据库，搜索时按相关度排序使用
+    __slots__ = ('id', 'title', 'price', 'cover', 'category_id', 'sales', 'comments_count', 'updated_at', 'relevance')
+    columns = {name: name for name in __slots__[:-1]}
+
+    def dict(self):
+        return {
+            'id': self.id,
+            'title': self.title,
+            'price': self.price,
+            'cover': self.cover,
+            'category_id': self.category_id,
+            'sales': self.sales,
+            'updated_at': format_time(self.updated_at),
+            'comments_count': self.comments_count,
+            'collects_count': 0,
+            'cover_url': f'{IMAGE_URL_PREFIX}{self.cover}',
+        }
+
+
+class IndexGoodsRecord(Record):
+    # /api/index 首页商品；created_at 只用于排序和游标
+    __slots__ = ('id', 'title', 'price', 'stock', 'sales', 'cover', 'description', 'created_at')
+    columns = {name: name for name in __slots__}
+
+    def dict(self):
+        return {
+            "id": self.id,
+            "title": self.title,
+            "price": self.price,
+            "stock": self.stock,
+            "sales": self.sales,
+            "cover": self.cover,
+            "description": self.description,
+            "collects_count": 0,
+            "cover_url": f'{IMAGE_URL_PREFIX}{self.cover}',
+        }
+
+
+class AdminGoodsRecord(Record):
+    # 后台商品列表，接口本身返回 pics 和 details
+    __slots__ = ('id', 'user_id', 'category_id', 'title', 'description', 'price', 'stock', 'sales', 'cover', 'pics',
+                 'is_on', 'is_recommend', 'details', 'created_at', 'updated_at')
+    columns = {name: name for name in __slots__}
+
+    def dict(self):
+        return {
+            'id': self.id,
+            'user_id': self.user_id,
+            'category_id': self.category_id,
+            'title': self.title,
+            'description': self.description,
+            'price': self.price,
+            'stock': self.stock,
+            'sales': self.sales,
+            'cover': self.cover,
+            'cover_url': f'{IMAGE_URL_PREFIX}{self.cover}',
+            'pics': self.pics,
+            'pics_url': [f'{IMAGE_URL_PREFIX}{pic}' for pic in self.pics],
+            'is_on': self.is_on,
+            'is_recommend': self.is_recommend,
+            'details': self.details,
+            'created_at': format_time(self.created_at),
+            'updated_at': format_time(self.updated_at),
+        }
+
+
+class CartRecord(Record):
+    __slots__ = ('id', 'user_id', 'goods_id', 'num', 'is_checked')
+    columns = {name: name for name in __slots__}
+
+    def dict(self):
+        return {
+            "id": self.id,
+            "user_id": self.user_id,
+            "goods_id": self.goods_id,
+            "num": self.num,
+            "is_checked": self.is_checked,
+        }
+
+
+class CartGoodsRecord(Record):
+    # 购物车 include=goods：购物车字段加上商品字段，一次 JOIN 取回
+    __slots__ = CartRecord.__slots__ + (
+        'goods_title', 'goods_category_id', 'goods_user_id', 'goods_description', 'goods_price', 'goods_stock',
+        'goods_sales', 'goods_cover', 'goods_pics', 'goods_details', 'goods_is_on', 'goods_is_recommend',
+        'goods_created_at', 'goods_updated_at')
+    columns = {**CartRecord.columns, **{name: f'goods__{name[6:]}' for name in __slots__[5:]}}
+
+    def dict(self):
+        return {
+            "id": self.id,
+            "user_id": self.user_id,
+            "goods_id": self.goods_id,
+            "num": self.num,
+            "is_checked": self.is_checked,
+            "goods": {
+                "id": self.goods_id,
+                "title": self.goods_title,
+                "category_id": self.goods_category_id,
+                "user_id": self.goods_user_id,
+                "description": self.goods_description,
+                "price": self.goods_price,
+                "stock": self.goods_stock,
+                "sales": self.goods_sales,
+                "cover": self.goods_cover,
+                "cover_url": f'{IMAGE_URL_PREFIX}{self.goods_cover}',
+                "pics": self.goods_pics,
+                "pics_url": [],  # TODO: 这里还没弄
+                "details": self.goods_details,
+                "is_on": self.goods_is_on,
+                "is_recommend": self.goods_is_recommend,
+                "created_at": format_time(self.goods_created_at),
+                "updated_at": format_time(self.goods_updated_at),
+            },
+        }
+
+
+class AdminOrderRecord(Record):
+    # 后台订单列表，用户名和邮箱随订单一起 JOIN 取回
+    __slots__ = ('id', 'order_no', 'user_id', 'amount', 'status', 'address_id', 'express_type', 'express_no',
+                 'pay_time', 'pay_type', 'trade_no', 'created_at', 'updated_at', 'user_name', 'user_email')
+    columns = {**{name: name for name in __slots__[:-2]}, 'user_name': 'user__name', 'user_email': 'user__email'}
+
+    def dict(self):
+        return {
+            'id': self.id,
+            'order_no': self.order_no,
+            'user_id': self.user_id,
+            'amount': self.amount,
+            'status': self.status,
+            'address_id': self.address_id,
+            'express_type': self.express_type,
+            'express_no': self.express_no,
+            'pay_time': format_time(self.pay_time),
+            'pay_type': self.pay_type,
+            'trade_no': self.trade_no,
+            'created_at': format_time(self.created_at),
+            'updated_at': format_time(self.updated_at),
+        }
+
+    def user_dict(self):
+        return {'id': self.user_id, 'name': self.user_name, 'email': self.user_email}
+
+
+class AdminOrderDetailRecord(Record):
+    # 后台订单列表中的订单详情，一页订单的详情一次取回
+    __slots__ = ('id', 'order_id', 'goods_id', 'price', 'num', 'goods_title', 'goods_description', 'goods_price')
+    columns = {**{name: name for name in __slots__[:5]}, 'goods_title': 'goods__title',
+               'goods_description': 'goods__description', 'goods_price': 'goods__price'}
+
+    def dict(self):
+        return {'id': self.id, 'goods_id': self.goods_id, 'price': self.price, 'num': self.num}
+
+    def goods_dict(self):
+        return {'id': self.goods_id, 'title': self.goods_title, 'description': self.goods_description,
+                'price': self.goods_price}
@@ -9,7 +9,8 @@
 from fastapi import FastAPI, Request
 # 注册数据库
 from tortoise.contrib.fastapi import register_tortoise
-from settings import TORTOISE_ORM
+from settings import (TORTOISE_ORM, RECOMMEND_EVENTS_BATCH_SIZE, RECOMMEND_TOP_N, RECOMMEND_WEIGHT_HALF_LIFE,
+                      RECOMMEND_BACKEND)
 # 跨域
 from fastapi.middleware.cors import CORSMiddleware
 # 静态文件
@@ -33,6 +34,11 @@ from api.admin.comments import admin_comments
 from api.admin.orders import admin_orders
 from api.admin.menus import admin_menus
 from api.admin.slides import admin_slides
+from utils import password_hasher, redis_client, redis_pool, token_blacklist, goods_search, copurchase_engine, \
+    goods_similarity, global_weights, weights_manager, graph_engine, popularity
+from email_sender import EmailOutbox
+from recommend_events import RecommendEventConsumer
+from recommend_test_by_strategy import init_driver, close_driver, set_copurchase_engine, set_graph_engine
 
 # 启动网页服务
 import uvicorn
@@ -64,6 +70,46 @@ register_tortoise(
     config=TORTOISE_ORM,
 )
 
+# 应用生命周期
+email_outbox = EmailOutbox()
+recommend_consumer = RecommendEventConsumer(redis_client, batch_size=RECOMMEND_EVENTS_BATCH_SIZE, top_n=RECOMMEND_TOP_N,
+                                            weight_half_life=RECOMMEND_WEIGHT_HALF_LIFE, weights_manager=weights_manager)
+
+
+@app.on_event("startup")
+async def startup():
+    if RECOMMEND_BACKEND == 'native':
+        await graph_engine.start()
+        set_graph_engine(graph_engine)
+    else:
+        init_driver()
+    email_outbox.start()
+    await token_blacklist.start()
+    await goods_search.ensure_index()
+    await goods_similarity.ensure_built()
+    goods_similarity.start()
+    await copurchase_engine.start()
+    set_copurchase_engine(copurchase_engine)
+    global_weights.start()
+    popularity.start()
+    recommend_consumer.start()
+
+
+@app.on_event("shutdown")
+async def shutdown():
+    email_outbox.stop()
+    await recommend_consumer.stop()
+    await global_weights.stop()
+    await popularity.stop()
+    await copurchase_engine.stop()
+    await goods_similarity.stop()
+    await graph_engine.stop()
+    close_driver()
+    await token_blacklist.stop()
+    password_hasher.shutdown()
+    await redis_pool.disconnect()
+
+
 # 设置静态文件路由
 app.mount("/upimg/avatars", StaticFiles(directory="upimg/avatars"), name="avatars")
 app.mount("/upimg/goods_cover", StaticFiles(directory="upimg/goods_cover"), name="goods_cover")
@@ -0,0 +1,20 @@
+from tortoise import BaseDBAsyncClient
+
+
+async def upgrade(db: BaseDBAsyncClient) -> str:
+    return """
+        ALTER TABLE `goods` ADD `comments_count` INT NOT NULL  DEFAULT 0;
+        ALTER TABLE `goods` ADD `star_avg` DOUBLE NOT NULL  DEFAULT 0;
+        ALTER TABLE `goods` ADD INDEX `idx_goods_comment_5e0d4a` (`comments_count`);
+        UPDATE `goods` g JOIN (
+            SELECT `goods_id`, COUNT(`id`) AS `cnt`, COALESCE(ROUND(AVG(`star`), 2), 0) AS `avg_star`
+            FROM `comments` GROUP BY `goods_id`
+        ) c ON c.`goods_id` = g.`id`
+        SET g.`comments_count` = c.`cnt`, g.`star_avg` = c.`avg_star`;"""
+
+
+async def downgrade(db: BaseDBAsyncClient) -> str:
+    return """
+        ALTER TABLE `goods` DROP INDEX `idx_goods_comment_5e0d4a`;
+        ALTER TABLE `goods` DROP COLUMN `comments_count`;
+        ALTER TABLE `goods` DROP COLUMN `star_avg`;"""
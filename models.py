@@ -52,6 +52,8 @@ class Goods(Model):
     sales = fields.IntField(default=0, null=True)
     is_on = fields.IntField(default=0, null=True)
     is_recommend = fields.IntField(default=0, null=True)
+    comments_count = fields.IntField(default=0, index=True)  # 由 goods_counters 维护
+    star_avg = fields.FloatField(default=0)  # 平均星级，由 goods_counters 维护
     created_at = fields.DatetimeField(auto_now_add=True, null=True)
     updated_at = fields.DatetimeField(auto_now=True, null=True)
 
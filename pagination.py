@@ -0,0 +1,154 @@
+# -*- coding: utf-8 -*-
+# @Time    : 2024/5/22 10:05
+# @Author  : KuangRen777
+# @File    : pagination.py
+# @Tags    : 游标分页
+import base64
+import json
+from datetime import datetime
+
+from tortoise.expressions import Q
+
+
+class InvalidCursor(ValueError):
+    pass
+
+
+def _dump_value(value):
+    if isinstance(value, datetime):
+        return {"dt": value.isoformat()}
+    return value
+
+
+def _load_value(value):
+    if isinstance(value, dict):
+        return datetime.fromisoformat(value["dt"])
+    return value
+
+
+class Keyset:
+    """
+    键集（游标）分页。
+
+    排序字段后面总是追加 id 作为唯一的决胜字段，游标中保存上一页最后一条记录的排序值和 id，
+    下一页用 (排序值, id) 的字典序比较作为过滤条件，不再 offset，翻到多深都只扫描一页的数据。
+    排序字段可以为 NULL（商品的 sales、created_at 等都是 null=True）：按 MySQL 的规则 NULL 视为最小值，
+    升序时排在最前，降序时排在最后，after() 和 paginate_list 都按这个顺序处理。
+    """
+
+    def __init__(self, ordering):
+        # ordering 与 order_by 的写法相同，例如 ['-sales', 'price']
+        self.fields = [(item.lstrip('-'), item.startswith('-')) for item in ordering if item.lstrip('-') != 'id']
+        # id 与最后一个排序字段同向，没有排序字段时按 id 升序
+        id_desc = self.fields[-1][1] if self.fields else False
+        self.fields.append(('id', id_desc))
+        self.signature = ','.join(f"{'-' if desc else ''}{name}" for name, desc in self.fields)
+
+    def order_by(self):
+        return [f"{'-' if desc else ''}{name}" for name, desc in self.fields]
+
+    def encode(self, row):
+        values = [_dump_value(getattr(row, name)) for name, _ in self.fields]
+        raw = json.dumps({"s": self.signature, "v": values}, separators=(',', ':'))
+        return base64.urlsafe_b64encode(raw.encode('utf-8')).decode('ascii').rstrip('=')
+
+    def decode(self, cursor):
+        try:
+            raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4))
+            data = json.loads(raw)
+            values = [_load_value(value) for value in data["v"]]
+        except (ValueError, KeyError, TypeError):
+            raise InvalidCursor("Invalid cursor")
+        # 游标只能用于生成它的那种排序
+        if data.get("s") != self.signature or len(values) != len(self.fields):
+            raise InvalidCursor("Cursor does not match the current sort")
+        if values[-1] is None:
+            raise InvalidCursor("Invalid cursor")
+        return values
+
+    def after(self, values):
+        # (k1, k2, ..., id) > (v1, v2, ..., vid)，按各字段方向展开成 OR 条件
+        condition = None
+        for i, (name, desc) in enumerate(self.fields):
+            term = _beyond(name, desc, values[i])
+            if term is None:
+                continue
+            for j, (prev_name, _) in enumerate(self.fields[:i]):
+                term &= _equal(prev_name, values[j])
+            condition = term if condition is None else condition | term
+        return condition
+
+
+def _equal(name, value):
+    # SQL 中 NULL = NULL 不成立，必须用 IS NULL
+    return Q(**{f"{name}__isnull": True}) if value is None else Q(**{name: value})
+
+
+def _beyond(name, desc, value):
+    # 按该字段的方向严格排在 value 之后的条件；NULL 最小，降序时 NULL 之后没有记录，返回 None
+    if value is None:
+        return None if desc else Q(**{f"{name}__isnull": False})
+    if desc:
+        return Q(**{f"{name}__lt": value}) | Q(**{f"{name}__isnull": True})
+    return Q(**{f"{name}__gt": value})
+
+
+async def paginate(query, ordering, cursor=None, page=0, per_page=10, record=None):
+    """
+    返回 (当前页记录, 下一页游标)。
+
+    传入 cursor 时按游标取下一页，否则按 page 使用 offset（兼容原来的页码参数）；
+    两种方式的排序一致，页码模式返回的游标也可以直接用于继续翻页。
+    多取一条用于判断是否还有下一页，因此不需要 count()。
+    传入 record（listing.Record 子类）时只取其声明的列，返回精简记录而不是模型实例。
+    """
+    keyset = Keyset(ordering)
+    query = query.order_by(*keyset.order_by())
+    if cursor:
+        query = query.filter(keyset.after(keyset.decode(cursor)))
+    else:
+        query = query.offset(page * per_page)
+
+    query = query.limit(per_page + 1)
+    rows = await record.fetch(query) if record else list(await query)
+    next_cursor = None
+    if len(rows) > per_page:
+        rows = rows[:per_page]
+        next_cursor = keyset.encode(rows[-1])
+    return rows, next_cursor
+
+
+def _sort_key(value):
+    # 与 MySQL 一致，NULL 排在所有非空值之前
+    return (value is not None, value)
+
+
+def _is_after(row, keyset, values):
+    for (name, desc), value in zip(keyset.fields, values):
+        row_value = getattr(row, name)
+        if row_value != value:
+            row_key, key = _sort_key(row_value), _sort_key(value)
+            return row_key < key if desc else row_key > key
+    return False
+
+
+def paginate_list(rows, ordering, cursor=None, page=0, per_page=10):
+    """
+    与 paginate 相同的游标格式，用于已经取到内存中的有限结果（例如按搜索相关度排序）。
+    """
+    keyset = Keyset(ordering)
+    # 从最后一个字段开始依次稳定排序，得到多字段排序结果
+    for name, desc in reversed(keyset.fields):
+        rows = sorted(rows, key=lambda row: _sort_key(getattr(row, name)), reverse=desc)
+
+    if cursor:
+        values = keyset.decode(cursor)
+        rows = [row for row in rows if _is_after(row, keyset, values)]
+    else:
+        rows = rows[page * per_page:]
+
+    next_cursor = None
+    if len(rows) > per_page:
+        rows = rows[:per_page]
+        next_cursor = keyset.encode(rows[-1])
+    return rows, next_cursor
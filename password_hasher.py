@@ -0,0 +1,95 @@
+# -*- coding: utf-8 -*-
+# @Time    : 2024/5/20 15:40
+# @Author  : KuangRen777
+# @File    : password_hasher.py
+# @Tags    : 密码哈希线程池
+import asyncio
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+
+def _percentile(samples, q):
+    if not samples:
+        return 0.0
+    ordered = sorted(samples)
+    index = min(len(ordered) - 1, int(round(q * (len(ordered) - 1))))
+    return ordered[index]
+
+
+class PasswordHasher:
+    """
+    在固定大小的线程池中执行 bcrypt 哈希与校验，避免阻塞事件循环。
+
+    max_workers 控制同时进行的 bcrypt 计算数量，超出的请求在线程池队列中等待，
+    stats() 返回队列深度以及排队/计算耗时，供监控接口使用。
+    """
+
+    def __init__(self, context, max_workers=4, sample_size=1024):
+        self.context = context
+        self.max_workers = max_workers
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='password-hasher')
+        self._lock = threading.Lock()
+        self._queued = 0
+        self._running = 0
+        self._completed = 0
+        self._wait_times = deque(maxlen=sample_size)
+        self._run_times = deque(maxlen=sample_size)
+
+    def _run(self, func, submitted_at, *args):
+        started_at = time.perf_counter()
+        with self._lock:
+            self._queued -= 1
+            self._running += 1
+            self._wait_times.append(started_at - submitted_at)
+        try:
+            return func(*args)
+        finally:
+            with self._lock:
+                self._running -= 1
+                self._completed += 1
+                self._run_times.append(time.perf_counter() - started_at)
+
+    def _discard(self, future):
+        # 任务开始前被取消（例如请求被取消）时 _run 不会执行，在这里减去排队数
+        if future.cancelled():
+            with self._lock:
+                self._queued -= 1
+
+    async def _submit(self, func, *args):
+        with self._lock:
+            self._queued += 1
+        future = self._executor.submit(self._run, func, time.perf_counter(), *args)
+        future.add_done_callback(self._discard)
+        return await asyncio.wrap_future(future)
+
+    async def hash(self, password):
+        return await self._submit(self.context.hash, password)
+
+    async def verify(self, password, hashed_password):
+        return await self._submit(self.context.verify, password, hashed_password)
+
+    def stats(self):
+        with self._lock:
+            wait_times = list(self._wait_times)
+            run_times = list(self._run_times)
+            queued, running, completed = self._queued, self._running, self._completed
+
+        return {
+            "max_workers": self.max_workers,
+            "queue_depth": queued,
+            "running": running,
+            "completed": completed,
+            "wait_ms": {
+                "p50": round(_percentile(wait_times, 0.5) * 1000, 2),
+                "p99": round(_percentile(wait_times, 0.99) * 1000, 2),
+            },
+            "run_ms": {
+                "p50": round(_percentile(run_times, 0.5) * 1000, 2),
+                "p99": round(_percentile(run_times, 0.99) * 1000, 2),
+            },
+        }
+
+    def shutdown(self):
+        self._executor.shutdown(wait=False)
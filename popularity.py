@@ -0,0 +1,112 @@
+# -*- coding: utf-8 -*-
+# @Time    : 2024/5/29 14:10
+# @Author  : KuangRen777
+# @File    : popularity.py
+# @Tags    : 热门商品
+"""
+全站热门商品排行，用于还没有推荐结果的用户（冷启动）。
+
+得分 = log(1 + 销量) + 贝叶斯平均星级（评价少的商品向全站平均星级靠拢），只统计上架商品。
+排行保存在 Redis 有序集合 recommend:popular 中，每 refresh_interval 秒由一个 worker 重新计算（SET NX 加锁）；
+各 worker 的后台任务每 local_ttl 秒检查一次并把排行读到本地，请求中只读本地的列表，不访问数据库和 Redis。
+出错时保留上一次的列表。
+"""
+import asyncio
+import math
+
+from models import Goods
+
+POPULAR_KEY = "recommend:popular"
+POPULAR_LOCK_KEY = "recommend:popular:lock"
+
+# 贝叶斯平均：相当于每个商品额外有 PRIOR_COUNT 条全站平均星级的评价
+PRIOR_COUNT = 5
+
+
+def popularity_score(sales, star_avg, comments_count, mean_star):
+    rating = (star_avg * comments_count + mean_star * PRIOR_COUNT) / (comments_count + PRIOR_COUNT)
+    return math.log1p(max(sales or 0, 0)) + rating
+
+
+def rank_popular(goods_list, size):
+    """
+    goods_list 为 [{'id', 'sales', 'star_avg', 'comments_count'}, ...]，返回得分最高的 size 个 {商品ID: 得分}。
+    """
+    rated = [goods for goods in goods_list if goods['comments_count']]
+    total_comments = sum(goods['comments_count'] for goods in rated)
+    mean_star = sum(goods['star_avg'] * goods['comments_count'] for goods in rated) / total_comments \
+        if total_comments else 0.0
+    scores = {goods['id']: popularity_score(goods['sales'], goods['star_avg'], goods['comments_count'], mean_star)
+              for goods in goods_list}
+    return dict(sorted(scores.items(), key=lambda x: x[1], reverse=True)[:size])
+
+
+class PopularityRanking:
+    def __init__(self, redis_client, size=100, refresh_interval=600, local_ttl=60):
+        self.redis = redis_client
+        self.size = size
+        self.refresh_interval = refresh_interval
+        self.local_ttl = local_ttl
+        self._cached = []
+        self._task = None
+        self.refreshes = 0
+        self.errors = 0
+
+    async def compute(self):
+        goods_list = await Goods.filter(is_on=1).values('id', 'sales', 'star_avg', 'comments_count')
+        return rank_popular(goods_list, self.size)
+
+    async def refresh(self):
+        # 排行过期且拿到锁的 worker 重新计算，锁的过期时间即刷新间隔
+        if not await self.redis.set(POPULAR_LOCK_KEY, 1, nx=True, ex=self.refresh_interval):
+            return False
+        try:
+            scores = await self.compute()
+            async with self.redis.pipeline(transaction=True) as pipe:
+                pipe.delete(POPULAR_KEY)
+                if scores:
+                    pipe.zadd(POPULAR_KEY, scores)
+                await pipe.execute()
+        except Exception:
+            # 计算失败时释放锁，让下一次检查（可能是其它 worker）重新计算，而不是等整个刷新间隔
+            await self.redis.delete(POPULAR_LOCK_KEY)
+            raise
+        self.refreshes += 1
+        return True
+
+    async def reload(self):
+        await self.refresh()
+        goods_ids = await self.redis.zrevrange(POPULAR_KEY, 0, self.size - 1)
+        self._cached = [int(goods_id) for goods_id in goods_ids]
+
+    async def _reload_loop(self):
+        while True:
+            try:
+                await self.reload()
+            except Exception as e:
+                self.errors += 1
+                print(f"Error refreshing popular goods: {e}")
+            await asyncio.sleep(self.local_ttl)
+
+    def start(self):
+        self._task = asyncio.create_task(self._reload_loop())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def get(self, limit=10):
+        # 只读本地列表；后台任务还没加载成功时为空，由调用方回退
+        return self._cached[:limit]
+
+    def stats(self):
+        return {
+            "size": len(self._cached),
+            "refreshes": self.refreshes,
+            "errors": self.errors,
+        }
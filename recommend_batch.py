@@ -0,0 +1,126 @@
+# -*- coding: utf-8 -*-
+# @Time    : 2024/5/25 9:30
+# @Author  : KuangRen777
+# @File    : recommend_batch.py
+# @Tags    : 推荐结果批处理
+"""
+为用户预先计算推荐结果，写入 RecommendStore（每个用户一个 Redis 有序集合）。
+
+    python recommend_batch.py          # 增量：只处理上次运行后订单、购物车或权重有变化的用户
+    python recommend_batch.py --full   # 全量：处理所有用户
+
+增量模式处理的用户 = recommend:dirty 集合中的用户（权重被修改过）
+                  + 上次运行之后 updated_at 有变化的订单和购物车所属的用户。
+可以用 cron 定时运行增量模式，例如每 5 分钟一次。
+"""
+import argparse
+import asyncio
+import os
+import time
+from datetime import datetime
+
+from models import Users, Orders, Cart
+from recommend_store import RecommendStore
+from recommend_test_by_strategy import recommend_for_user, close_driver, set_copurchase_engine, set_graph_engine
+from copurchase import CoPurchaseEngine
+from graph_engine import GraphEngine
+from redis_weight import RedisWeightsManager
+
+LAST_RUN_KEY = "recommend:batch:last_run"
+
+
+class RecommendBatch:
+    def __init__(self, redis_client, top_n=10, concurrency=4):
+        self.redis = redis_client
+        self.top_n = top_n
+        self.concurrency = concurrency
+        self.weights_manager = RedisWeightsManager(redis_client)
+        self.store = RecommendStore(redis_client)
+
+    async def refresh_user(self, user_id):
+        await self.store.clear_dirty(user_id)
+        try:
+            version = await self.store.data_version(user_id)
+            user_weights = await self.weights_manager.get_user_weights_else_global(user_id)
+            cold_start = not await Orders.filter(user_id=user_id).exists()
+            recommendations = await asyncio.to_thread(recommend_for_user, user_id, user_weights, version=version,
+                                                      cold_start=cold_start)
+            await self.store.set(user_id, recommendations[:self.top_n])
+        except BaseException:
+            # 没有算完，重新标记，留给下一次增量处理
+            await self.store.mark_dirty(user_id)
+            raise
+
+    async def refresh_users(self, user_ids):
+        semaphore = asyncio.Semaphore(self.concurrency)
+        failed = 0
+
+        async def refresh(user_id):
+            nonlocal failed
+            async with semaphore:
+                try:
+                    await self.refresh_user(user_id)
+                except Exception as e:
+                    failed += 1
+                    print(f"Error refreshing recommendations for user {user_id}: {e}")
+
+        await asyncio.gather(*(refresh(user_id) for user_id in user_ids))
+        return len(user_ids) - failed
+
+    async def changed_users(self):
+        user_ids = await self.store.dirty_users()
+        last_run = await self.redis.get(LAST_RUN_KEY)
+        if last_run is None:
+            # 从未运行过，相当于全量
+            return set(await Users.all().values_list('id', flat=True))
+
+        since = datetime.fromisoformat(last_run)
+        user_ids.update(await Orders.filter(updated_at__gt=since).values_list('user_id', flat=True))
+        user_ids.update(await Cart.filter(updated_at__gt=since).values_list('user_id', flat=True))
+        return user_ids
+
+    async def run(self, full=False):
+        # 先记下开始时间，运行期间发生的变化留给下一次增量处理
+        started_at = datetime.now()
+        if full:
+            user_ids = set(await Users.all().values_list('id', flat=True))
+        else:
+            user_ids = await self.changed_users()
+
+        refreshed = await self.refresh_users(sorted(user_ids))
+        await self.redis.set(LAST_RUN_KEY, started_at.isoformat())
+        return refreshed, len(user_ids)
+
+
+async def main():
+    from tortoise import Tortoise
+    from settings import TORTOISE_ORM, RECOMMEND_TOP_N, RECOMMEND_BACKEND, RECOMMEND_DATA_DIR
+    from utils import redis_client, redis_pool
+
+    parser = argparse.ArgumentParser(description="预先计算用户推荐结果")
+    parser.add_argument('--full', action='store_true', help="处理所有用户（默认只处理有变化的用户）")
+    args = parser.parse_args()
+
+    await Tortoise.init(config=TORTOISE_ORM)
+    try:
+        if RECOMMEND_BACKEND == 'native':
+            # 与应用共用推荐图快照，已有快照时不再从数据库构建
+            graph = GraphEngine(os.path.join(RECOMMEND_DATA_DIR, 'graph'))
+            await graph.ensure_loaded()
+            set_graph_engine(graph)
+        else:
+            engine = CoPurchaseEngine()
+            await engine.load()
+            set_copurchase_engine(engine)
+
+        started_at = time.perf_counter()
+        refreshed, total = await RecommendBatch(redis_client, top_n=RECOMMEND_TOP_N).run(full=args.full)
+        print(f"Recommendations refreshed: {refreshed}/{total} users in {time.perf_counter() - started_at:.1f}s")
+    finally:
+        await Tortoise.close_connections()
+        await redis_pool.disconnect()
+        close_driver()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
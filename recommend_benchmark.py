@@ -0,0 +1,241 @@
+# -*- coding: utf-8 -*-
+# @Time    : 2024/5/28 10:05
+# @Author  : KuangRen777
+# @File    : recommend_benchmark.py
+# @Tags    : 推荐离线评估
+"""
+推荐离线回放评估。
+
+按下单时间顺序回放历史订单：对每个被评估的订单，在“下单前”为该用户计算各策略以及加权合并（blend）的
+推荐结果，与订单中实际购买的商品比较，统计：
+
+    hit_rate@k  推荐中至少命中一个所购商品的订单比例
+    recall@k    所购商品被推荐命中的比例（按订单平均）
+    p50/p99     单次调用耗时（毫秒）
+    queries     平均每次调用的 Neo4j 查询数
+
+共同购买引擎严格按时间回放：只用被评估订单之前的订单构建，每评估完一个订单再把它并入。
+Neo4j 策略直接查询当前的图，图中已包含被评估的订单时结果会偏高（很多策略还会排除已购买的商品），
+需要无泄漏的结果时先用截止到 --split 的数据库快照重新导入图（transfer_mysql_to_neo4j.py）。
+--backend native 时进程内推荐图只用被评估订单之前的订单和评价构建（build_graph），没有泄漏；
+图在评估过程中不再更新，被评估的订单不会并入。
+
+    python recommend_benchmark.py --limit 200 --json bench.json
+    python recommend_benchmark.py --limit 200 --baseline bench.json   # 与上一次的结果对比
+"""
+import argparse
+import asyncio
+import json
+import time
+from datetime import datetime
+
+from tortoise import Tortoise
+
+from copurchase import CoPurchaseEngine
+from graph_engine import GraphEngine, build_graph
+from models import Goods, Comments, OrderDetails, Address, Users
+from recommend_test_by_strategy import (ProductRecommender, STRATEGY_NAMES, blend, close_driver, recommend_for_user,
+                                        set_copurchase_engine, set_graph_engine)
+from settings import TORTOISE_ORM, COPURCHASE_TOP_K
+
+BLEND = "blend"
+
+
+class CountingRecommender(ProductRecommender):
+    # 统计每个策略发出的 Neo4j 查询数
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.query_count = 0
+
+    def _query(self, text):
+        self.query_count += 1
+        return super()._query(text)
+
+
+def percentile(samples, q):
+    if not samples:
+        return 0.0
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(round(q * (len(ordered) - 1))))]
+
+
+class Metrics:
+    def __init__(self):
+        self.calls = 0
+        self.errors = 0
+        self.hits = 0
+        self.recall = 0.0
+        self.queries = 0
+        self.latencies = []
+
+    def record(self, recommended, purchased, elapsed, queries=0):
+        self.calls += 1
+        self.queries += queries
+        self.latencies.append(elapsed * 1000)
+        matched = len(set(recommended) & purchased)
+        self.hits += 1 if matched else 0
+        self.recall += matched / len(purchased)
+
+    def report(self):
+        calls = self.calls or 1
+        return {
+            "calls": self.calls,
+            "errors": self.errors,
+            "hit_rate": round(self.hits / calls, 4),
+            "recall": round(self.recall / calls, 4),
+            "p50_ms": round(percentile(self.latencies, 0.5), 2),
+            "p99_ms": round(percentile(self.latencies, 0.99), 2),
+            "queries": round(self.queries / calls, 2),
+        }
+
+
+async def load_orders():
+    # [(下单时间, 订单ID, 用户ID, {商品ID}), ...]，按下单时间排序
+    rows = await OrderDetails.all().values_list('order_id', 'order__user_id', 'order__created_at', 'goods_id')
+    orders = {}
+    for order_id, user_id, created_at, goods_id in rows:
+        orders.setdefault(order_id, (created_at or datetime.min, order_id, user_id, set()))[3].add(goods_id)
+    return sorted(orders.values(), key=lambda order: (order[0], order[1]))
+
+
+def evaluate_order(recommender, user_id, purchased, k, weights, metrics):
+    results = {}
+    queries = 0
+    for name in STRATEGY_NAMES:
+        func = getattr(recommender, f"recommend_based_on_{name}")
+        recommender.query_count = 0
+        started_at = time.perf_counter()
+        try:
+            recs = func(user_id)
+        except Exception as e:
+            metrics[name].errors += 1
+            print(f"Error running strategy {name} for user {user_id}: {e}")
+            continue
+        elapsed = time.perf_counter() - started_at
+        results[name] = recs
+        queries += recommender.query_count
+        metrics[name].record([goods_id for goods_id, _ in recs[:k]], purchased, elapsed, recommender.query_count)
+
+    # 合并结果的质量用上面各策略的结果计算；耗时单独按线上方式（并发执行各策略）测量
+    started_at = time.perf_counter()
+    try:
+        recommend_for_user(user_id, weights)
+    except Exception as e:
+        metrics[BLEND].errors += 1
+        print(f"Error running blend for user {user_id}: {e}")
+        return
+    elapsed = time.perf_counter() - started_at
+    recommended = [goods_id for goods_id, _ in blend(results, weights, top_n=k)]
+    metrics[BLEND].record(recommended, purchased, elapsed, queries)
+
+
+def split_orders(orders, limit, split):
+    # 返回 (历史订单, 被评估的订单)：split 之前 / 之后的 limit 个；没有 split 时评估最近 limit 个订单
+    if limit <= 0:
+        raise ValueError("limit must be positive")
+    if split is not None:
+        history = [order for order in orders if order[0] < split]
+        evaluated = [order for order in orders if order[0] >= split][:limit]
+    else:
+        history, evaluated = orders[:-limit], orders[-limit:]
+    return history, evaluated
+
+
+async def load_history_graph(history, cutoff):
+    # 只用历史订单和 cutoff 之前的评价构建进程内推荐图，避免被评估的订单泄漏到策略结果中
+    order_ids = {order_id for _, order_id, _, _ in history}
+    goods = await Goods.all().values_list('id', 'category_id', 'price')
+    comments = Comments.filter(star__gte=4)
+    if cutoff is not None:
+        comments = comments.filter(created_at__lt=cutoff)
+    high_rated = await comments.values_list('goods_id', flat=True)
+    purchases = [purchase for purchase in await OrderDetails.all().values_list(
+        'order_id', 'order__user_id', 'order__address_id', 'order__created_at', 'goods_id')
+        if purchase[0] in order_ids]
+    addresses = await Address.all().values_list('id', 'user_id')
+    user_ids = await Users.all().values_list('id', flat=True)
+    return await asyncio.to_thread(build_graph, goods, high_rated, purchases, addresses, user_ids)
+
+
+def run(orders, limit, split, k, weights, replay_copurchase=True, recommender=None):
+    history, evaluated = split_orders(orders, limit, split)
+
+    if replay_copurchase:
+        engine = CoPurchaseEngine(top_k=COPURCHASE_TOP_K)
+        engine.build((user_id, goods_id) for _, _, user_id, goods_ids in history for goods_id in goods_ids)
+        set_copurchase_engine(engine)
+
+    metrics = {name: Metrics() for name in STRATEGY_NAMES + [BLEND]}
+    recommender = recommender or CountingRecommender()
+    for _, _, user_id, purchased in evaluated:
+        evaluate_order(recommender, user_id, purchased, k, weights, metrics)
+        if replay_copurchase:
+            engine.add_order(user_id, purchased)
+    return {
+        "orders": len(evaluated),
+        "k": k,
+        "strategies": {name: m.report() for name, m in metrics.items()},
+    }
+
+
+def print_report(report, baseline=None):
+    print(f"orders={report['orders']} k={report['k']}")
+    header = f"{'strategy':<24}{'hit_rate':>10}{'recall':>10}{'p50_ms':>10}{'p99_ms':>10}{'queries':>10}{'errors':>8}"
+    print(header)
+    for name, row in report["strategies"].items():
+        print(f"{name:<24}{row['hit_rate']:>10}{row['recall']:>10}{row['p50_ms']:>10}{row['p99_ms']:>10}"
+              f"{row['queries']:>10}{row['errors']:>8}")
+        old = (baseline or {}).get("strategies", {}).get(name)
+        if old:
+            print(f"{'  vs baseline':<24}" + "".join(
+                f"{row[key] - old[key]:>+10.4g}" for key in ("hit_rate", "recall", "p50_ms", "p99_ms", "queries")))
+
+
+async def main():
+    parser = argparse.ArgumentParser(description="按时间顺序回放历史订单，评估各推荐策略的效果与耗时")
+    parser.add_argument("--limit", type=int, default=200, help="评估的订单数")
+    parser.add_argument("--split", type=datetime.fromisoformat, default=None,
+                        help="只评估该时间之后的订单（之前的订单只用于构建共同购买引擎）；默认评估最近 limit 个订单")
+    parser.add_argument("--k", type=int, default=10, help="hit_rate@k / recall@k 的 k")
+    parser.add_argument("--no-copurchase", action="store_true", help="often_bought_together 使用 Neo4j 而不是回放的共同购买引擎")
+    parser.add_argument("--backend", choices=["neo4j", "native"], default="neo4j",
+                        help="策略执行后端：Neo4j 或进程内推荐图（graph_engine.py，只用评估之前的订单构建）")
+    parser.add_argument("--json", help="把结果写入该 JSON 文件")
+    parser.add_argument("--baseline", help="与该 JSON 文件中的结果对比")
+    args = parser.parse_args()
+    if args.limit <= 0:
+        parser.error("--limit must be positive")
+
+    recommender = None
+    await Tortoise.init(config=TORTOISE_ORM)
+    try:
+        orders = await load_orders()
+        if args.backend == "native":
+            history, evaluated = split_orders(orders, args.limit, args.split)
+            cutoff = args.split if args.split is not None else (evaluated[0][0] if evaluated else None)
+            recommender = GraphEngine()
+            recommender.set_graph(await load_history_graph(history, cutoff))
+            recommender.query_count = 0
+            set_graph_engine(recommender)
+    finally:
+        await Tortoise.close_connections()
+
+    weights = {name: 1.0 for name in STRATEGY_NAMES}
+    try:
+        report = await asyncio.to_thread(run, orders, args.limit, args.split, args.k, weights,
+                                         not args.no_copurchase and args.backend == "neo4j", recommender)
+    finally:
+        close_driver()
+
+    baseline = None
+    if args.baseline:
+        with open(args.baseline, encoding='utf-8') as f:
+            baseline = json.load(f)
+    print_report(report, baseline)
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
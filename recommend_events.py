@@ -0,0 +1,187 @@
+# -*- coding: utf-8 -*-
+# @Time    : 2024/5/24 10:45
+# @Author  : KuangRen777
+# @File    : recommend_events.py
+# @Tags    : 推荐事件
+"""
+用户行为事件（浏览、加入购物车……）。
+
+接口只把事件写入 Redis 列表就返回；RecommendEventConsumer 在后台批量取出事件，
+调整用户和全局的策略权重，并为涉及到的用户重新计算推荐结果写入 RecommendStore。
+Neo4j 查询是同步的，放到线程中执行，不阻塞事件循环。
+"""
+import asyncio
+import json
+import time
+
+import redis.asyncio as aioredis
+
+from models import Orders
+from recommend_store import RecommendStore
+from recommend_test_by_strategy import recommend_for_user, strategy_factors_for_products
+from redis_weight import RedisWeightsManager
+
+RECOMMEND_EVENTS_KEY = "recommend:events"
+
+
+class RecommendEvents:
+    def __init__(self, redis_client, key=RECOMMEND_EVENTS_KEY):
+        self.redis = redis_client
+        self.key = key
+
+    async def emit(self, user_id, goods_id, event_type):
+        # event_type 与 strategy_factors_for_product 的 increase_type 一致：view / add_cart / purchase
+        await self.redis.rpush(self.key, json.dumps({
+            "user_id": user_id,
+            "goods_id": goods_id,
+            "type": event_type,
+            "ts": time.time(),
+        }))
+
+    async def emit_many(self, user_id, goods_ids, event_type, version=None):
+        # 同一次行为涉及多个商品（如一个订单），作为一个事件合并调整权重；
+        # version 为行为发生前的用户数据版本号，消费时可以直接命中该版本的策略结果缓存
+        await self.redis.rpush(self.key, json.dumps({
+            "user_id": user_id,
+            "goods_ids": list(goods_ids),
+            "type": event_type,
+            "version": version,
+            "ts": time.time(),
+        }))
+
+
+class RecommendEventConsumer:
+    def __init__(self, redis_client, key=RECOMMEND_EVENTS_KEY, batch_size=50, top_n=10, weight_half_life=0,
+                 weights_manager=None):
+        self.redis = redis_client
+        self.key = key
+        self.batch_size = batch_size
+        self.top_n = top_n
+        self.weight_half_life = weight_half_life
+        self.weights_manager = weights_manager or RedisWeightsManager(redis_client)
+        self.store = RecommendStore(redis_client)
+        self.processed = 0
+        self.failed = 0
+        self._task = None
+
+    async def _apply(self, event):
+        user_id, event_type = event["user_id"], event["type"]
+        goods_ids = event["goods_ids"] if "goods_ids" in event else [event["goods_id"]]
+        version = event.get("version")
+        if version is None:
+            version = await self.store.data_version(user_id)
+        factors = await asyncio.to_thread(strategy_factors_for_products, user_id, goods_ids, event_type, version)
+        if factors:
+            # 用户和全局权重在 Redis 中原子地相乘，并发事件之间不会互相覆盖
+            await self.weights_manager.adjust_user_and_global_weights(user_id, factors, self.weight_half_life)
+
+    async def refresh_user(self, user_id):
+        # 重新计算一个用户的推荐结果；先清除脏标记，计算期间的新变化会重新标记
+        await self.store.clear_dirty(user_id)
+        try:
+            version = await self.store.data_version(user_id)
+            user_weights = await self.weights_manager.get_user_weights_else_global(user_id)
+            # 没有订单的用户跳过只依赖订单的策略
+            cold_start = not await Orders.filter(user_id=user_id).exists()
+            recommendations = await asyncio.to_thread(recommend_for_user, user_id, user_weights, version=version,
+                                                      cold_start=cold_start)
+            await self.store.set(user_id, recommendations[:self.top_n])
+        except BaseException:
+            # 没有算完，重新标记，由 recommend_batch 兜底
+            await self.store.mark_dirty(user_id)
+            raise
+
+    @staticmethod
+    def _parse(raw):
+        event = json.loads(raw)
+        if not isinstance(event, dict):
+            raise TypeError("event is not an object")
+        event["user_id"] = int(event["user_id"])
+        if not isinstance(event["type"], str):
+            raise TypeError("event type is not a string")
+        if "goods_ids" in event:
+            event["goods_ids"] = [int(goods_id) for goods_id in event["goods_ids"]]
+        else:
+            event["goods_id"] = int(event["goods_id"])
+        return event
+
+    async def _requeue(self, raw_items):
+        # 保持原来的顺序放回队列头部；放不回去时只能记录丢失的数量
+        try:
+            await self.redis.lpush(self.key, *reversed(raw_items))
+        except aioredis.RedisError as e:
+            self.failed += len(raw_items)
+            print(f"Error requeueing {len(raw_items)} recommend events, dropped: {e}")
+
+    async def drain_once(self, timeout=1):
+        item = await self.redis.blpop(self.key, timeout=timeout)
+        if item is None:
+            return 0
+
+        raw_items = [item[1]]
+        while len(raw_items) < self.batch_size:
+            raw = await self.redis.lpop(self.key)
+            if raw is None:
+                break
+            raw_items.append(raw)
+
+        # 先依次应用权重调整，同一批中每个用户的推荐只重新计算一次
+        users = []
+        for index, raw in enumerate(raw_items):
+            try:
+                event = self._parse(raw)
+            except (ValueError, KeyError, TypeError) as e:
+                # 格式错误的事件丢弃，不影响同一批中的其它事件
+                self.failed += 1
+                print(f"Invalid recommend event {raw!r}: {e}")
+                continue
+            try:
+                await self._apply(event)
+                self.processed += 1
+            except aioredis.RedisError:
+                # Redis 不可用：本批中还没处理的事件放回队列头部，交给重试
+                await self._requeue(raw_items[index:])
+                raise
+            except Exception as e:
+                self.failed += 1
+                print(f"Error applying recommend event {event}: {e}")
+            if event["user_id"] not in users:
+                users.append(event["user_id"])
+
+        for user_id in users:
+            try:
+                await self.refresh_user(user_id)
+            except aioredis.RedisError:
+                raise
+            except Exception as e:
+                print(f"Error refreshing recommendations for user {user_id}: {e}")
+        return len(raw_items)
+
+    async def run(self):
+        while True:
+            try:
+                await self.drain_once()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                # 任何错误都不能让消费任务退出，稍后重试
+                print(f"Error processing recommend events: {e}")
+                await asyncio.sleep(1)
+
+    def start(self):
+        self._task = asyncio.create_task(self.run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    def stats(self):
+        return {
+            "processed": self.processed,
+            "failed": self.failed,
+        }
@@ -0,0 +1,59 @@
+# -*- coding: utf-8 -*-
+# @Time    : 2024/5/24 10:20
+# @Author  : KuangRen777
+# @File    : recommend_store.py
+# @Tags    : 推荐结果存储
+RECOMMEND_DIRTY_KEY = "recommend:dirty"  # 集合：需要重新计算推荐结果的用户ID
+
+
+def recommend_key(user_id):
+    return f"recommend:user:{user_id}"
+
+
+def data_version_key(user_id):
+    return f"user:{user_id}:data_version"
+
+
+class RecommendStore:
+    """
+    预先计算好的用户推荐结果，每个用户一个有序集合（商品ID -> 推荐得分）。
+
+    由后台的推荐事件消费者和 recommend_batch 批处理写入，接口只读取（一次 ZREVRANGE），
+    不在请求中访问 Neo4j。
+    """
+
+    def __init__(self, redis_client):
+        self.redis = redis_client
+
+    async def get(self, user_id, limit=10):
+        # 按得分从高到低返回商品ID
+        return [int(goods_id) for goods_id in await self.redis.zrevrange(recommend_key(user_id), 0, limit - 1)]
+
+    async def set(self, user_id, recommendations):
+        # recommendations 为 recommend_for_user 的结果 [(商品ID, 得分), ...]，整体替换旧结果
+        async with self.redis.pipeline(transaction=True) as pipe:
+            pipe.delete(recommend_key(user_id))
+            if recommendations:
+                pipe.zadd(recommend_key(user_id), {goods_id: score for goods_id, score in recommendations})
+            await pipe.execute()
+
+    async def mark_dirty(self, *user_ids):
+        if user_ids:
+            await self.redis.sadd(RECOMMEND_DIRTY_KEY, *user_ids)
+
+    async def clear_dirty(self, user_id):
+        # 必须在开始计算之前清除：计算期间到达的 mark_dirty / bump_data_version 会重新标记，留给下一次处理
+        await self.redis.srem(RECOMMEND_DIRTY_KEY, user_id)
+
+    async def bump_data_version(self, user_id):
+        # 用户的订单、购物车或评论有变化：策略结果缓存失效，推荐结果需要重新计算
+        async with self.redis.pipeline(transaction=True) as pipe:
+            pipe.incr(data_version_key(user_id))
+            pipe.sadd(RECOMMEND_DIRTY_KEY, user_id)
+            await pipe.execute()
+
+    async def data_version(self, user_id):
+        return int(await self.redis.get(data_version_key(user_id)) or 0)
+
+    async def dirty_users(self):
+        return {int(user_id) for user_id in await self.redis.smembers(RECOMMEND_DIRTY_KEY)}
@@ -3,11 +3,272 @@
 # @Author  : KuangRen777
 # @File    : recommend_test_by_strategy.py
 # @Tags    :
-from neo4j import GraphDatabase
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor, wait
+
+from neo4j import GraphDatabase, Query
 from PASSWORD import *
+from settings import (NEO4J_MAX_POOL_SIZE, NEO4J_CONNECTION_ACQUISITION_TIMEOUT, NEO4J_MAX_CONNECTION_LIFETIME,
+                      RECOMMEND_STRATEGY_WORKERS, RECOMMEND_STRATEGY_TIMEOUT, RECOMMEND_TOTAL_BUDGET,
+                      RECOMMEND_RESULT_CACHE_SIZE, RECOMMEND_RESULT_CACHE_TTL, RECOMMEND_GLOBAL_STRATEGY_TTL)
+
+# 进程内共用一个 driver（自带连接池），应用启动时创建、关闭时释放
+_driver = None
+_driver_lock = threading.Lock()
+
+
+def init_driver(uri=NEO4J_BASE_URI, user=NEO4J_USER, password=NEO4J_PASSWORD):
+    global _driver
+    with _driver_lock:
+        if _driver is None:
+            _driver = GraphDatabase.driver(
+                uri,
+                auth=(user, password),
+                max_connection_pool_size=NEO4J_MAX_POOL_SIZE,
+                connection_acquisition_timeout=NEO4J_CONNECTION_ACQUISITION_TIMEOUT,
+                max_connection_lifetime=NEO4J_MAX_CONNECTION_LIFETIME,
+            )
+    return _driver
+
+
+def get_driver():
+    # 脚本中直接调用时没有经过应用启动，第一次使用时创建
+    return _driver or init_driver()
+
+
+def set_copurchase_engine(engine):
+    global _copurchase_engine
+    _copurchase_engine = engine
+
+
+def set_graph_engine(engine):
+    global _graph_engine
+    _graph_engine = engine
+
+
+def close_driver():
+    global _driver
+    with _driver_lock:
+        if _driver is not None:
+            _driver.close()
+            _driver = None
+
+
+# 各策略并发执行用的线程池（driver 是线程安全的，每个策略使用自己的 session）
+_strategy_executor = ThreadPoolExecutor(max_workers=RECOMMEND_STRATEGY_WORKERS,
+                                        thread_name_prefix='recommend-strategy')
+_stats_lock = threading.Lock()
+_strategy_stats = {}
+
+# 每个用户最近一次完整的策略结果（不含与用户无关的策略），以用户数据版本号和推荐图版本区分新旧，
+# 超过 RECOMMEND_RESULT_CACHE_TTL 秒后过期（LRU）
+_results_lock = threading.Lock()
+_results_cache = OrderedDict()
+_results_hits = 0
+_results_misses = 0
+
+# 设置后 often_bought_together 策略由进程内的共同购买引擎计算，不查询 Neo4j
+_copurchase_engine = None
+
+# 设置后（RECOMMEND_BACKEND = 'native'）全部策略由进程内的推荐图（graph_engine.GraphEngine）计算
+_graph_engine = None
+
+# 与用户无关的策略结果，所有用户共用，每 RECOMMEND_GLOBAL_STRATEGY_TTL 秒重新计算一次
+_global_lock = threading.Lock()
+_global_results = {}
+
+STRATEGY_NAMES = [
+    "history",
+    "price_sensitivity",
+    "similar_categories",
+    "purchase_time",
+    "similar_interest",
+    "wishlist",
+    "often_bought_together",
+    "high_ratings",
+    "regional_trends",
+]
+
+
+# 只依赖用户订单的策略，没有订单的用户（冷启动）结果一定为空，直接跳过
+ORDER_STRATEGIES = {"history", "price_sensitivity", "similar_categories", "purchase_time", "often_bought_together"}
+# 与用户无关的策略
+GLOBAL_STRATEGIES = {"high_ratings"}
+
+
+def _shared_strategy(name, func):
+    def run(user_id):
+        with _global_lock:
+            item = _global_results.get(name)
+        if item is not None and item[0] > time.monotonic():
+            return item[1]
+        recs = func(user_id)
+        with _global_lock:
+            _global_results[name] = (time.monotonic() + RECOMMEND_GLOBAL_STRATEGY_TTL, recs)
+        return recs
+    return run
+
+
+def strategies(recommender, cold_start=False, names=None):
+    # 策略名与 ProductRecommender.recommend_based_on_<策略名> 一一对应；names 为空时取全部策略
+    result = []
+    for name in STRATEGY_NAMES:
+        if cold_start and name in ORDER_STRATEGIES or names is not None and name not in names:
+            continue
+        func = getattr(recommender, f"recommend_based_on_{name}")
+        result.append((name, _shared_strategy(name, func) if name in GLOBAL_STRATEGIES else func))
+    return result
+
+
+def _record_timing(name, status, elapsed):
+    with _stats_lock:
+        stats = _strategy_stats.setdefault(name, {"calls": 0, "ok": 0, "timeout": 0, "error": 0,
+                                                  "total_ms": 0.0, "max_ms": 0.0})
+        stats["calls"] += 1
+        stats[status] += 1
+        stats["total_ms"] += elapsed * 1000
+        stats["max_ms"] = max(stats["max_ms"], elapsed * 1000)
+
+
+def strategy_stats():
+    # 各策略累计的调用次数、超时/失败次数和耗时，供监控接口使用
+    with _stats_lock:
+        return {
+            name: {
+                "calls": stats["calls"],
+                "ok": stats["ok"],
+                "timeout": stats["timeout"],
+                "error": stats["error"],
+                "avg_ms": round(stats["total_ms"] / stats["calls"], 2) if stats["calls"] else 0.0,
+                "max_ms": round(stats["max_ms"], 2),
+            } for name, stats in _strategy_stats.items()
+        }
+
+
+def _timed(func, user_id):
+    started_at = time.perf_counter()
+    try:
+        return func(user_id), time.perf_counter() - started_at, None
+    except Exception as e:
+        return None, time.perf_counter() - started_at, e
+
+
+def run_strategies(user_id, concurrent=True, strategy_timeout=RECOMMEND_STRATEGY_TIMEOUT,
+                   budget=RECOMMEND_TOTAL_BUDGET, timings=None, cold_start=None, names=None):
+    """
+    执行全部策略，返回 {策略名: [(商品ID, 相关度), ...]}，只包含按时成功完成的策略。
+
+    并发模式下所有策略同时提交到线程池，每条 Cypher 查询带 strategy_timeout 秒的服务端超时，
+    整体最多等待 budget 秒，超时未完成的策略直接丢弃（结果不参与合并）。
+    传入 timings 字典时写入每个策略的耗时（毫秒）和状态。
+
+    cold_start 为 True（用户没有订单）时跳过只依赖订单的策略，结果记为空；为 None 时用一次查询判断。
+    names 不为空时只执行其中的策略。
+    """
+    recommender = _graph_engine or ProductRecommender(query_timeout=strategy_timeout)
+    if cold_start is None:
+        cold_start = not recommender.has_orders(user_id)
+    results = {name: [] for name in ORDER_STRATEGIES if names is None or name in names} if cold_start else {}
+
+    def collect(name, outcome):
+        recs, elapsed, error = outcome
+        status = "ok" if error is None else "error"
+        if error is not None:
+            print(f"Error running strategy {name} for user {user_id}: {error}")
+        else:
+            results[name] = recs
+        _record_timing(name, status, elapsed)
+        if timings is not None:
+            timings[name] = {"ms": round(elapsed * 1000, 2), "status": status}
+
+    if not concurrent:
+        for name, func in strategies(recommender, cold_start, names):
+            collect(name, _timed(func, user_id))
+        return results
+
+    started_at = time.perf_counter()
+    futures = {_strategy_executor.submit(_timed, func, user_id): name
+               for name, func in strategies(recommender, cold_start, names)}
+    done, not_done = wait(futures, timeout=budget)
+    for future in done:
+        collect(futures[future], future.result())
+    for future in not_done:
+        # 还没开始的直接取消；已经在执行的由查询超时结束，结果被忽略
+        future.cancel()
+        name = futures[future]
+        elapsed = time.perf_counter() - started_at
+        _record_timing(name, "timeout", elapsed)
+        if timings is not None:
+            timings[name] = {"ms": round(elapsed * 1000, 2), "status": "timeout"}
+    return results
+
+
+def strategy_results(user_id, version=None, concurrent=True, timings=None, cold_start=None):
+    """
+    带缓存的 run_strategies。
+
+    策略结果与权重无关，主要取决于用户的订单、购物车、评论等数据；调用方传入用户数据版本号
+    （RecommendStore.data_version，数据变化时加一），版本号和推荐图版本都不变、且未超过
+    RECOMMEND_RESULT_CACHE_TTL 秒时复用上次的结果。依赖其它用户数据的策略（similar_interest、
+    regional_trends 等）最多延迟 TTL 秒；与用户无关的策略不进缓存，每次取共享结果。
+    只缓存全部策略都按时完成的结果；version 为 None 时不使用缓存。
+    """
+    global _results_hits, _results_misses
+    key = (version, _graph_version())
+    if version is not None:
+        with _results_lock:
+            item = _results_cache.get(user_id)
+            if item is not None and item[0] == key and item[1] > time.monotonic():
+                _results_cache.move_to_end(user_id)
+                _results_hits += 1
+                cached = item[2]
+            else:
+                cached = None
+                _results_misses += 1
+        if cached is not None:
+            results = dict(cached)
+            results.update(run_strategies(user_id, concurrent=False, timings=timings, cold_start=False,
+                                          names=GLOBAL_STRATEGIES))
+            return results
+
+    results = run_strategies(user_id, concurrent=concurrent, timings=timings, cold_start=cold_start)
+    if version is not None and len(results) == len(STRATEGY_NAMES):
+        user_results = {name: recs for name, recs in results.items() if name not in GLOBAL_STRATEGIES}
+        with _results_lock:
+            _results_cache[user_id] = (key, time.monotonic() + RECOMMEND_RESULT_CACHE_TTL, user_results)
+            _results_cache.move_to_end(user_id)
+            while len(_results_cache) > RECOMMEND_RESULT_CACHE_SIZE:
+                _results_cache.popitem(last=False)
+    return results
+
+
+def _graph_version():
+    # 进程内推荐图重建后缓存的结果全部失效；Neo4j 后端没有版本号，只靠 TTL 过期
+    return _graph_engine.built_at if _graph_engine is not None else None
+
+
+def result_cache_stats():
+    with _results_lock:
+        return {"size": len(_results_cache), "hits": _results_hits, "misses": _results_misses}
+
+
+def blend(results, weights=None, top_n=10):
+    # 按策略权重加权合并各策略的 (商品ID, 相关度)，返回得分最高的 top_n 个
+    weights = weights or {}
+    recommendations = {}
+    for name, recs in results.items():
+        for goods_id, relevance in recs:
+            if goods_id not in recommendations:
+                recommendations[goods_id] = 0
+            recommendations[goods_id] += relevance * weights.get(name, 1.0)
 
+    sorted_recommendations = sorted(recommendations.items(), key=lambda x: x[1], reverse=True)
+    return sorted_recommendations[:top_n]
 
-def recommend_for_user(user_id, weights=None):
+
+def recommend_for_user(user_id, weights=None, concurrent=True, timings=None, version=None, cold_start=None):
     if weights is None:
         weights = {
             "history": 1.0,
@@ -21,76 +282,83 @@ def recommend_for_user(user_id, weights=None):
             "regional_trends": 1.0
         }
 
-    recommendations = {}
-    recommender = ProductRecommender()
+    results = strategy_results(user_id, version, concurrent=concurrent, timings=timings, cold_start=cold_start)
+    return blend(results, weights)  # Returning top 10 recommendations
 
-    rec_functions = [
-        ("history", recommender.recommend_based_on_history),
-        ("price_sensitivity", recommender.recommend_based_on_price_sensitivity),
-        ("similar_categories", recommender.recommend_based_on_similar_categories),
-        ("purchase_time", recommender.recommend_based_on_purchase_time),
-        ("similar_interest", recommender.recommend_based_on_similar_interest),
-        ("wishlist", recommender.recommend_based_on_wishlist),
-        ("often_bought_together", recommender.recommend_based_on_often_bought_together),
-        ("high_ratings", recommender.recommend_based_on_high_ratings),
-        ("regional_trends", recommender.recommend_based_on_regional_trends)
-    ]
-
-    for name, func in rec_functions:
-        recs = func(user_id)
-        for goods_id, relevance in recs:
-            if goods_id not in recommendations:
-                recommendations[goods_id] = 0
-            recommendations[goods_id] += relevance * weights.get(name, 1.0)
 
-    sorted_recommendations = sorted(recommendations.items(), key=lambda x: x[1], reverse=True)
-    return sorted_recommendations[:10]  # Returning top 10 recommendations
-
-
-def adjust_weights_for_product(user_id, product_id, current_weights, increase_type="view"):
-    if increase_type == "view":
-        increase_factor = 1.1
-    elif increase_type == "purchase":
-        increase_factor = 1.5
-    elif increase_type == "add_cart":
-        increase_factor = 1.3
-    else:
-        increase_factor = 1.0
+INCREASE_FACTORS = {
+    "view": 1.1,
+    "purchase": 1.5,
+    "add_cart": 1.3,
+}
+
+
+def strategy_factors_for_product(user_id, product_id, increase_type="view", version=None):
+    """
+    返回推荐了该商品的各策略应乘的倍数 {策略名: 倍数}，交给 RedisWeightsManager.adjust_weights 原子地应用。
+    """
+    return strategy_factors_for_products(user_id, [product_id], increase_type, version)
+
+
+def strategy_factors_for_products(user_id, product_ids, increase_type="view", version=None):
+    # 多个商品（如一个订单）一起计算：策略结果只取一次，推荐了其中 n 个商品的策略乘以 倍数 ** n
+    increase_factor = INCREASE_FACTORS.get(increase_type)
+    if increase_factor is None:
         print('Invalid increase type')
-    # Adjust weights for algorithms that recommend the specified product
-    recommender = ProductRecommender()
-    weight_adjustments = {
-        "history": recommender.recommend_based_on_history,
-        "price_sensitivity": recommender.recommend_based_on_price_sensitivity,
-        "similar_categories": recommender.recommend_based_on_similar_categories,
-        "purchase_time": recommender.recommend_based_on_purchase_time,
-        "similar_interest": recommender.recommend_based_on_similar_interest,
-        "wishlist": recommender.recommend_based_on_wishlist,
-        "often_bought_together": recommender.recommend_based_on_often_bought_together,
-        "high_ratings": recommender.recommend_based_on_high_ratings,
-        "regional_trends": recommender.recommend_based_on_regional_trends
-    }
+        return {}
+    # 传入 version 且缓存命中时不再查询 Neo4j，只做集合判断
+    factors = {}
+    for name, recs in strategy_results(user_id, version).items():
+        matched = len({rec[0] for rec in recs}.intersection(product_ids))
+        if matched:
+            factors[name] = increase_factor ** matched
+    return factors
 
-    for name, func in weight_adjustments.items():
-        recs = func(user_id=user_id)
-        if any(product_id == rec[0] for rec in recs):
-            current_weights[name] *= increase_factor
 
-    # print(current_weights)
+def adjust_weights_for_product(user_id, product_id, current_weights, increase_type="view", version=None):
+    # Adjust weights for algorithms that recommend the specified product
+    for name, factor in strategy_factors_for_product(user_id, product_id, increase_type, version).items():
+        current_weights[name] *= factor
 
     return current_weights
 
 
 class ProductRecommender:
-    def __init__(self, uri=NEO4J_BASE_URI, user=NEO4J_USER, password=NEO4J_PASSWORD):
-        self.driver = GraphDatabase.driver(uri, auth=(user, password))
+    def __init__(self, uri=None, user=None, password=None, query_timeout=None):
+        # 不传连接参数时使用进程共用的 driver，创建 ProductRecommender 不再新建连接池
+        self.query_timeout = query_timeout
+        self._owns_driver = uri is not None
+        if self._owns_driver:
+            self.driver = GraphDatabase.driver(uri, auth=(user, password))
+        else:
+            self.driver = get_driver()
 
     def close(self):
-        self.driver.close()
+        # 共用的 driver 由 close_driver() 在应用关闭时释放
+        if self._owns_driver:
+            self.driver.close()
+
+    def _query(self, text):
+        # 设置了 query_timeout 时由服务端在超时后终止查询
+        return Query(text, timeout=self.query_timeout) if self.query_timeout else text
+
+    def has_orders(self, user_id):
+        # 判断冷启动用户，查询失败时按有订单处理（照常执行全部策略）
+        try:
+            with self.driver.session() as session:
+                result = session.run(self._query("""
+                MATCH (u:User {id: $userId})-[:PLACED]->(o:Order)
+                RETURN o.id AS id
+                LIMIT 1
+                """), userId=user_id)
+                return result.single() is not None
+        except Exception as e:
+            print(f"Error checking orders for user {user_id}: {e}")
+            return True
 
     def recommend_based_on_history(self, user_id):
         with self.driver.session() as session:
-            result = session.run("""
+            result = session.run(self._query("""
             MATCH (u:User {id: $userId})-[:PLACED]->(o:Order)-[:INCLUDES]->(od:OrderDetail)-[:OF_PRODUCT]->(p:Product)
             MATCH (p)-[:TAGGED_AS]->(c:Category)
             MATCH (rec:Product)-[:TAGGED_AS]->(c)
@@ -98,7 +366,7 @@ class ProductRecommender:
             RETURN rec, COUNT(*) AS relevance
             ORDER BY relevance DESC
             LIMIT 10
-            """, userId=user_id)
+            """), userId=user_id)
             # print("Based on Purchase and Browsing History:")
             recommend_list = []
             for record in result:
@@ -108,14 +376,14 @@ class ProductRecommender:
 
     def recommend_based_on_comments(self, user_id):
         with self.driver.session() as session:
-            result = session.run("""
+            result = session.run(self._query("""
             MATCH (u:User {id: $userId})-[:WROTE]->(com:Comment)-[:HAS_COMMENT]->(p:Product)-[:TAGGED_AS]->(c:Category)
             MATCH (rec:Product)-[:TAGGED_AS]->(c)
             WHERE NOT (u)-[:WROTE]->(:Comment)-[:HAS_COMMENT]->(rec)
             RETURN rec, COUNT(*) AS relevance
             ORDER BY relevance DESC
             LIMIT 10
-            """, userId=user_id)
+            """), userId=user_id)
             # print("Based on Comments:")
             recommend_list = []
             for record in result:
@@ -125,7 +393,7 @@ class ProductRecommender:
 
     def recommend_based_on_price_sensitivity(self, user_id):
         with self.driver.session() as session:
-            result = session.run("""
+            result = session.run(self._query("""
             MATCH (u:User {id: $userId})-[:PLACED]->(o:Order)-[:INCLUDES]->(od:OrderDetail)-[:OF_PRODUCT]->(p:Product)
             WITH u, AVG(p.price) AS avgPrice
             MATCH (rec:Product)
@@ -133,7 +401,7 @@ class ProductRecommender:
             RETURN rec, COUNT(*) AS relevance
             ORDER BY relevance DESC
             LIMIT 10
-            """, userId=user_id)
+            """), userId=user_id)
             # print("Based on Price Sensitivity:")
             recommend_list = []
             for record in result:
@@ -143,14 +411,14 @@ class ProductRecommender:
 
     def recommend_based_on_similar_categories(self, user_id):
         with self.driver.session() as session:
-            result = session.run("""
+            result = session.run(self._query("""
             MATCH (u:User {id: $userId})-[:PLACED]->(o:Order)-[:INCLUDES]->(od:OrderDetail)-[:OF_PRODUCT]->(p:Product)-[:TAGGED_AS]->(c:Category)
             MATCH (rec:Product)-[:TAGGED_AS]->(c)
             WHERE NOT (u)-[:PLACED]->(:Order)-[:INCLUDES]->(:OrderDetail)-[:OF_PRODUCT]->(rec)
             RETURN rec, COUNT(*) AS relevance
             ORDER BY relevance DESC
             LIMIT 10
-            """, userId=user_id)
+            """), userId=user_id)
             # print("Based on Categories Similarity:")
             recommend_list = []
             for record in result:
@@ -160,14 +428,14 @@ class ProductRecommender:
 
     def recommend_based_on_purchase_time(self, user_id):
         with self.driver.session() as session:
-            result = session.run("""
+            result = session.run(self._query("""
             MATCH (u:User {id: $userId})-[:PLACED]->(o:Order)
             WHERE date(o.created_at).month = date(datetime()).month
             MATCH (o)-[:INCLUDES]->(od:OrderDetail)-[:OF_PRODUCT]->(p:Product)
             RETURN p, COUNT(*) AS relevance
             ORDER BY relevance DESC
             LIMIT 10
-            """, userId=user_id)
+            """), userId=user_id)
             # print("Based on Purchase Time:")
             recommend_list = []
             for record in result:
@@ -177,14 +445,14 @@ class ProductRecommender:
 
     def recommend_based_on_user_location(self, user_id):
         with self.driver.session() as session:
-            result = session.run("""
+            result = session.run(self._query("""
             MATCH (u:User {id: $userId})-[:LIVES_AT]->(a:Address)
             MATCH (p:Product)-[:TAGGED_AS]->(c:Category)
             WHERE a.city = '指定的城市名'
             RETURN p, COUNT(*) AS relevance
             ORDER BY relevance DESC
             LIMIT 10
-            """, userId=user_id)
+            """), userId=user_id)
             # print("Based on User Location:")
             recommend_list = []
             for record in result:
@@ -195,12 +463,12 @@ class ProductRecommender:
     def recommend_based_on_season(self, user_id):
         current_season = "冬季"
         with self.driver.session() as session:
-            result = session.run("""
+            result = session.run(self._query("""
             MATCH (p:Product)-[:TAGGED_AS]->(c:Category {name: $season})
             RETURN p, COUNT(*) AS relevance
             ORDER BY relevance DESC
             LIMIT 10
-            """, season=current_season)
+            """), season=current_season)
             # print("Based on Seasonal Trends:")
             recommend_list = []
             for record in result:
@@ -210,13 +478,13 @@ class ProductRecommender:
 
     def recommend_based_on_similar_interest(self, user_id):
         with self.driver.session() as session:
-            result = session.run("""
+            result = session.run(self._query("""
             MATCH (u:User {id: $userId})-[:SIMILAR_INTEREST]->(other:User)
             MATCH (other)-[:PLACED|:WISHED]->(:Order)-[:INCLUDES]->(:OrderDetail)-[:OF_PRODUCT]->(p:Product)
             RETURN p, COUNT(*) AS relevance
             ORDER BY relevance DESC
             LIMIT 10
-            """, userId=user_id)
+            """), userId=user_id)
             # print("Based on Similar User Interests:")
             recommend_list = []
             for record in result:
@@ -226,14 +494,14 @@ class ProductRecommender:
 
     def recommend_based_on_wishlist(self, user_id):
         with self.driver.session() as session:
-            result = session.run("""
+            result = session.run(self._query("""
             MATCH (u:User {id: $userId})-[:WISHED]->(wishedProduct:Product)
             MATCH (wishedProduct)-[:TAGGED_AS]->(c:Category)<-[:TAGGED_AS]-(similarProduct:Product)
             WHERE NOT (u)-[:PLACED|:WISHED]->(similarProduct)
             RETURN similarProduct, COUNT(*) AS relevance
             ORDER BY relevance DESC
             LIMIT 10
-            """, userId=user_id)
+            """), userId=user_id)
             # print("Based on Wishlist:")
             recommend_list = []
             for record in result:
@@ -242,14 +510,16 @@ class ProductRecommender:
             return recommend_list
 
     def recommend_based_on_often_bought_together(self, user_id):
+        if _copurchase_engine is not None:
+            return _copurchase_engine.recommend_for_user(user_id)
         with self.driver.session() as session:
-            result = session.run("""
+            result = session.run(self._query("""
             MATCH (u:User {id: $userId})-[:PLACED]->(:Order)-[:INCLUDES]->(:OrderDetail)-[:OF_PRODUCT]->(p:Product)
             MATCH (p)-[:OFTEN_BOUGHT_WITH]->(frequentlyBought:Product)
             RETURN frequentlyBought, COUNT(*) AS relevance
             ORDER BY relevance DESC
             LIMIT 10
-            """, userId=user_id)
+            """), userId=user_id)
             # print("Based on Frequently Bought Together:")
             recommend_list = []
             for record in result:
@@ -259,12 +529,12 @@ class ProductRecommender:
 
     def recommend_based_on_high_ratings(self, user_id):
         with self.driver.session() as session:
-            result = session.run("""
+            result = session.run(self._query("""
             MATCH (p:Product)-[:HIGHLY_RATED_BY]->(:User)
             RETURN p, COUNT(*) AS relevance
             ORDER BY relevance DESC
             LIMIT 10
-            """, userId=user_id)
+            """), userId=user_id)
             # print("Based on High Ratings:")
             recommend_list = []
             for record in result:
@@ -274,13 +544,13 @@ class ProductRecommender:
 
     def recommend_based_on_regional_trends(self, user_id):
         with self.driver.session() as session:
-            result = session.run("""
+            result = session.run(self._query("""
             MATCH (u:User {id: $userId})-[:LIVES_AT]->(a:Address)
             MATCH (p:Product)-[:HOT_IN]->(a)
             RETURN p, COUNT(*) AS relevance
             ORDER BY relevance DESC
             LIMIT 10
-            """, userId=user_id)
+            """), userId=user_id)
             # print("Based on Regional Trends:")
             recommend_list = []
             for record in result:
@@ -332,3 +602,4 @@ if __name__ == "__main__":
 
     # 关闭数据库连接
     recommender.close()
+    close_driver()
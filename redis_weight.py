@@ -3,47 +3,281 @@
 # @Author  : KuangRen777
 # @File    : redis_weight.py
 # @Tags    :
-import redis
+import asyncio
+import time
+
+import redis.asyncio as aioredis
+
+from recommend_store import RECOMMEND_DIRTY_KEY
+
+GLOBAL_WEIGHTS_KEY = "user:global:weights"
+
+# 原子地按倍数调整权重，一次往返完成“读取-衰减-相乘-写回”，并直接返回新的权重
+#   KEYS[1] 要调整的权重哈希   KEYS[2] 全局权重哈希（初始化与衰减的目标）
+#   KEYS[3] 上次调整时间       KEYS[4] 待重新计算推荐的用户集合
+#   ARGV[1] 当前时间戳  ARGV[2] 衰减半衰期（秒，0 表示不衰减）  ARGV[3] 用户ID（为空时不标记）
+#   ARGV[4..] 策略名, 倍数, 策略名, 倍数 ...
+# 衰减在对数空间进行：log(w) 以半衰期向 log(全局权重) 靠拢。
+ADJUST_WEIGHTS_SCRIPT = """
+local now = tonumber(ARGV[1])
+local half_life = tonumber(ARGV[2])
+
+local weights = {}
+local current = redis.call('HGETALL', KEYS[1])
+for i = 1, #current, 2 do
+    weights[current[i]] = tonumber(current[i + 1])
+end
+
+local global = {}
+if KEYS[2] ~= KEYS[1] then
+    local raw = redis.call('HGETALL', KEYS[2])
+    for i = 1, #raw, 2 do
+        global[raw[i]] = tonumber(raw[i + 1])
+    end
+end
+
+if next(weights) == nil then
+    for name, weight in pairs(global) do
+        weights[name] = weight
+    end
+elseif half_life > 0 then
+    local last = tonumber(redis.call('GET', KEYS[3]))
+    if last and now > last then
+        local keep = math.pow(0.5, (now - last) / half_life)
+        for name, target in pairs(global) do
+            local weight = weights[name]
+            if weight and weight > 0 and target > 0 then
+                weights[name] = target * math.pow(weight / target, keep)
+            end
+        end
+    end
+end
+
+for i = 4, #ARGV, 2 do
+    local name = ARGV[i]
+    weights[name] = (weights[name] or 1.0) * tonumber(ARGV[i + 1])
+end
+
+local result = {}
+for name, weight in pairs(weights) do
+    result[#result + 1] = name
+    result[#result + 1] = string.format('%.17g', weight)
+end
+if #result > 0 then
+    redis.call('HSET', KEYS[1], unpack(result))
+end
+redis.call('SET', KEYS[3], ARGV[1])
+if ARGV[3] ~= '' then
+    redis.call('SADD', KEYS[4], ARGV[3])
+end
+return result
+"""
+
+
+def user_weights_key(user_id):
+    return f"user:{user_id}:weights"
+
+
+def weights_updated_key(key):
+    return f"{key}:updated_at"
+
+
+def parse_weights(retrieved_weights):
+    return {key: float(value) for key, value in retrieved_weights.items()}
 
 
 class RedisWeightsManager:
-    def __init__(self, host='localhost', port=6379, db=0):
-        self.redis = redis.Redis(host=host, port=port, db=db)
-
-    def set_weights(self, user_id, weights):
-        weights_key = f"user:{user_id}:weights"
-        for key, value in weights.items():
-            self.redis.hset(weights_key, key, value)
-        print(f"Current User {user_id} Weights:", self.get_weights(user_id))
-
-    def get_weights(self, user_id):
-        weights_key = f"user:{user_id}:weights"
-        retrieved_weights = self.redis.hgetall(weights_key)
-        return {key.decode('utf-8'): float(value) for key, value in retrieved_weights.items()}
-
-    def set_global_weights(self, weights):
-        global_weights_key = "user:global:weights"
-        for key, value in weights.items():
-            self.redis.hset(global_weights_key, key, value)
-        print(f"Current Global Weights:", self.get_global_weights())
-
-    def get_global_weights(self):
-        global_weights_key = "user:global:weights"
-        retrieved_weights = self.redis.hgetall(global_weights_key)
-        return {key.decode('utf-8'): float(value) for key, value in retrieved_weights.items()}
-
-    def get_user_weights_else_global(self, user_id):
-        user_weights = self.get_weights(user_id)
-        if user_weights:
-            return user_weights
+    def __init__(self, redis_client=None, host='localhost', port=6379, db=0, global_weights=None):
+        # 接口中传入 utils.redis_client，与其它 Redis 操作共用连接池
+        self.redis = redis_client or aioredis.Redis(host=host, port=port, db=db, decode_responses=True)
+        self._adjust_script = self.redis.register_script(ADJUST_WEIGHTS_SCRIPT)
+        # 传入 GlobalWeightsAccumulator 时，全局权重的读取走进程内缓存，调整先在本地累积
+        self.global_weights = global_weights
+
+    async def set_weights(self, user_id, weights):
+        # 权重变化后，该用户的推荐结果需要在下次增量批处理中重新计算
+        async with self.redis.pipeline(transaction=True) as pipe:
+            pipe.hset(user_weights_key(user_id), mapping=weights)
+            pipe.sadd(RECOMMEND_DIRTY_KEY, user_id)
+            await pipe.execute()
+
+    async def get_weights(self, user_id):
+        return parse_weights(await self.redis.hgetall(user_weights_key(user_id)))
+
+    async def set_global_weights(self, weights):
+        await self.redis.hset(GLOBAL_WEIGHTS_KEY, mapping=weights)
+
+    def _adjust(self, key, factors, half_life=0, user_id='', client=None):
+        args = [time.time(), half_life or 0, user_id]
+        for name, factor in factors.items():
+            args.extend((name, factor))
+        return self._adjust_script(keys=[key, GLOBAL_WEIGHTS_KEY, weights_updated_key(key), RECOMMEND_DIRTY_KEY],
+                                   args=args, client=client)
+
+    async def adjust_weights(self, user_id, factors, half_life=0):
+        """
+        把用户权重中的各策略乘以 factors 中对应的倍数（原子操作），返回调整后的权重。
+
+        用户还没有权重时以全局权重初始化；half_life 大于 0 时，先按距上次调整的时间让权重向全局权重衰减。
+        """
+        result = await self._adjust(user_weights_key(user_id), factors, half_life, user_id)
+        return parse_weights(dict(zip(result[::2], result[1::2])))
+
+    async def adjust_global_weights(self, factors):
+        result = await self._adjust(GLOBAL_WEIGHTS_KEY, factors)
+        return parse_weights(dict(zip(result[::2], result[1::2])))
+
+    async def adjust_user_and_global_weights(self, user_id, factors, half_life=0):
+        # 用户权重和全局权重在同一次往返中调整；有本地累积器时全局调整只记在本地，由累积器定期合并
+        if self.global_weights is not None:
+            user_weights = await self.adjust_weights(user_id, factors, half_life)
+            self.global_weights.add(factors)
+            return user_weights, await self.global_weights.get()
+
+        async with self.redis.pipeline(transaction=True) as pipe:
+            await self._adjust(user_weights_key(user_id), factors, half_life, user_id, client=pipe)
+            await self._adjust(GLOBAL_WEIGHTS_KEY, factors, client=pipe)
+            user_result, global_result = await pipe.execute()
+        return (parse_weights(dict(zip(user_result[::2], user_result[1::2]))),
+                parse_weights(dict(zip(global_result[::2], global_result[1::2]))))
+
+    async def get_global_weights(self):
+        if self.global_weights is not None:
+            return await self.global_weights.get()
+        return parse_weights(await self.redis.hgetall(GLOBAL_WEIGHTS_KEY))
+
+    async def get_user_and_global_weights(self, user_id):
+        # 用户权重和全局权重一次往返取回；用户没有权重时以全局权重初始化
+        if self.global_weights is not None:
+            user_weights = parse_weights(await self.redis.hgetall(user_weights_key(user_id)))
+            gb_weights = await self.global_weights.get()
         else:
-            gb_weights = self.get_global_weights()
-            self.set_weights(user_id, gb_weights)
-            return gb_weights
+            async with self.redis.pipeline(transaction=False) as pipe:
+                pipe.hgetall(user_weights_key(user_id))
+                pipe.hgetall(GLOBAL_WEIGHTS_KEY)
+                user_weights, gb_weights = await pipe.execute()
+            user_weights, gb_weights = parse_weights(user_weights), parse_weights(gb_weights)
+
+        if not user_weights and gb_weights:
+            await self.redis.hset(user_weights_key(user_id), mapping=gb_weights)
+            user_weights = dict(gb_weights)
+        return user_weights, gb_weights
+
+    async def get_user_weights_else_global(self, user_id):
+        user_weights, _ = await self.get_user_and_global_weights(user_id)
+        return user_weights
+
+
+class GlobalWeightsAccumulator:
+    """
+    全局权重的进程内累积器。
+
+    每次行为事件对全局权重的调整只在本地相乘累积（add 不访问 Redis），flush_interval 秒合并一次，
+    用一次原子的 adjust_global_weights 写回 Redis，全局权重这个热点键不再被每个请求读改写。
+    读取返回 cache_ttl 秒内的缓存副本（叠加本地尚未合并的调整），其它 worker 的调整最多延迟
+    flush_interval + cache_ttl 秒可见。
+    """
+
+    def __init__(self, manager, flush_interval=1.0, cache_ttl=5.0):
+        self.manager = manager
+        self.flush_interval = flush_interval
+        self.cache_ttl = cache_ttl
+        self._pending = {}
+        self._inflight = {}  # 正在写回 Redis 的调整，写回完成前读取时仍要叠加
+        self._flushing = None
+        self._cached = None
+        self._cached_at = 0.0
+        self._task = None
+        self.flushes = 0
+        self.cache_hits = 0
+        self.cache_misses = 0
+
+    def add(self, factors):
+        for name, factor in factors.items():
+            self._pending[name] = self._pending.get(name, 1.0) * factor
+
+    def _with_pending(self, weights):
+        weights = dict(weights)
+        for pending in (self._inflight, self._pending):
+            for name, factor in pending.items():
+                weights[name] = weights.get(name, 1.0) * factor
+        return weights
+
+    async def get(self):
+        if self._cached is not None and time.monotonic() - self._cached_at < self.cache_ttl:
+            self.cache_hits += 1
+        else:
+            self.cache_misses += 1
+            self._cached = parse_weights(await self.manager.redis.hgetall(GLOBAL_WEIGHTS_KEY))
+            self._cached_at = time.monotonic()
+        return self._with_pending(self._cached)
+
+    async def flush(self):
+        if not self._pending:
+            return
+        pending, self._pending = self._pending, {}
+        self._inflight = pending
+        done = False
+        try:
+            weights = await self.manager.adjust_global_weights(pending)
+            done = True
+        finally:
+            self._inflight = {}
+            if not done:
+                # 写回没有完成时放回本地，下次一起合并
+                self.add(pending)
+        self._cached, self._cached_at = weights, time.monotonic()
+        self.flushes += 1
+
+    async def _shielded_flush(self):
+        # 合并在独立的任务中执行，stop() 取消循环时不会中断正在进行的写回
+        self._flushing = asyncio.ensure_future(self.flush())
+        try:
+            await asyncio.shield(self._flushing)
+        finally:
+            if self._flushing.done():
+                self._flushing = None
+
+    async def _flush_loop(self):
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            try:
+                await self._shielded_flush()
+            except aioredis.RedisError as e:
+                print(f"Error flushing global weights: {e}")
+
+    def start(self):
+        self._task = asyncio.create_task(self._flush_loop())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        # 关闭前等正在进行的写回结束，再把本地累积的调整写回
+        flushing, self._flushing = self._flushing, None
+        try:
+            if flushing is not None:
+                # 写回失败时调整已放回本地，由下面的 flush 再写一次
+                await asyncio.gather(flushing, return_exceptions=True)
+            await self.flush()
+        except aioredis.RedisError as e:
+            print(f"Error flushing global weights: {e}")
+
+    def stats(self):
+        return {
+            "pending": dict(self._pending),
+            "flushes": self.flushes,
+            "cache_hits": self.cache_hits,
+            "cache_misses": self.cache_misses,
+        }
 
 
 # 示例使用
-if __name__ == "__main__":
+async def main():
     weights = {
         "history": 1.0,
         "price_sensitivity": 1.0,
@@ -59,16 +293,20 @@ if __name__ == "__main__":
     manager = RedisWeightsManager()
 
     # 设置全局权重
-    manager.set_global_weights(weights)
+    await manager.set_global_weights(weights)
 
     # 获取全局权重
-    global_weights = manager.get_global_weights()
+    global_weights = await manager.get_global_weights()
     print("Global Weights:", global_weights)
 
     # 设置特定用户权重
     user_id = '5'
-    # manager.set_weights(user_id, weights)
+    # await manager.set_weights(user_id, weights)
 
     # 获取特定用户权重
-    user_weights = manager.get_weights(user_id)
+    user_weights = await manager.get_weights(user_id)
     print(f"User {user_id} Weights:", user_weights)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
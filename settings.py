@@ -30,4 +30,87 @@ TORTOISE_ORM = {
     },
     'use_tz': False,
     'timezone': 'Asia/Shanghai'
-}
\ No newline at end of file
+}
+
+# 当前用户缓存（每个 worker 一份）
+USER_CACHE_MAXSIZE = 1024
+USER_CACHE_TTL = 60  # 秒
+
+# 密码哈希线程池大小（bcrypt 计算并发数）
+PASSWORD_HASH_WORKERS = 4
+
+# 邮件发送（本地调试可指向 aiosmtpd：127.0.0.1:8025，关闭 STARTTLS 和登录）
+EMAIL_SMTP_HOST = 'smtp.163.com'
+EMAIL_SMTP_PORT = 25
+EMAIL_SMTP_STARTTLS = True
+EMAIL_SMTP_LOGIN = True
+EMAIL_OUTBOX_KEY = 'email:outbox'
+EMAIL_OUTBOX_BATCH_SIZE = 20  # 每个 SMTP 连接一批最多发送的邮件数
+EMAIL_SMTP_IDLE_TIMEOUT = 30  # SMTP 连接空闲多少秒后断开
+EMAIL_MAX_ATTEMPTS = 3
+
+# Redis 连接池
+REDIS_HOST = 'localhost'
+REDIS_PORT = 6379
+REDIS_DB = 0
+REDIS_MAX_CONNECTIONS = 50
+REDIS_POOL_TIMEOUT = 5  # 连接池耗尽时等待空闲连接的秒数
+
+# JWT 黑名单布隆过滤器（每个 worker 一份）
+TOKEN_BLACKLIST_CAPACITY = 100000
+TOKEN_BLACKLIST_ERROR_RATE = 0.001
+TOKEN_BLACKLIST_REBUILD_INTERVAL = 3600  # 秒，定期从 Redis 索引重建以清除过期 token
+
+# 分类树缓存：每个 worker 最多每隔多少秒检查一次 Redis 中的版本号
+CATEGORY_TREE_CHECK_INTERVAL = 1.0
+
+# 商品搜索：一次搜索最多返回的商品数
+SEARCH_MAX_RESULTS = 200
+
+# 推荐：后台事件消费者每批最多处理的事件数，每个用户保存的推荐商品数
+RECOMMEND_EVENTS_BATCH_SIZE = 50
+RECOMMEND_TOP_N = 10
+RECOMMEND_WEIGHT_HALF_LIFE = 7 * 24 * 3600  # 用户策略权重向全局权重衰减的半衰期（秒），0 表示不衰减
+
+# 全局策略权重：本地累积的调整合并到 Redis 的间隔、读取缓存的有效期（秒）
+GLOBAL_WEIGHTS_FLUSH_INTERVAL = 1.0
+GLOBAL_WEIGHTS_CACHE_TTL = 5.0
+
+# Neo4j 连接池（进程内共用一个 driver）
+NEO4J_MAX_POOL_SIZE = 50
+NEO4J_CONNECTION_ACQUISITION_TIMEOUT = 10  # 秒，连接池耗尽时等待空闲连接的时间
+NEO4J_MAX_CONNECTION_LIFETIME = 3600  # 秒
+
+# 推荐策略并发执行：线程数、单个策略查询的超时和一次推荐的总耗时预算（秒）
+RECOMMEND_STRATEGY_WORKERS = 18
+RECOMMEND_STRATEGY_TIMEOUT = 2.0
+RECOMMEND_TOTAL_BUDGET = 3.0
+RECOMMEND_RESULT_CACHE_SIZE = 10000  # 每个进程缓存策略结果的用户数
+RECOMMEND_RESULT_CACHE_TTL = 600  # 缓存的策略结果最长使用时间（秒），依赖其它用户数据的策略靠它刷新
+RECOMMEND_GLOBAL_STRATEGY_TTL = 600  # 与用户无关的策略（high_ratings）结果的共享时间（秒）
+
+# 推荐策略的执行后端：'neo4j' 查询图数据库，'native' 使用进程内的推荐图（graph_engine.py），定期从 MySQL 重建（秒）
+# 推荐图以快照保存在 RECOMMEND_DATA_DIR/graph，各 worker 每 GRAPH_CHECK_INTERVAL 秒检查一次是否有新版本
+RECOMMEND_BACKEND = 'neo4j'
+GRAPH_REBUILD_INTERVAL = 3600
+GRAPH_CHECK_INTERVAL = 30
+
+# 热门商品排行（冷启动用户的推荐）：保存的商品数、重新计算间隔、各 worker 本地缓存时间（秒）
+POPULAR_SIZE = 100
+POPULAR_REFRESH_INTERVAL = 600
+POPULAR_LOCAL_TTL = 60
+
+# 共同购买引擎：每个商品保存的邻居数、全量重建间隔（秒）
+COPURCHASE_TOP_K = 20
+COPURCHASE_REBUILD_INTERVAL = 3600
+
+# 推荐相关的离线数据（商品相似度等）保存目录、每个商品保存的相似商品数
+RECOMMEND_DATA_DIR = 'recommend_data'
+GOODS_SIMILARITY_TOP_K = 20
+
+# 商品数超过该值后相似度改用 LSH 近似最近邻计算；LSH 哈希表数、每张表的位数
+# TF-IDF 向量间的余弦相似度普遍较低，位数多了相似商品很难落在同一个桶里（各参数的召回率见 ann_index.py）
+GOODS_SIMILARITY_EXACT_LIMIT = 5000
+GOODS_SIMILARITY_LSH_TABLES = 16
+GOODS_SIMILARITY_LSH_BITS = 6
+GOODS_SIMILARITY_CHECK_INTERVAL = 30  # 各 worker 检查是否有新版本快照的间隔（秒）
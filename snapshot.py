@@ -0,0 +1,133 @@
+# -*- coding: utf-8 -*-
+# @Time    : 2024/5/31 09:20
+# @Author  : KuangRen777
+# @File    : snapshot.py
+# @Tags    : 推荐数据快照
+"""
+推荐数据的版本化快照：一组扁平的 NumPy 数组，每个数组一个 .npy 文件，供各 worker 以只读方式内存映射。
+
+    <root>/<版本>/manifest.json   数组名列表和附加信息
+    <root>/<版本>/<数组名>.npy
+    <root>/<版本>/<其它文件>       随快照一起保存的非数组文件（如拟合好的模型）
+    <root>/CURRENT                当前版本号
+
+写入时先写到临时目录，整体改名后再原子替换 CURRENT，读者只会看到完整的版本。
+np.load(mmap_mode='r') 只建立映射，加载几乎不耗时，多个 worker 共享同一份页缓存；映射出的数组是只读的，
+使用方不能原地修改。旧版本只保留最近 keep 个（Linux 下已映射的文件被删除后仍然可以读取）。
+"""
+import fcntl
+import json
+import os
+import shutil
+import tempfile
+import time
+import uuid
+from contextlib import contextmanager
+
+import numpy as np
+
+CURRENT_FILE = "CURRENT"
+MANIFEST_FILE = "manifest.json"
+LOCK_FILE = "rebuild.lock"
+TMP_PREFIX = ".tmp-"  # 写入中的临时目录和文件，不算作版本
+
+
+def current_version(root):
+    try:
+        with open(os.path.join(root, CURRENT_FILE), encoding='utf-8') as f:
+            return f.read().strip() or None
+    except FileNotFoundError:
+        return None
+
+
+def current_mtime(root):
+    # 用于廉价地判断是否有新版本
+    try:
+        return os.path.getmtime(os.path.join(root, CURRENT_FILE))
+    except FileNotFoundError:
+        return None
+
+
+def version_path(root, version, name=None):
+    path = os.path.join(root, version)
+    return path if name is None else os.path.join(path, name)
+
+
+def save_snapshot(root, arrays, meta=None, files=None, keep=3):
+    """
+    arrays 为 {数组名: ndarray}，files 为 {文件名: write(f)}，meta 为可 JSON 序列化的附加信息。
+    返回新版本号。
+    """
+    # 版本号按时间排序，随机后缀保证同一秒内（同一进程的多个线程）的版本互不冲突
+    version = f"{time.strftime('%Y%m%d%H%M%S')}-{time.time_ns() % 10 ** 9:09d}-{uuid.uuid4().hex[:8]}"
+    os.makedirs(root, exist_ok=True)
+    tmp_dir = tempfile.mkdtemp(prefix=TMP_PREFIX, dir=root)
+    try:
+        for name, array in arrays.items():
+            np.save(os.path.join(tmp_dir, f"{name}.npy"), np.ascontiguousarray(array))
+        for name, write in (files or {}).items():
+            with open(os.path.join(tmp_dir, name), 'wb') as f:
+                write(f)
+        with open(os.path.join(tmp_dir, MANIFEST_FILE), 'w', encoding='utf-8') as f:
+            json.dump({"version": version, "arrays": list(arrays), "files": list(files or {}), "meta": meta or {}}, f)
+        os.replace(tmp_dir, version_path(root, version))
+    except BaseException:
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+        raise
+
+    fd, tmp_path = tempfile.mkstemp(prefix=TMP_PREFIX, dir=root)
+    try:
+        with os.fdopen(fd, 'w', encoding='utf-8') as f:
+            f.write(version)
+        os.replace(tmp_path, os.path.join(root, CURRENT_FILE))
+    except BaseException:
+        os.unlink(tmp_path)
+        raise
+    _prune(root, keep)
+    return version
+
+
+def load_snapshot(root, version=None):
+    """
+    内存映射指定版本（默认当前版本），返回 (版本号, {数组名: 只读数组}, meta)；没有快照时返回 None。
+    """
+    version = version or current_version(root)
+    if version is None:
+        return None
+    try:
+        with open(version_path(root, version, MANIFEST_FILE), encoding='utf-8') as f:
+            manifest = json.load(f)
+        arrays = {name: np.load(version_path(root, version, f"{name}.npy"), mmap_mode='r')
+                  for name in manifest["arrays"]}
+    except FileNotFoundError:
+        # 读 CURRENT 之后该版本恰好被清理
+        return None
+    return version, arrays, manifest["meta"]
+
+
+@contextmanager
+def rebuild_lock(root, blocking=True):
+    """
+    多个 worker 之间的重建锁（flock，进程退出时自动释放），拿到锁时 yield True。
+    blocking 为 False 时拿不到锁直接 yield False。
+    """
+    os.makedirs(root, exist_ok=True)
+    with open(os.path.join(root, LOCK_FILE), 'a') as f:
+        try:
+            fcntl.flock(f, fcntl.LOCK_EX | (0 if blocking else fcntl.LOCK_NB))
+        except BlockingIOError:
+            yield False
+            return
+        try:
+            yield True
+        finally:
+            fcntl.flock(f, fcntl.LOCK_UN)
+
+
+def _prune(root, keep):
+    versions = sorted(name for name in os.listdir(root)
+                      if not name.startswith(TMP_PREFIX) and os.path.isfile(version_path(root, name, MANIFEST_FILE)))
+    current = current_version(root)
+    for name in versions[:-keep]:
+        if name != current:
+            shutil.rmtree(version_path(root, name), ignore_errors=True)
@@ -0,0 +1,96 @@
+# -*- coding: utf-8 -*-
+# @Time    : 2024/6/03 11:20
+# @Author  : KuangRen777
+# @File    : test_ann_index.py
+# @Tags    : 近似最近邻
+import io
+
+import pytest
+
+np = pytest.importorskip("numpy")
+sparse = pytest.importorskip("scipy.sparse")
+
+from ann_index import LSHIndex
+
+
+def normalize(vectors):
+    return vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+
+
+def sparse_corpus(n_docs=3000, dim=2000, n_topics=150, seed=1):
+    # 类似 TF-IDF 的稀疏向量：每个文档取所属主题的若干词和一些随机词，主题内文档的余弦相似度不高
+    rng = np.random.default_rng(seed)
+    topic_words = [rng.choice(dim, 30, replace=False) for _ in range(n_topics)]
+    rows, cols, data = [], [], []
+    for doc in range(n_docs):
+        words = np.concatenate([rng.choice(topic_words[doc % n_topics], 8, replace=False),
+                                rng.choice(dim, 12, replace=False)])
+        words = np.unique(words)
+        rows.extend([doc] * len(words))
+        cols.extend(words)
+        data.extend(rng.random(len(words)) + 0.5)
+    matrix = sparse.csr_matrix((np.array(data, dtype=np.float32), (rows, cols)), shape=(n_docs, dim))
+    norms = np.sqrt(np.asarray(matrix.multiply(matrix).sum(axis=1))).ravel()
+    return sparse.diags(1 / norms).dot(matrix).tocsr().astype(np.float32)
+
+
+def test_query_finds_near_duplicates():
+    rng = np.random.default_rng(0)
+    base = normalize(rng.standard_normal((3, 32)))
+    vectors = normalize(np.vstack([base, base + 0.01 * rng.standard_normal((3, 32))]))
+    index = LSHIndex(32)
+    index.build(vectors, [1, 2, 3, 11, 12, 13])
+    for item_id, twin in ((1, 11), (2, 12), (3, 13)):
+        assert index.query(vectors[[1, 2, 3, 11, 12, 13].index(item_id)], 1, exclude=[item_id])[0][0] == twin
+
+
+def test_query_exact_matches_brute_force():
+    rng = np.random.default_rng(2)
+    vectors = normalize(rng.standard_normal((50, 16)))
+    index = LSHIndex(16)
+    index.build(vectors, np.arange(100, 150))
+    similarity = vectors @ vectors[0]
+    similarity[0] = -1
+    expected = [int(100 + i) for i in np.argsort(-similarity)[:5]]
+    assert [item_id for item_id, _ in index.query_exact(vectors[0], 5, exclude=[100])] == expected
+
+
+def test_recall_against_exact():
+    # 默认参数在 TF-IDF 类语料上的 recall@10
+    vectors = sparse_corpus()
+    ids = np.arange(vectors.shape[0])
+    index = LSHIndex(vectors.shape[1])
+    index.build(vectors, ids)
+
+    hits = total = 0
+    for item_id in range(0, vectors.shape[0], 10):
+        exact = {other for other, _ in index.query_exact(vectors[item_id], 10, exclude=[item_id])}
+        approx = {other for other, _ in index.query(vectors[item_id], 10, exclude=[item_id])}
+        hits += len(exact & approx)
+        total += len(exact)
+    assert hits / total >= 0.8
+
+
+def test_add_replaces_and_remove():
+    rng = np.random.default_rng(3)
+    vectors = normalize(rng.standard_normal((4, 8)))
+    index = LSHIndex(8)
+    index.build(vectors[:3], [1, 2, 3])
+    index.add(2, vectors[3])
+    assert len(index) == 3
+    assert index.query_exact(vectors[3], 1)[0][0] == 2
+    index.remove(3)
+    assert 3 not in {item_id for item_id, _ in index.query_exact(vectors[2], None)}
+
+
+def test_save_load_round_trip():
+    vectors = sparse_corpus(n_docs=200, dim=300, n_topics=20)
+    index = LSHIndex(vectors.shape[1])
+    index.build(vectors, np.arange(200))
+    index.remove(5)
+    buffer = io.BytesIO()
+    index.save(buffer)
+    buffer.seek(0)
+    loaded = LSHIndex.load(buffer)
+    assert len(loaded) == 199
+    assert loaded.query(vectors[0], 10, exclude=[0]) == index.query(vectors[0], 10, exclude=[0])
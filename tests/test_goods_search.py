@@ -0,0 +1,31 @@
+# -*- coding: utf-8 -*-
+# @Time    : 2024/6/03 15:30
+# @Author  : KuangRen777
+# @File    : test_goods_search.py
+# @Tags    : 商品搜索
+import pytest
+
+pytest.importorskip("tortoise")
+pytest.importorskip("jieba")
+
+from goods_search import tokenize, term_weights, TITLE_WEIGHT, TITLE_CHAR_WEIGHT, DESCRIPTION_WEIGHT
+
+
+def test_single_character_query_matches_title():
+    # “茶”不是 养生茶 / 红枣枸杞茶 分词结果中的词，靠单字索引命中
+    for title in ("养生茶", "红枣枸杞茶"):
+        weights = term_weights(title, "")
+        assert all(token in weights for token in tokenize("茶"))
+
+
+def test_term_weights():
+    weights = term_weights("枸杞", "宁夏枸杞")
+    assert weights["枸杞"] == TITLE_WEIGHT + DESCRIPTION_WEIGHT
+    assert weights["枸"] == TITLE_CHAR_WEIGHT
+    # 描述中的单字不索引
+    assert "宁" not in weights
+
+
+def test_tokenize_drops_punctuation():
+    assert tokenize("  ，。") == []
+    assert tokenize(None) == []
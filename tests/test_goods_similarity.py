@@ -0,0 +1,48 @@
+# -*- coding: utf-8 -*-
+# @Time    : 2024/6/03 14:40
+# @Author  : KuangRen777
+# @File    : test_goods_similarity.py
+# @Tags    : 商品间相似度
+import random
+
+import pytest
+
+pytest.importorskip("tortoise")
+pytest.importorskip("sklearn")
+
+from goods_similarity import GoodsSimilarity
+
+
+def corpus(n=500):
+    rng = random.Random(0)
+    words = [f"词{i}" for i in range(400)]
+    # 每个商品偏向自己所在组的 20 个词，同组商品互相相似
+    return {i: ' '.join(rng.choice(words[(i % 20) * 20:(i % 20) * 20 + 20] + words) for _ in range(15))
+            for i in range(n)}
+
+
+def all_neighbors(similarity, n):
+    return {i: [goods_id for goods_id, _ in similarity.neighbors(i, 20)] for i in range(n)}
+
+
+def test_update_with_unchanged_text_keeps_neighbors(tmp_path):
+    texts = corpus()
+    similarity = GoodsSimilarity(str(tmp_path))
+    similarity.build(texts)
+    before = all_neighbors(similarity, len(texts))
+    for goods_id in (7, 100, 321):
+        assert similarity.update(goods_id, texts[goods_id])
+    assert all_neighbors(similarity, len(texts)) == before
+
+
+def test_update_matches_exact_neighbors(tmp_path):
+    texts = corpus()
+    similarity = GoodsSimilarity(str(tmp_path))
+    similarity.build(texts)
+    # 词表不变时，单个商品更新后的邻居与全量构建一致
+    texts[7] = texts[8]
+    similarity.update(7, texts[7])
+    rebuilt = GoodsSimilarity(str(tmp_path / "rebuilt"))
+    rebuilt.build(texts)
+    assert [goods_id for goods_id, _ in similarity.neighbors(7, 20)] == \
+        [goods_id for goods_id, _ in rebuilt.neighbors(7, 20)]
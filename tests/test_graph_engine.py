@@ -0,0 +1,96 @@
+# -*- coding: utf-8 -*-
+# @Time    : 2024/6/04 14:10
+# @Author  : KuangRen777
+# @File    : test_graph_engine.py
+# @Tags    : 进程内推荐图
+from datetime import datetime
+
+import pytest
+
+pytest.importorskip("tortoise")
+np = pytest.importorskip("numpy")
+pytest.importorskip("scipy.sparse")
+
+from graph_engine import GraphEngine, build_graph, _lookup
+
+# 商品 1~3 属于分类 10，4~5 属于分类 20
+GOODS = [(1, 10, 50), (2, 10, 60), (3, 10, 300), (4, 20, 55), (5, 20, 500)]
+USERS = [100, 101, 102]
+ADDRESSES = [(7, 100), (8, 101), (9, 102)]
+PURCHASES = [
+    (1001, 100, 7, datetime(2024, 3, 1), 1),
+    (1001, 100, 7, datetime(2024, 3, 1), 4),
+    (1002, 101, 8, datetime(2024, 4, 2), 1),
+    (1002, 101, 8, datetime(2024, 4, 2), 2),
+    (1002, 101, 8, datetime(2024, 4, 2), 4),
+    (1003, 101, 8, datetime(2024, 4, 3), 99),  # 不存在的商品
+    (1004, 999, 7, datetime(2024, 4, 3), 3),   # 不存在的用户
+]
+HIGH_RATED = [4, 4, 2, 99]
+
+
+@pytest.fixture
+def engine():
+    engine = GraphEngine()
+    engine.set_graph(build_graph(GOODS, HIGH_RATED, PURCHASES, ADDRESSES, USERS))
+    return engine
+
+
+def test_lookup():
+    assert list(_lookup(np.array([2, 5, 9]), [5, 1, 9, 10])) == [1, -1, 2, -1]
+    assert list(_lookup(np.array([], dtype=np.int64), [1, 2])) == [-1, -1]
+
+
+def test_top():
+    graph = {"goods_ids": np.array([10, 11, 12, 13])}
+    assert GraphEngine._top(graph, np.array([0, 3, 1, 2]), k=2) == [(11, 3), (13, 2)]
+    # order_by 越小越靠前，得分为 0 的不返回
+    order_by = np.array([5.0, 1.0, 0.0, 3.0])
+    assert GraphEngine._top(graph, np.array([1, 1, 0, 1]), k=2, order_by=order_by) == [(11, 1), (13, 1)]
+    assert GraphEngine._top(graph, np.zeros(4)) == []
+
+
+def test_build_graph_drops_unknown_rows():
+    graph = build_graph(GOODS, HIGH_RATED, PURCHASES, ADDRESSES, USERS)
+    assert list(graph["goods_ids"]) == [1, 2, 3, 4, 5]
+    assert list(graph["high_ratings"]) == [0, 1, 0, 2, 0]
+    # 用户 100 买了 2 件，101 买了 3 件（商品 99 被丢弃），102 没有订单
+    assert list(np.diff(graph["purchase_indptr"])) == [2, 3, 0]
+    assert sorted(graph["purchase_goods"][:2]) == [0, 3]
+
+
+def test_has_orders(engine):
+    assert engine.has_orders(100)
+    assert not engine.has_orders(102)
+    assert not engine.has_orders(999)
+
+
+def test_history(engine):
+    # 用户 100 在分类 10、20 各买过一件，排除已买的商品 1 和 4
+    assert engine.recommend_based_on_history(100) == [(2, 1), (3, 1), (5, 1)]
+    assert engine.recommend_based_on_history(102) == []
+
+
+def test_wishlist(engine):
+    # 用户 100：心愿单为商品ID除以 4 余 0 的商品 4，推荐同分类的商品 5
+    assert engine.recommend_based_on_wishlist(100) == [(5, 1)]
+    # 用户 101：心愿单为商品 1 和 5
+    assert engine.recommend_based_on_wishlist(101) == [(2, 1), (3, 1), (4, 1)]
+
+
+def test_often_bought_together(engine):
+    # 订单 {1, 4} 和 {1, 2, 4}：C[1,4] = 2，C[1,2] = C[2,4] = 1
+    assert engine.recommend_based_on_often_bought_together(100) == [(1, 2), (2, 2), (4, 2)]
+    assert engine.recommend_based_on_often_bought_together(102) == []
+
+
+def test_high_ratings(engine):
+    assert engine.recommend_based_on_high_ratings(100) == [(4, 2), (2, 1)]
+
+
+def test_regional_trends(engine):
+    assert engine.recommend_based_on_regional_trends(100) == [(1, 1), (4, 1)]
+    assert engine.recommend_based_on_regional_trends(101) == [(1, 1), (2, 1), (4, 1)]
+    # 地址 9 下没有订单
+    assert engine.recommend_based_on_regional_trends(102) == []
+    assert engine.recommend_based_on_regional_trends(999) == []
@@ -0,0 +1,83 @@
+# -*- coding: utf-8 -*-
+# @Time    : 2024/6/04 10:20
+# @Author  : KuangRen777
+# @File    : test_pagination.py
+# @Tags    : 游标分页
+from datetime import datetime
+from types import SimpleNamespace
+
+import pytest
+
+pytest.importorskip("tortoise")
+
+from pagination import Keyset, InvalidCursor, paginate_list
+
+
+def goods(id, sales=None, price=0, created_at=None):
+    return SimpleNamespace(id=id, sales=sales, price=price, created_at=created_at)
+
+
+def _match(q, row):
+    # 在内存中求值 after() 生成的 Q，只支持其中用到的查找方式
+    results = [_match(child, row) for child in q.children]
+    for key, value in q.filters.items():
+        name, _, lookup = key.partition('__')
+        field = getattr(row, name)
+        if lookup == 'isnull':
+            results.append((field is None) == value)
+        elif lookup in ('gt', 'lt'):
+            results.append(field is not None and (field > value if lookup == 'gt' else field < value))
+        else:
+            results.append(field == value)
+    result = any(results) if q.join_type == 'OR' else all(results)
+    return not result if q._is_negated else result
+
+
+ROWS = [goods(1, sales=5), goods(2, sales=None), goods(3, sales=5), goods(4, sales=9), goods(5, sales=None),
+        goods(6, sales=0)]
+
+
+def test_cursor_round_trip():
+    keyset = Keyset(['-created_at'])
+    row = goods(7, created_at=datetime(2024, 5, 1, 12, 30))
+    assert keyset.decode(keyset.encode(row)) == [datetime(2024, 5, 1, 12, 30), 7]
+    assert keyset.decode(keyset.encode(goods(8))) == [None, 8]
+
+
+def test_decode_rejects_bad_cursor():
+    with pytest.raises(InvalidCursor):
+        Keyset(['-sales']).decode("not a cursor")
+    # 其它排序生成的游标
+    with pytest.raises(InvalidCursor):
+        Keyset(['-sales']).decode(Keyset(['price']).encode(goods(1, price=3)))
+
+
+@pytest.mark.parametrize("ordering", [['-sales'], ['sales'], ['-sales', 'price'], []])
+def test_after_matches_list_order(ordering):
+    # 逐条用 after() 过滤，结果应当正好是内存排序中该记录之后的所有记录（NULL 视为最小值）
+    keyset = Keyset(ordering)
+    ordered, _ = paginate_list(ROWS, ordering, per_page=len(ROWS))
+    for index, row in enumerate(ordered):
+        condition = keyset.after(keyset.decode(keyset.encode(row)))
+        assert [other.id for other in ordered if _match(condition, other)] == [other.id for other in ordered[index + 1:]]
+
+
+def test_paginate_list_sorts_nulls_first_ascending():
+    rows, _ = paginate_list(ROWS, ['-sales'], per_page=10)
+    assert [row.id for row in rows] == [4, 3, 1, 6, 5, 2]
+    rows, _ = paginate_list(ROWS, ['sales'], per_page=10)
+    assert [row.id for row in rows] == [2, 5, 6, 1, 3, 4]
+
+
+def test_paginate_list_pages():
+    seen = []
+    rows, cursor = paginate_list(ROWS, ['-sales'], per_page=4)
+    seen += [row.id for row in rows]
+    assert cursor is not None
+    rows, cursor = paginate_list(ROWS, ['-sales'], cursor=cursor, per_page=4)
+    seen += [row.id for row in rows]
+    assert cursor is None
+    assert seen == [4, 3, 1, 6, 5, 2]
+    # 页码模式与游标模式的顺序一致
+    rows, _ = paginate_list(ROWS, ['-sales'], page=1, per_page=4)
+    assert [row.id for row in rows] == [5, 2]
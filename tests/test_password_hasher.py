@@ -0,0 +1,43 @@
+# -*- coding: utf-8 -*-
+# @Time    : 2024/6/04 11:10
+# @Author  : KuangRen777
+# @File    : test_password_hasher.py
+# @Tags    : 密码哈希线程池
+import asyncio
+import threading
+
+from password_hasher import PasswordHasher
+
+
+class BlockingContext:
+    # 第一次调用阻塞到 release 被设置，用来占住唯一的工作线程
+    def __init__(self):
+        self.started = threading.Event()
+        self.release = threading.Event()
+
+    def hash(self, password):
+        self.started.set()
+        self.release.wait(5)
+        return f"hashed:{password}"
+
+
+def test_cancelled_before_start_leaves_queue():
+    async def scenario():
+        context = BlockingContext()
+        hasher = PasswordHasher(context, max_workers=1)
+        first = asyncio.create_task(hasher.hash("a"))
+        await asyncio.to_thread(context.started.wait, 5)
+        second = asyncio.create_task(hasher.hash("b"))
+        await asyncio.sleep(0)
+        assert hasher.stats()["queue_depth"] == 1
+
+        second.cancel()
+        await asyncio.gather(second, return_exceptions=True)
+        context.release.set()
+        assert await first == "hashed:a"
+        return hasher.stats()
+
+    stats = asyncio.run(scenario())
+    assert stats["queue_depth"] == 0
+    assert stats["running"] == 0
+    assert stats["completed"] == 1
@@ -0,0 +1,41 @@
+# -*- coding: utf-8 -*-
+# @Time    : 2024/6/03 10:10
+# @Author  : KuangRen777
+# @File    : test_popularity.py
+# @Tags    : 热门商品
+import math
+
+import pytest
+
+pytest.importorskip("tortoise")
+
+from popularity import popularity_score, rank_popular, PRIOR_COUNT
+
+
+def test_popularity_score():
+    expected = math.log1p(10) + (4.5 * 3 + 4.0 * PRIOR_COUNT) / (3 + PRIOR_COUNT)
+    assert popularity_score(10, 4.5, 3, 4.0) == pytest.approx(expected)
+
+
+def test_popularity_score_without_sales_or_comments():
+    # 没有销量、没有评价的商品只得到全站平均星级
+    assert popularity_score(None, 0, 0, 4.2) == pytest.approx(4.2)
+    assert popularity_score(-5, 0, 0, 4.2) == pytest.approx(4.2)
+
+
+def test_rank_popular():
+    goods_list = [
+        {'id': 1, 'sales': 0, 'star_avg': 0, 'comments_count': 0},
+        {'id': 2, 'sales': 100, 'star_avg': 4.0, 'comments_count': 10},
+        {'id': 3, 'sales': 100, 'star_avg': 5.0, 'comments_count': 10},
+        {'id': 4, 'sales': 5, 'star_avg': 5.0, 'comments_count': 1},
+    ]
+    ranked = rank_popular(goods_list, size=3)
+    assert list(ranked) == [3, 2, 4]
+    # 全站平均星级按评价数加权：(4*10 + 5*10 + 5*1) / 21
+    mean_star = 95 / 21
+    assert ranked[4] == pytest.approx(popularity_score(5, 5.0, 1, mean_star))
+
+
+def test_rank_popular_empty():
+    assert rank_popular([], size=10) == {}
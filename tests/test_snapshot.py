@@ -0,0 +1,48 @@
+# -*- coding: utf-8 -*-
+# @Time    : 2024/6/04 14:50
+# @Author  : KuangRen777
+# @File    : test_snapshot.py
+# @Tags    : 推荐数据快照
+import os
+
+import pytest
+
+np = pytest.importorskip("numpy")
+
+from snapshot import save_snapshot, load_snapshot, current_version, version_path, TMP_PREFIX
+
+
+def test_round_trip(tmp_path):
+    root = str(tmp_path)
+    version = save_snapshot(root, {"ids": np.arange(5), "scores": np.ones((2, 3), dtype=np.float32)},
+                            meta={"built_at": "2024-06-04"}, files={"model.bin": lambda f: f.write(b"abc")})
+    assert current_version(root) == version
+
+    loaded_version, arrays, meta = load_snapshot(root)
+    assert loaded_version == version
+    assert meta == {"built_at": "2024-06-04"}
+    assert list(arrays["ids"]) == [0, 1, 2, 3, 4]
+    assert arrays["scores"].dtype == np.float32 and arrays["scores"].shape == (2, 3)
+    # 内存映射的数组是只读的
+    assert not arrays["ids"].flags.writeable
+    with open(version_path(root, version, "model.bin"), 'rb') as f:
+        assert f.read() == b"abc"
+
+
+def test_missing_snapshot(tmp_path):
+    root = str(tmp_path)
+    assert load_snapshot(root) is None
+    save_snapshot(root, {"ids": np.arange(3)})
+    assert load_snapshot(root, version="no-such-version") is None
+
+
+def test_prune_keeps_latest_versions(tmp_path):
+    root = str(tmp_path)
+    # 写入中的临时目录不算作版本，不会被清理
+    os.makedirs(os.path.join(root, f"{TMP_PREFIX}writing"))
+    versions = [save_snapshot(root, {"ids": np.arange(i + 1)}, keep=2) for i in range(4)]
+
+    remaining = sorted(name for name in os.listdir(root) if os.path.isdir(os.path.join(root, name)))
+    assert remaining == sorted([f"{TMP_PREFIX}writing"] + versions[-2:])
+    assert current_version(root) == versions[-1]
+    assert list(load_snapshot(root)[1]["ids"]) == [0, 1, 2, 3]
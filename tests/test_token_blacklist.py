@@ -0,0 +1,22 @@
+# -*- coding: utf-8 -*-
+# @Time    : 2024/6/04 11:40
+# @Author  : KuangRen777
+# @File    : test_token_blacklist.py
+# @Tags    : JWT黑名单
+import pytest
+
+pytest.importorskip("jwt")
+pytest.importorskip("redis")
+
+from token_blacklist import BloomFilter, token_digest
+
+
+def test_bloom_counts_each_digest_once():
+    bloom = BloomFilter(1000)
+    digest = token_digest("token")
+    bloom.add(digest)
+    # pub/sub 广播回来的同一个摘要
+    bloom.add(digest)
+    assert digest in bloom
+    assert bloom.count == 1
+    assert token_digest("other") not in bloom
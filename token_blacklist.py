@@ -0,0 +1,172 @@
+# -*- coding: utf-8 -*-
+# @Time    : 2024/5/21 11:05
+# @Author  : KuangRen777
+# @File    : token_blacklist.py
+# @Tags    : JWT黑名单
+import asyncio
+import hashlib
+import math
+import time
+
+import jwt
+import redis.asyncio as aioredis
+
+BLACKLIST_INDEX_KEY = "token:blacklist:index"  # 有序集合：token 摘要 -> 过期时间戳
+BLACKLIST_CHANNEL = "token:blacklist"
+# 旧数据已补写到索引的标记；索引为空时 Redis 会删掉索引键，不能用索引是否存在来判断
+BLACKLIST_MIGRATED_KEY = "token:blacklist:migrated"
+
+
+def token_digest(token: str) -> str:
+    return hashlib.sha256(token.encode('utf-8')).hexdigest()
+
+
+class BloomFilter:
+    def __init__(self, capacity, error_rate=0.001):
+        self.size = max(8, int(math.ceil(-capacity * math.log(error_rate) / (math.log(2) ** 2))))
+        self.hash_count = max(1, int(round(self.size / capacity * math.log(2))))
+        self.bits = bytearray((self.size + 7) // 8)
+        self.count = 0
+
+    def _positions(self, digest: str):
+        # digest 本身就是 sha256，取两段做双重哈希即可
+        h1 = int(digest[:16], 16)
+        h2 = int(digest[16:32], 16) | 1
+        return [(h1 + i * h2) % self.size for i in range(self.hash_count)]
+
+    def add(self, digest: str):
+        # 已经存在的摘要不重复计数：本地 add 之后 pub/sub 还会把同一个摘要广播回来
+        added = False
+        for pos in self._positions(digest):
+            mask = 1 << (pos & 7)
+            if not self.bits[pos >> 3] & mask:
+                self.bits[pos >> 3] |= mask
+                added = True
+        if added:
+            self.count += 1
+
+    def __contains__(self, digest: str):
+        return all(self.bits[pos >> 3] & (1 << (pos & 7)) for pos in self._positions(digest))
+
+
+class TokenBlacklist:
+    """
+    JWT 黑名单。
+
+    黑名单仍以 token 为键存放在 Redis 中（过期时间与 token 一致），同时把 token 摘要写入索引有序集合并通过
+    pub/sub 广播。每个 worker 持有一个布隆过滤器：过滤器判定不存在的 token 直接放行，
+    只有可能命中时才查询 Redis，因此绝大多数请求不需要访问 Redis。
+    """
+
+    def __init__(self, redis_client, capacity=100000, error_rate=0.001, rebuild_interval=3600):
+        self.redis = redis_client
+        self.capacity = capacity
+        self.error_rate = error_rate
+        self.rebuild_interval = rebuild_interval
+        self.bloom = BloomFilter(capacity, error_rate)
+        self.redis_checks = 0
+        self._pubsub = None
+        self._task = None
+
+    async def _index_legacy_tokens(self):
+        # 兼容旧数据：索引出现之前写入的黑名单只有 token 键，补写到索引中；只需要执行一次
+        now = time.time()
+        async for token in self.redis.scan_iter(match="eyJ*"):
+            ttl = await self.redis.ttl(token)
+            if ttl > 0:
+                await self.redis.zadd(BLACKLIST_INDEX_KEY, {token_digest(token): now + ttl})
+        await self.redis.set(BLACKLIST_MIGRATED_KEY, 1)
+
+    async def load(self):
+        # 从索引重建布隆过滤器，同时清理已过期的条目
+        if not await self.redis.exists(BLACKLIST_MIGRATED_KEY):
+            await self._index_legacy_tokens()
+        await self.redis.zremrangebyscore(BLACKLIST_INDEX_KEY, '-inf', time.time())
+        digests = await self.redis.zrange(BLACKLIST_INDEX_KEY, 0, -1)
+
+        bloom = BloomFilter(max(self.capacity, len(digests) * 2), self.error_rate)
+        for digest in digests:
+            bloom.add(digest)
+        self.bloom = bloom
+
+    async def add(self, token: str):
+        # 解码JWT令牌以获取过期时间
+        payload = jwt.decode(token, options={"verify_signature": False})  # 关闭签名验证仅用于获取声明
+        exp = payload.get('exp')
+
+        # 计算令牌的剩余有效时间
+        ttl = exp - time.time()  # Time to live
+        if ttl <= 0:
+            return
+
+        digest = token_digest(token)
+        async with self.redis.pipeline(transaction=True) as pipe:
+            pipe.setex(token, int(ttl), 'blacklisted')
+            pipe.zadd(BLACKLIST_INDEX_KEY, {digest: exp})
+            pipe.publish(BLACKLIST_CHANNEL, digest)
+            await pipe.execute()
+        self.bloom.add(digest)
+
+    async def contains(self, token: str) -> bool:
+        if token_digest(token) not in self.bloom:
+            return False
+        self.redis_checks += 1
+        return bool(await self.redis.exists(token))
+
+    async def _subscribe(self):
+        self._pubsub = self.redis.pubsub()
+        await self._pubsub.subscribe(BLACKLIST_CHANNEL)
+
+    async def _close_pubsub(self):
+        if self._pubsub is not None:
+            # redis-py 5.0.1 之后 close() 更名为 aclose()
+            close = getattr(self._pubsub, 'aclose', None) or self._pubsub.close
+            await close()
+            self._pubsub = None
+
+    async def _listen(self):
+        next_rebuild = time.monotonic() + self.rebuild_interval
+        while True:
+            try:
+                message = await self._pubsub.get_message(ignore_subscribe_messages=True, timeout=1.0)
+                if message is not None:
+                    self.bloom.add(message['data'])
+                if time.monotonic() >= next_rebuild:
+                    await self.load()
+                    next_rebuild = time.monotonic() + self.rebuild_interval
+            except asyncio.CancelledError:
+                raise
+            except aioredis.RedisError as e:
+                # 断线期间可能漏掉广播，重新订阅后从索引完整重建一次
+                print(f"Error syncing token blacklist: {e}")
+                await asyncio.sleep(1)
+                try:
+                    await self._close_pubsub()
+                    await self._subscribe()
+                    await self.load()
+                except aioredis.RedisError:
+                    pass
+
+    async def start(self):
+        # 先订阅再加载，保证加载期间新增的 token 不会漏掉
+        await self._subscribe()
+        await self.load()
+        self._task = asyncio.create_task(self._listen())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        await self._close_pubsub()
+
+    def stats(self):
+        return {
+            "bloom_size_bits": self.bloom.size,
+            "bloom_hash_count": self.bloom.hash_count,
+            "bloom_items": self.bloom.count,
+            "redis_checks": self.redis_checks,
+        }
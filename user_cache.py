@@ -0,0 +1,54 @@
+# -*- coding: utf-8 -*-
+# @Time    : 2024/5/20 10:12
+# @Author  : KuangRen777
+# @File    : user_cache.py
+# @Tags    : 当前用户缓存
+import time
+from collections import OrderedDict
+
+
+class UserCache:
+    """
+    进程内的用户缓存（LRU + TTL），以 token 的 sub（即用户邮箱）为键。
+
+    每个 worker 各自持有一份，用户信息变更时需要调用 invalidate / invalidate_user 清除对应条目，
+    其它 worker 中的旧数据最多保留 ttl 秒。
+    """
+
+    def __init__(self, maxsize=1024, ttl=60):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data = OrderedDict()
+
+    def get(self, email):
+        item = self._data.get(email)
+        if item is None:
+            return None
+
+        user, expire_at = item
+        if expire_at < time.monotonic():
+            del self._data[email]
+            return None
+
+        self._data.move_to_end(email)
+        return user
+
+    def set(self, email, user):
+        self._data[email] = (user, time.monotonic() + self.ttl)
+        self._data.move_to_end(email)
+        while len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
+
+    def invalidate(self, email):
+        self._data.pop(email, None)
+
+    def invalidate_user(self, user_id):
+        # 按用户ID清除（管理员接口只知道ID），缓存容量有限，直接遍历即可
+        for email in [key for key, (user, _) in self._data.items() if user.id == user_id]:
+            del self._data[email]
+
+    def clear(self):
+        self._data.clear()
+
+    def __len__(self):
+        return len(self._data)
@@ -4,7 +4,9 @@
 # @File    : utils.py
 # @Tags    :
 from datetime import datetime, timedelta
+from fastapi import Depends, HTTPException
 from fastapi.security import OAuth2PasswordBearer
+import os
 import time
 import string
 import random
@@ -15,7 +17,7 @@ from models import *
 import jwt
 
 # redis
-import redis
+import redis.asyncio as aioredis
 
 # 阿里云OSS
 import oss2
@@ -31,6 +33,26 @@ from tortoise.contrib.pydantic import pydantic_model_creator
 from delivery_query import KuaiDi100
 
 from PASSWORD import *
+from settings import (USER_CACHE_MAXSIZE, USER_CACHE_TTL, PASSWORD_HASH_WORKERS, REDIS_HOST, REDIS_PORT, REDIS_DB,
+                      REDIS_MAX_CONNECTIONS, REDIS_POOL_TIMEOUT, TOKEN_BLACKLIST_CAPACITY, TOKEN_BLACKLIST_ERROR_RATE,
+                      TOKEN_BLACKLIST_REBUILD_INTERVAL, CATEGORY_TREE_CHECK_INTERVAL, SEARCH_MAX_RESULTS,
+                      RECOMMEND_TOP_N, COPURCHASE_TOP_K, COPURCHASE_REBUILD_INTERVAL, RECOMMEND_DATA_DIR,
+                      GOODS_SIMILARITY_TOP_K, GOODS_SIMILARITY_EXACT_LIMIT, GOODS_SIMILARITY_LSH_TABLES,
+                      GOODS_SIMILARITY_LSH_BITS, GOODS_SIMILARITY_CHECK_INTERVAL, GLOBAL_WEIGHTS_FLUSH_INTERVAL,
+                      GLOBAL_WEIGHTS_CACHE_TTL, POPULAR_SIZE, POPULAR_REFRESH_INTERVAL, POPULAR_LOCAL_TTL,
+                      GRAPH_REBUILD_INTERVAL, GRAPH_CHECK_INTERVAL)
+from user_cache import UserCache
+from password_hasher import PasswordHasher
+from token_blacklist import TokenBlacklist
+from category_tree import CategoryTreeCache, build_tree
+from goods_search import GoodsSearch
+from recommend_events import RecommendEvents
+from recommend_store import RecommendStore
+from redis_weight import RedisWeightsManager, GlobalWeightsAccumulator
+from copurchase import CoPurchaseEngine
+from goods_similarity import GoodsSimilarity
+from popularity import PopularityRanking
+from graph_engine import GraphEngine
 
 # Create Pydantic models from Tortoise models
 CartPydantic = pydantic_model_creator(Cart, name="Cart")
@@ -41,19 +63,102 @@ OrderDetailPydantic = pydantic_model_creator(OrderDetails, name="OrderDetail")
 UserPydantic = pydantic_model_creator(Users, name="User")
 
 
-# 配置Redis连接
-redis_client = redis.Redis(host='localhost', port=6379, db=0, decode_responses=True)  # decode_responses确保返回的数据是字符串
+# 配置Redis连接（异步客户端 + 共享连接池），所有接口共用
+redis_pool = aioredis.BlockingConnectionPool(
+    host=REDIS_HOST,
+    port=REDIS_PORT,
+    db=REDIS_DB,
+    max_connections=REDIS_MAX_CONNECTIONS,
+    timeout=REDIS_POOL_TIMEOUT,
+    decode_responses=True  # decode_responses确保返回的数据是字符串
+)
+redis_client = aioredis.Redis(connection_pool=redis_pool)
+
+# JWT 黑名单，布隆过滤器判定不存在时无需访问 Redis
+token_blacklist = TokenBlacklist(redis_client, capacity=TOKEN_BLACKLIST_CAPACITY,
+                                 error_rate=TOKEN_BLACKLIST_ERROR_RATE,
+                                 rebuild_interval=TOKEN_BLACKLIST_REBUILD_INTERVAL)
 
 # 密码加密配置
 pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+# bcrypt 计算放到线程池中执行，接口里统一使用 password_hasher
+password_hasher = PasswordHasher(pwd_context, max_workers=PASSWORD_HASH_WORKERS)
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="/api/auth/login")
 
+# 当前用户缓存，避免每个请求都查一次 Users 表
+user_cache = UserCache(maxsize=USER_CACHE_MAXSIZE, ttl=USER_CACHE_TTL)
+
+# 菜单分类树快照，分类变更时由后台接口 bump 版本号
+category_tree = CategoryTreeCache(redis_client, group='menu', check_interval=CATEGORY_TREE_CHECK_INTERVAL)
+
+# 商品搜索倒排索引，后台新增/修改商品时更新
+goods_search = GoodsSearch(redis_client, max_results=SEARCH_MAX_RESULTS)
+
+# 推荐：接口只写入行为事件、读取预先计算好的推荐结果，Neo4j 查询由后台消费者完成
+recommend_events = RecommendEvents(redis_client)
+recommend_store = RecommendStore(redis_client)
+
+# 策略权重：全局权重的调整在本进程累积后定期合并，读取走短期缓存
+global_weights = GlobalWeightsAccumulator(RedisWeightsManager(redis_client), flush_interval=GLOBAL_WEIGHTS_FLUSH_INTERVAL,
+                                          cache_ttl=GLOBAL_WEIGHTS_CACHE_TTL)
+weights_manager = RedisWeightsManager(redis_client, global_weights=global_weights)
+
+# 热门商品排行，没有推荐结果的用户使用
+popularity = PopularityRanking(redis_client, size=POPULAR_SIZE, refresh_interval=POPULAR_REFRESH_INTERVAL,
+                               local_ttl=POPULAR_LOCAL_TTL)
+
+# 进程内推荐图，RECOMMEND_BACKEND = 'native' 时在启动时映射 RECOMMEND_DATA_DIR/graph 中的快照
+graph_engine = GraphEngine(os.path.join(RECOMMEND_DATA_DIR, 'graph'), rebuild_interval=GRAPH_REBUILD_INTERVAL,
+                           check_interval=GRAPH_CHECK_INTERVAL)
+
+# 共同购买引擎（由订单数据构建），下单后增量更新
+copurchase_engine = CoPurchaseEngine(top_k=COPURCHASE_TOP_K, rebuild_interval=COPURCHASE_REBUILD_INTERVAL)
+
+# 商品间相似度（猜你喜欢），邻居列表以快照保存在 RECOMMEND_DATA_DIR/goods_similarity
+goods_similarity = GoodsSimilarity(RECOMMEND_DATA_DIR, top_k=GOODS_SIMILARITY_TOP_K,
+                                   exact_limit=GOODS_SIMILARITY_EXACT_LIMIT, lsh_tables=GOODS_SIMILARITY_LSH_TABLES,
+                                   lsh_bits=GOODS_SIMILARITY_LSH_BITS, check_interval=GOODS_SIMILARITY_CHECK_INTERVAL)
+
 if USE_OSS:
     # Initialize OSS
     auth = oss2.Auth(ACCESS_KEY_ID, ACCESS_KEY_SECRET)
     bucket = oss2.Bucket(auth, ENDPOINT, BUCKET_NAME)
 
 
+async def get_current_user(token: str = Depends(oauth2_scheme)) -> Users:
+    # 解析 token 并通过缓存获取当前用户，供各路由以 Depends(get_current_user) 使用
+    try:
+        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
+        user_email = payload.get("sub")
+    except jwt.PyJWTError:
+        raise HTTPException(status_code=401, detail="Invalid token")
+    if not user_email:
+        raise HTTPException(status_code=401, detail="Invalid token")
+    if await token_blacklist.contains(token):
+        raise HTTPException(status_code=401, detail="Token is blacklisted")
+
+    user = user_cache.get(user_email)
+    if user is None:
+        user = await Users.get_or_none(email=user_email)
+        if not user:
+            raise HTTPException(status_code=404, detail="User not found")
+        user_cache.set(user_email, user)
+
+    return user
+
+
+async def recommended_goods_ids(user_id):
+    # 预先计算好的推荐结果（一次 ZREVRANGE）；还没有结果的用户先用热门商品，并交给下次批处理计算
+    goods_ids = await recommend_store.get(user_id, limit=RECOMMEND_TOP_N)
+    if not goods_ids:
+        await recommend_store.mark_dirty(user_id)
+        goods_ids = await popularity.get(RECOMMEND_TOP_N)
+    if not goods_ids:
+        # 热门排行还没有算出来时，先用后台推荐的商品
+        goods_ids = await Goods.filter(is_recommend=1, is_on=1).limit(RECOMMEND_TOP_N).values_list('id', flat=True)
+    return goods_ids
+
+
 def get_current_time_str():
     return datetime.now().strftime("%Y%m%d%H%M%S%f")
 
@@ -83,9 +188,16 @@ def generate_verification_code(length=6):
     return ''.join(secrets.choice('0123456789') for i in range(length))
 
 
-def save_verification_code(email, code):
-    # 保存验证码到Redis，有效期为600秒（10分钟）
-    redis_client.setex(f"email_code:{email}", 600, code)
+VERIFICATION_CODE_TTL = 600  # 验证码有效期（秒），10分钟
+
+
+def verification_code_key(email):
+    return f"email_code:{email}"
+
+
+async def save_verification_code(email, code):
+    # 保存验证码到Redis
+    await redis_client.setex(verification_code_key(email), VERIFICATION_CODE_TTL, code)
 
 
 def create_access_token(data: dict, expires_delta: timedelta = None):
@@ -99,19 +211,10 @@ def create_access_token(data: dict, expires_delta: timedelta = None):
     return encoded_jwt
 
 
-def add_token_to_blacklist(token: str) -> bool:
+async def add_token_to_blacklist(token: str) -> bool:
     try:
-        # 解码JWT令牌以获取过期时间
-        payload = jwt.decode(token, options={"verify_signature": False})  # 关闭签名验证仅用于获取声明
-        exp = payload.get('exp')
-
-        # 计算令牌的剩余有效时间
-        current_time = time.time()
-        ttl = exp - current_time  # Time to live
-
-        if ttl > 0:
-            # 将令牌添加到Redis黑名单
-            redis_client.setex(token, int(ttl), 'blacklisted')
+        # 写入Redis黑名单并广播给其它 worker 的布隆过滤器
+        await token_blacklist.add(token)
         return True
     except Exception as e:
         print(f"Error adding token to blacklist: {e}")
@@ -133,23 +236,3 @@ def transfer_time_datetime(input_time_datetime):
     output_time_str = input_time_datetime.strftime("%Y-%m-%d %H:%M:%S")
 
     return output_time_str
-
-
-def build_tree(elements, parent_id=0):
-    branch = []
-    for element in elements:
-        if element.pid == parent_id:
-            children = build_tree(elements, element.id)
-            node = {
-                'id': element.id,
-                'pid': element.pid,
-                'name': element.name,
-                'level': element.level,
-                'status': element.status,
-                'seq': 1
-            }
-            if children:  # 只有当有子分类时才添加 `children` 字段
-                node['children'] = children
-            branch.append(node)
-    return branch
-